@@ -3,6 +3,26 @@ ASGI config for backendWeb project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Supported setups:
+
+    # sync (WSGI): one request per worker thread
+    gunicorn backendWeb.wsgi -w 4 --threads 8
+
+    # async (ASGI): serves /api/async/* without tying up a thread per request
+    DB_CONN_MAX_AGE=0 uvicorn backendWeb.asgi:application --workers 4
+    DB_CONN_MAX_AGE=0 gunicorn backendWeb.asgi:application -w 4 -k uvicorn.workers.UvicornWorker
+
+Persistent connections do not work under ASGI (each request may land on a
+different thread), so run with DB_CONN_MAX_AGE=0, or with DB_ENGINE=postgres
+DB_POOL=1 to reuse connections through the pool. The synchronous DRF views
+keep working under ASGI but each one still occupies a thread while it runs.
+Compare the two setups with `manage.py loadtest`.
+
+The live slot feed (/api/doctor/<id>/slots/events/) fans out in process,
+so it only sees bookings made by the same worker: serve it with --workers 1
+or route the booking endpoints and the feed to the same process. It needs
+ASGI; the WSGI setup answers it with 501.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'makeAccount.metrics.MetricsMiddleware',
+    'makeAccount.compression.CompressionMiddleware',
      'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -76,12 +79,63 @@ WSGI_APPLICATION = 'backendWeb.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=postgres switches to PostgreSQL configured from DB_NAME, DB_USER,
+# DB_PASSWORD, DB_HOST and DB_PORT. DB_POOL=1 uses psycopg's connection pool
+# (min/max from DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE) instead of persistent
+# per-thread connections kept for DB_CONN_MAX_AGE seconds.
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgres':
+    DB_POOL = os.environ.get('DB_POOL', '') in ('1', 'true', 'yes')
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'clinic'),
+            'USER': os.environ.get('DB_USER', 'postgres'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', '127.0.0.1'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            # Pooled connections are returned to the pool after each request
+            'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+                    'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '20')),
+                },
+            } if DB_POOL else {},
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # Run on every new connection: WAL lets readers proceed during
+                # writes, NORMAL sync is safe under WAL, and a 64 MB page
+                # cache plus 256 MB mmap keep hot indexes in memory.
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA cache_size=-65536;'
+                    'PRAGMA mmap_size=268435456;'
+                    'PRAGMA temp_store=MEMORY;'
+                ),
+                # Seconds a writer waits for the lock before "database is locked"
+                'timeout': 20,
+                # Take the write lock at BEGIN so read-then-write transactions
+                # queue on the busy timeout instead of failing to upgrade
+                'transaction_mode': 'IMMEDIATE',
+            },
+            # File-backed so tests that use several connections get real SQLite
+            # locking instead of shared-cache "table is locked" errors.
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        }
     }
-}
 
 
 # Password validation
@@ -122,3 +176,115 @@ STATIC_URL = 'static/'
 AUTH_USER_MODEL = 'makeAccount.User'
 CORS_ALLOW_ALL_ORIGINS = True
 
+# Caches
+# RESPONSE_CACHE_BACKEND selects where cached API responses live: 'locmem'
+# (per process, default), 'file' (shared by processes on one host) or
+# 'redis' (any Redis-protocol server at RESPONSE_CACHE_LOCATION).
+
+RESPONSE_CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'responses'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / '.response_cache')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/1'),
+}
+_response_backend, _response_location = RESPONSE_CACHE_BACKENDS[os.environ.get('RESPONSE_CACHE_BACKEND', 'locmem')]
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': _response_backend,
+        'LOCATION': os.environ.get('RESPONSE_CACHE_LOCATION', _response_location),
+    },
+}
+RESPONSE_CACHE_ALIAS = 'responses'
+RESPONSE_CACHE_TIMEOUT = 60
+
+REST_FRAMEWORK = {
+    # Uses orjson when installed, DRF's JSON encoder otherwise
+    'DEFAULT_RENDERER_CLASSES': [
+        'makeAccount.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'makeAccount.authentication.SignedTokenAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+    ],
+}
+
+# Lifetimes in seconds of the signed tokens issued by LoginView
+TOKEN_ACCESS_LIFETIME = 15 * 60
+TOKEN_REFRESH_LIFETIME = 7 * 24 * 60 * 60
+# Cache alias through which logout rejects the session's outstanding access
+# tokens. The default LocMemCache is per process: with several worker
+# processes, point this at a shared backend (e.g. 'responses' with
+# RESPONSE_CACHE_BACKEND=redis), or a logged-out access token keeps working
+# in the other processes until TOKEN_ACCESS_LIFETIME runs out. Refresh
+# tokens are revoked in the database and are unaffected.
+TOKEN_REVOCATION_CACHE = os.environ.get('TOKEN_REVOCATION_CACHE', 'default')
+
+# Default and upper bound for ?page_size= on keyset-paginated list endpoints
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 500
+
+# Seconds to cache DoctorStatsView counters; 0 disables the cache. Entries are
+# invalidated on appointment changes, which only reaches other worker
+# processes when CACHES points at a shared backend.
+DOCTOR_STATS_CACHE_TIMEOUT = 300
+# Seconds to cache the per-category user totals of the admin user list;
+# 0 disables the cache. Invalidated like the doctor stats
+USER_COUNT_CACHE_TIMEOUT = 300
+
+
+# Request metrics (makeAccount.metrics, served at /api/metrics/). A request
+# running one SQL shape more than this many times is logged as a likely N+1.
+METRICS_N_PLUS_ONE_THRESHOLD = int(os.environ.get('METRICS_N_PLUS_ONE_THRESHOLD', '10'))
+# Add X-Query-Count / X-DB-Time-Ms to responses; keep off in production
+METRICS_RESPONSE_HEADERS = DEBUG or os.environ.get('METRICS_RESPONSE_HEADERS', '') in ('1', 'true', 'yes')
+
+# Responses smaller than this are sent uncompressed; larger ones are brotli
+# encoded when the client accepts it and the brotli package is installed,
+# gzip otherwise
+RESPONSE_COMPRESSION_MIN_SIZE = 1024
+RESPONSE_BROTLI_QUALITY = 5
+
+# Background tasks (makeAccount.tasks, run by `manage.py run_workers`). A
+# failed task is retried after TASK_RETRY_BACKOFF seconds, doubling per
+# attempt up to TASK_RETRY_BACKOFF_MAX. Running tasks not finished within
+# TASK_STALE_AFTER seconds are assumed lost with their worker and requeued.
+TASK_MAX_ATTEMPTS = 5
+TASK_RETRY_BACKOFF = 30
+TASK_RETRY_BACKOFF_MAX = 60 * 60
+TASK_STALE_AFTER = 10 * 60
+# Seconds before an appointment that its reminder is sent
+APPOINTMENT_REMINDER_LEAD = 24 * 60 * 60
+
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'clinic@localhost')
+
+# Live slot feed (makeAccount.slot_events): events kept per doctor for
+# Last-Event-ID replay, seconds between keep-alive comments, and the
+# reconnect delay suggested to clients in milliseconds
+SLOT_EVENTS_BUFFER = 256
+SLOT_EVENTS_HEARTBEAT = 15
+SLOT_EVENTS_RETRY_MS = 3000
+
+# Retention (makeAccount.retention, run daily by run_workers or by
+# `manage.py apply_retention`): open slots dated more than
+# RETENTION_OPEN_SLOT_DAYS ago are deleted; completed/cancelled appointments
+# dated more than RETENTION_APPOINTMENT_DAYS ago move to the archive tables
+RETENTION_OPEN_SLOT_DAYS = 0
+RETENTION_APPOINTMENT_DAYS = 365
+RETENTION_BATCH_SIZE = 1000
+# Batches of each kind one retention task runs before queueing a follow-up
+RETENTION_TASK_BATCHES = 50
+
+# Bulk user import (makeAccount.user_import, `manage.py import_users` or
+# POST admin/users/import/): uploads are kept under IMPORT_ROOT; rows are
+# committed IMPORT_CHUNK_SIZE at a time with passwords hashed by
+# IMPORT_WORKERS processes (0 means one per CPU). Only patient and doctor
+# rows are accepted, and uploads are capped at IMPORT_MAX_UPLOAD_SIZE bytes
+IMPORT_ROOT = Path(os.environ.get('IMPORT_ROOT', BASE_DIR / 'imports'))
+IMPORT_CHUNK_SIZE = 1000
+IMPORT_WORKERS = int(os.environ.get('IMPORT_WORKERS', '0'))
+IMPORT_MAX_UPLOAD_SIZE = int(os.environ.get('IMPORT_MAX_UPLOAD_SIZE', 20 * 1024 * 1024))
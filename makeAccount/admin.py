@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, Doctor, Patient, Appointment, Bill, MedicalRecord, Feedback, DoctorSlot
+from .models import User, Doctor, Patient, Appointment, Bill, MedicalRecord, Feedback, DoctorSlot, RevenueLedger, Task, ArchivedAppointment, ArchivedBill, ImportJob
 
 admin.site.register(User)
 admin.site.register(Doctor)
@@ -9,3 +9,8 @@ admin.site.register(Bill)
 admin.site.register(MedicalRecord)
 admin.site.register(Feedback)
 admin.site.register(DoctorSlot)
+admin.site.register(RevenueLedger)
+admin.site.register(Task)
+admin.site.register(ArchivedAppointment)
+admin.site.register(ArchivedBill)
+admin.site.register(ImportJob)
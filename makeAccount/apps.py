@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class MakeaccountConfig(AppConfig):
     name = 'makeAccount'
+
+    def ready(self):
+        from . import signals  # noqa: F401
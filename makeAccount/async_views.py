@@ -0,0 +1,131 @@
+"""
+Async versions of the hot read endpoints, mounted under /api/async/.
+
+Under an ASGI server (see backendWeb/asgi.py) these wait on the database
+through Django's async ORM instead of holding a worker thread per request.
+They are plain Django views because DRF's APIView is synchronous: query
+parameters are validated and querysets built by the same helpers, so
+responses (?fields=, ?expand= and ?include_archived= included) have the
+same JSON shape as their synchronous counterparts, but they skip DRF
+authentication and the response cache. Every relation a serializer touches
+must be select_related/prefetched, since a lazy query inside an async view
+raises SynchronousOnlyOperation.
+"""
+from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views import View
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import slot_events
+from .models import Appointment, ArchivedAppointment, Doctor, DoctorSlot
+from .pagination import AppointmentPagination
+from .serializers import AppointmentSerializer, BillSerializer, DoctorFilterSerializer, DoctorSerializer
+from .views import appointment_querysets, bill_querysets, doctor_queryset, merge_bills
+
+
+def json_response(data, status=200):
+    # DRF's encoder, so decimals and dates come out as they do from the sync views
+    return JsonResponse(data, status=status, safe=False, encoder=JSONEncoder)
+
+
+async def paginated_appointments(request, appointments, archived):
+    paginator = AppointmentPagination()
+    try:
+        querysets, sparse = appointment_querysets(request, appointments, archived)
+        page = await paginator.apaginate_querysets(querysets, request)
+    except ValidationError as e:
+        return json_response(e.detail, status=400)
+    except NotFound as e:
+        return json_response({"detail": e.detail}, status=404)
+    serializer = AppointmentSerializer(page, many=True, **sparse)
+    return json_response(paginator.get_paginated_data(serializer.data))
+
+
+class AsyncDoctorListView(View):
+    async def get(self, request):
+        filters = DoctorFilterSerializer(data=request.GET)
+        if not filters.is_valid():
+            return json_response(filters.errors, status=400)
+        try:
+            doctors, sparse = doctor_queryset(request, filters.validated_data)
+        except ValidationError as e:
+            return json_response(e.detail, status=400)
+        serializer = DoctorSerializer([d async for d in doctors], many=True, **sparse)
+        return json_response(serializer.data)
+
+
+async def find_doctor(doctor_id):
+    # doctor_id may be a user id or a doctor id; a user match wins
+    doctors = sorted(
+        [d async for d in Doctor.objects.filter(Q(user_id=doctor_id) | Q(id=doctor_id))],
+        key=lambda d: d.user_id != doctor_id
+    )
+    return doctors[0] if doctors else None
+
+
+class AsyncDoctorSlotsPublicView(View):
+    async def get(self, request, doctor_id):
+        doctor = await find_doctor(doctor_id)
+        if doctor is None:
+            return json_response({"error": "Doctor not found"}, status=404)
+
+        today = timezone.localdate()
+        slots = DoctorSlot.objects.filter(doctor=doctor, is_booked=False, date__gte=today).exclude(
+            date=today, time__lt=timezone.localtime().time()
+        ).order_by('date', 'time').values_list('date', 'time')
+        return json_response({
+            "slots": [{"date": str(date), "time": str(time)} async for date, time in slots],
+            "fee": doctor.fee,
+            "fee_amount": doctor.fee_amount,
+            "specialty": doctor.specialty
+        })
+
+
+class AsyncPatientAppointmentsView(View):
+    async def get(self, request, patient_id):
+        return await paginated_appointments(request, Appointment.objects.filter(patient_id=patient_id),
+                                            ArchivedAppointment.objects.filter(patient_id=patient_id))
+
+
+class AsyncDoctorAppointmentsView(View):
+    async def get(self, request, doctor_id):
+        return await paginated_appointments(request, Appointment.objects.filter(doctor_id=doctor_id),
+                                            ArchivedAppointment.objects.filter(doctor_id=doctor_id))
+
+
+class AsyncBillListView(View):
+    async def get(self, request):
+        try:
+            querysets, sparse = bill_querysets(request)
+        except ValidationError as e:
+            return json_response(e.detail, status=400)
+        found = merge_bills(querysets, [bill for bills in querysets async for bill in bills])
+        serializer = BillSerializer(found, many=True, **sparse)
+        return json_response(serializer.data)
+
+
+class SlotEventsView(View):
+    """
+    Server-sent events with a doctor's slot changes, for booking pages that
+    would otherwise poll the slot list: each message's data is
+    {"doctor_id", "date", "time", "change": "booked" | "released"}. ASGI
+    only: under WSGI Django drains an async stream to a list before sending
+    any of it, and this one never ends, so the request gets a 501 instead.
+    """
+
+    async def get(self, request, doctor_id):
+        if 'wsgi.input' in request.META:
+            return json_response({"error": "The slot event feed needs an ASGI server"}, status=501)
+        doctor = await find_doctor(doctor_id)
+        if doctor is None:
+            return json_response({"error": "Doctor not found"}, status=404)
+        last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+        response = StreamingHttpResponse(
+            slot_events.listen(doctor.id, last_event_id), content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        # Stops nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
@@ -0,0 +1,150 @@
+import datetime
+import uuid
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.core.exceptions import ObjectDoesNotExist
+from django.utils import timezone
+from django.utils.functional import cached_property
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+
+from .models import User, RevokedToken
+
+ACCESS_SALT = 'makeAccount.tokens.access'
+REFRESH_SALT = 'makeAccount.tokens.refresh'
+
+
+class TokenUser:
+    """
+    The user an access token was issued to, rebuilt from the token claims so
+    authenticating a request needs no database query. `.user` loads the
+    real User row for the rare view that needs more than the claims.
+    """
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
+    is_staff = False
+    is_superuser = False
+
+    def __init__(self, claims):
+        self.claims = claims
+        self.id = self.pk = claims['uid']
+        self.username = claims['name']
+        self.category = claims['role']
+        self.patient_id = claims.get('patient_id')
+        self.doctor_id = claims.get('doctor_id')
+        self.session_id = claims['sid']
+
+    @cached_property
+    def user(self):
+        return User.objects.get(pk=self.id)
+
+    def __str__(self):
+        return self.username
+
+
+def profile_ids(user):
+    try:
+        if user.category == 'patient':
+            return {'patient_id': user.patient_profile.id}
+        if user.category == 'doctor':
+            return {'doctor_id': user.doctor_profile.id}
+    except ObjectDoesNotExist:
+        pass
+    return {}
+
+
+def issue_tokens(user, session_id=None):
+    """Return a new access/refresh pair. Rotation keeps the session id so logout can revoke the whole chain."""
+    session_id = session_id or uuid.uuid4().hex
+    claims = {'uid': user.id, 'name': user.username, 'role': user.category, 'sid': session_id, **profile_ids(user)}
+    return {
+        'token': signing.dumps(claims, salt=ACCESS_SALT),
+        'refresh': signing.dumps({'uid': user.id, 'sid': session_id, 'jti': uuid.uuid4().hex}, salt=REFRESH_SALT),
+        'expires_in': settings.TOKEN_ACCESS_LIFETIME,
+    }
+
+
+def _revoked_key(session_id):
+    return f'revoked-session:{session_id}'
+
+
+def _revocations():
+    # Per process unless TOKEN_REVOCATION_CACHE names a shared backend
+    return caches[settings.TOKEN_REVOCATION_CACHE]
+
+
+def is_session_revoked(session_id):
+    return _revocations().get(_revoked_key(session_id)) is not None
+
+
+def _revoke(jti, lifetime):
+    """Record `jti` as revoked; False when it already was."""
+    now = timezone.now()
+    RevokedToken.objects.filter(expires_at__lt=now).delete()
+    _, created = RevokedToken.objects.get_or_create(
+        jti=jti, defaults={'expires_at': now + datetime.timedelta(seconds=lifetime)}
+    )
+    return created
+
+
+def load_refresh_token(token):
+    try:
+        payload = signing.loads(token, salt=REFRESH_SALT, max_age=settings.TOKEN_REFRESH_LIFETIME)
+    except signing.BadSignature:
+        raise exceptions.AuthenticationFailed('Invalid or expired refresh token.')
+    if RevokedToken.objects.filter(jti__in=[payload['jti'], payload['sid']]).exists():
+        raise exceptions.AuthenticationFailed('Refresh token has been revoked.')
+    return payload
+
+
+def refresh_tokens(token):
+    payload = load_refresh_token(token)
+    try:
+        user = User.objects.get(pk=payload['uid'], is_active=True)
+    except User.DoesNotExist:
+        raise exceptions.AuthenticationFailed('User inactive or deleted.')
+    # Each refresh token is single use. The unique jti insert decides between
+    # concurrent refreshes of one token, which can both pass the check above
+    if not _revoke(payload['jti'], settings.TOKEN_REFRESH_LIFETIME):
+        raise exceptions.AuthenticationFailed('Refresh token has been revoked.')
+    return issue_tokens(user, session_id=payload['sid'])
+
+
+def revoke_session(token):
+    """
+    Log out the session a refresh token belongs to. Refreshing is blocked
+    through the database; outstanding access tokens are rejected through the
+    cache until they would have expired anyway.
+    """
+    payload = load_refresh_token(token)
+    _revoke(payload['sid'], settings.TOKEN_REFRESH_LIFETIME)
+    _revocations().set(_revoked_key(payload['sid']), True, settings.TOKEN_ACCESS_LIFETIME)
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """
+    Accepts `Authorization: Bearer <token>` (or `Token <token>`) carrying an
+    access token from issue_tokens(). Verification is an HMAC check plus one
+    cache lookup for the revocation list.
+    """
+    keywords = (b'bearer', b'token')
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() not in self.keywords:
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed('Invalid token header.')
+        try:
+            claims = signing.loads(auth[1].decode(), salt=ACCESS_SALT, max_age=settings.TOKEN_ACCESS_LIFETIME)
+        except (signing.BadSignature, UnicodeError):
+            raise exceptions.AuthenticationFailed('Invalid or expired token.')
+        if is_session_revoked(claims['sid']):
+            raise exceptions.AuthenticationFailed('Token has been revoked.')
+        return TokenUser(claims), claims
+
+    def authenticate_header(self, request):
+        return 'Bearer'
@@ -0,0 +1,22 @@
+"""
+Version counters for invalidating cached values: a value is cached under a
+key that includes the current version, and bumping the version makes every
+such key unreachable at once.
+"""
+import time
+
+from django.core.cache import cache
+
+
+def current_version(key):
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        # add() so concurrent first readers agree on one version
+        cache.add(key, version, None)
+        version = cache.get(key, version)
+    return version
+
+
+def bump_version(key):
+    cache.set(key, time.time_ns(), None)
@@ -0,0 +1,45 @@
+import re
+
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is used without it
+    brotli = None
+
+ACCEPTS_BROTLI = re.compile(r'\bbr\b')
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Compresses responses of at least RESPONSE_COMPRESSION_MIN_SIZE bytes
+    with brotli when the client accepts it and the brotli package is
+    installed, otherwise with gzip. Streaming exports are gzipped
+    incrementally; server-sent event streams are passed through. Small
+    bodies are left alone: the saving would not pay for the CPU.
+    """
+
+    def process_response(self, request, response):
+        # Event streams must reach the client as each event is written
+        if response.get('Content-Type', '').startswith('text/event-stream'):
+            return response
+        if not response.streaming and len(response.content) < settings.RESPONSE_COMPRESSION_MIN_SIZE:
+            return response
+        if (brotli is None or response.streaming or response.has_header('Content-Encoding')
+                or not ACCEPTS_BROTLI.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        compressed = brotli.compress(response.content, quality=settings.RESPONSE_BROTLI_QUALITY)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = 'br'
+        # The body changed, so a strong ETag no longer applies
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,183 @@
+import csv
+import datetime
+import heapq
+import json
+from operator import itemgetter
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .models import Appointment, ArchivedAppointment, ArchivedBill, Bill, MedicalRecord
+from .views import include_archived
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """File-like object whose write() hands the line back to the csv writer's caller."""
+    def write(self, value):
+        return value
+
+
+def csv_rows(columns, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([
+            json.dumps(row[c], cls=DjangoJSONEncoder) if isinstance(row[c], (list, dict)) else row[c]
+            for c in columns
+        ])
+
+
+def ndjson_rows(rows):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+class ExportView(APIView):
+    """
+    Streams `model` rows as CSV (?format=csv, default) or NDJSON
+    (?format=ndjson) straight from a values() iterator, so memory stays flat
+    however many rows match. Filters:
+
+    ?start= / ?end=   inclusive YYYY-MM-DD range on `date_field`
+    ?since=<id>       only rows with a larger id
+    ?since=<iso datetime>,<id>  only rows after that (updated_at, id)
+                      position (models with updated_at); a bare datetime
+                      includes rows updated at exactly that time
+
+    For nightly incremental exports pass the last id, or the last row's
+    updated_at and id, of the previous export as `since`. updated_at is
+    stamped before its transaction commits, so a row can appear behind a
+    cursor taken while it was in flight: to catch those, start a few
+    minutes earlier than the last updated_at and drop ids already seen.
+    ?include_archived=1 merges in the rows of `archive_model` in the same
+    order.
+    """
+    model = None
+    archive_model = None
+    columns = {}
+    date_field = None
+    datetime_date_field = False
+    filename = None
+
+    def perform_content_negotiation(self, request, force=False):
+        # ?format= picks the export format here, not a DRF renderer
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request):
+        fmt = request.GET.get("format", "csv")
+        if fmt not in ("csv", "ndjson"):
+            return Response({"error": "format must be csv or ndjson"}, status=400)
+        tables = [self.model]
+        if self.archive_model and include_archived(request):
+            tables.append(self.archive_model)
+        fields = [c for c, lookup in self.columns.items() if c == lookup]
+        aliases = {c: F(lookup) for c, lookup in self.columns.items() if c != lookup}
+        streams = []
+        for model in tables:
+            try:
+                rows, ordering = self.filter(model.objects.all(), request.GET)
+            except ValueError as e:
+                return Response({"error": str(e)}, status=400)
+            streams.append(rows.order_by(*ordering).values(*fields, **aliases).iterator(chunk_size=EXPORT_CHUNK_SIZE))
+        rows = heapq.merge(*streams, key=itemgetter(*ordering)) if len(streams) > 1 else streams[0]
+        if fmt == "csv":
+            body, content_type = csv_rows(list(self.columns), rows), "text/csv"
+        else:
+            body, content_type = ndjson_rows(rows), "application/x-ndjson"
+        response = StreamingHttpResponse(body, content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="{self.filename}.{fmt}"'
+        return response
+
+    def filter(self, rows, params):
+        for param, lookup in (("start", "gte"), ("end", "lte")):
+            value = params.get(param)
+            if not value:
+                continue
+            day = parse_date(value)
+            if day is None:
+                raise ValueError(f"{param} must be a YYYY-MM-DD date")
+            if self.datetime_date_field:
+                # Compare against day boundaries so the created_at index is usable
+                if lookup == "lte":
+                    day, lookup = day + datetime.timedelta(days=1), "lt"
+                day = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+            rows = rows.filter(**{f"{self.date_field}__{lookup}": day})
+
+        since = params.get("since")
+        if not since:
+            return rows, ("id",)
+        if since.isdigit():
+            return rows.filter(id__gt=int(since)), ("id",)
+        if not hasattr(self.model, "updated_at"):
+            raise ValueError("since must be a row id")
+        stamp, _, last_id = since.partition(",")
+        updated = parse_datetime(stamp)
+        if updated is None or (last_id and not last_id.isdigit()):
+            raise ValueError("since must be a row id or an ISO datetime, optionally followed by ,<id>")
+        if timezone.is_naive(updated):
+            updated = timezone.make_aware(updated)
+        # Keyset on (updated_at, id): rows sharing the last timestamp are not skipped
+        after = Q(updated_at__gt=updated) | Q(updated_at=updated, id__gt=int(last_id or 0))
+        return rows.filter(after), ("updated_at", "id")
+
+
+class AppointmentExportView(ExportView):
+    model = Appointment
+    archive_model = ArchivedAppointment
+    date_field = "date"
+    filename = "appointments"
+    columns = {
+        "id": "id",
+        "patient_id": "patient_id",
+        "doctor_id": "doctor_id",
+        "doctor_name": "doctor__user__username",
+        "date": "date",
+        "time": "time",
+        "reason": "reason",
+        "status": "status",
+        "created_at": "created_at",
+        "updated_at": "updated_at",
+    }
+
+
+class BillExportView(ExportView):
+    model = Bill
+    archive_model = ArchivedBill
+    date_field = "created_at"
+    datetime_date_field = True
+    filename = "bills"
+    columns = {
+        "id": "id",
+        "appointment_id": "appointment_id",
+        "patient_id": "appointment__patient_id",
+        "doctor_id": "appointment__doctor_id",
+        "appointment_date": "appointment__date",
+        "amount": "amount",
+        "status": "status",
+        "created_at": "created_at",
+        "updated_at": "updated_at",
+    }
+
+
+class MedicalRecordExportView(ExportView):
+    model = MedicalRecord
+    date_field = "date"
+    filename = "medical_records"
+    columns = {
+        "id": "id",
+        "patient_id": "patient_id",
+        "doctor_id": "doctor_id",
+        "diagnosis": "diagnosis",
+        "prescription": "prescription",
+        "notes": "notes",
+        "tests": "tests",
+        "date": "date",
+    }
@@ -0,0 +1,141 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateField, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth
+from django.utils import timezone
+
+from .models import ArchivedBill, Bill, RevenueLedger
+
+COUNTERS = ('billed_amount', 'paid_amount', 'bill_count', 'paid_count')
+
+
+def bucket_starts(day):
+    return (('day', day), ('month', day.replace(day=1)))
+
+
+def _bump(doctor_id, day, **deltas):
+    for period, start in bucket_starts(day):
+        rows = RevenueLedger.objects.filter(doctor_id=doctor_id, period=period, period_start=start)
+        changes = {name: F(name) + value for name, value in deltas.items()}
+        if rows.update(**changes):
+            continue
+        try:
+            with transaction.atomic():
+                RevenueLedger.objects.create(doctor_id=doctor_id, period=period, period_start=start, **deltas)
+        except IntegrityError:
+            # Another request created the bucket between our UPDATE and INSERT
+            rows.update(**changes)
+
+
+def record_bill(bill, doctor_id):
+    deltas = {'billed_amount': bill.amount, 'bill_count': 1}
+    if bill.status == 'paid':
+        deltas.update(paid_amount=bill.amount, paid_count=1)
+    _bump(doctor_id, timezone.localdate(bill.created_at), **deltas)
+
+
+def record_payment(bill, doctor_id):
+    _bump(doctor_id, timezone.localdate(bill.created_at), paid_amount=bill.amount, paid_count=1)
+
+
+def remove_bill(bill, doctor_id):
+    """Take a deleted bill back out of its buckets, dropping buckets left without bills."""
+    deltas = {'billed_amount': -bill.amount, 'bill_count': -1}
+    if bill.status == 'paid':
+        deltas.update(paid_amount=-bill.amount, paid_count=-1)
+    for period, start in bucket_starts(timezone.localdate(bill.created_at)):
+        # No create here: when the bill goes with its doctor the buckets may be gone already
+        rows = RevenueLedger.objects.filter(doctor_id=doctor_id, period=period, period_start=start)
+        rows.update(**{name: F(name) + value for name, value in deltas.items()})
+        rows.filter(bill_count__lte=0).delete()
+
+
+def totals(doctor_id=None):
+    rows = RevenueLedger.objects.filter(period='month')
+    if doctor_id is not None:
+        rows = rows.filter(doctor_id=doctor_id)
+    zero = Decimal('0')
+    return rows.aggregate(
+        billed_amount=Coalesce(Sum('billed_amount'), zero),
+        paid_amount=Coalesce(Sum('paid_amount'), zero),
+        bill_count=Coalesce(Sum('bill_count'), 0),
+        paid_count=Coalesce(Sum('paid_count'), 0),
+    )
+
+
+def series(period, start=None, end=None, doctor_id=None):
+    rows = RevenueLedger.objects.filter(period=period)
+    if start:
+        rows = rows.filter(period_start__gte=start)
+    if end:
+        rows = rows.filter(period_start__lte=end)
+    if doctor_id is not None:
+        rows = rows.filter(doctor_id=doctor_id)
+    return list(
+        rows.values('period_start')
+        .annotate(**{name: Sum(name) for name in COUNTERS})
+        .order_by('period_start')
+    )
+
+
+def by_doctor():
+    return list(
+        RevenueLedger.objects.filter(period='month')
+        .values('doctor_id', doctor_name=F('doctor__user__username'))
+        .annotate(**{name: Sum(name) for name in COUNTERS})
+        .order_by('-paid_amount')
+    )
+
+
+def compute_from_bills():
+    """Aggregate the bill table and its archive into {(doctor_id, period, period_start): counters}."""
+    expected = {}
+    paid = Q(status='paid')
+    for model in (Bill, ArchivedBill):
+        for period, trunc in (('day', TruncDate('created_at')),
+                              ('month', TruncMonth('created_at', output_field=DateField()))):
+            rows = (
+                model.objects.annotate(period_start=trunc)
+                .values('appointment__doctor_id', 'period_start')
+                .annotate(
+                    billed_amount=Sum('amount'),
+                    paid_amount=Coalesce(Sum('amount', filter=paid), Decimal('0')),
+                    bill_count=Count('id'),
+                    paid_count=Count('id', filter=paid),
+                )
+                .order_by()
+            )
+            for row in rows:
+                key = (row['appointment__doctor_id'], period, row['period_start'])
+                counters = expected.setdefault(key, dict.fromkeys(COUNTERS, 0))
+                for name in COUNTERS:
+                    counters[name] += row[name]
+    return expected
+
+
+@transaction.atomic
+def rebuild():
+    RevenueLedger.objects.all().delete()
+    rows = [
+        RevenueLedger(doctor_id=doctor_id, period=period, period_start=start, **counters)
+        for (doctor_id, period, start), counters in compute_from_bills().items()
+    ]
+    RevenueLedger.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def verify():
+    """Return a list of (key, stored, expected) for every bucket that disagrees with the bills."""
+    expected = compute_from_bills()
+    stored = {
+        (row['doctor_id'], row['period'], row['period_start']): {name: row[name] for name in COUNTERS}
+        for row in RevenueLedger.objects.values('doctor_id', 'period', 'period_start', *COUNTERS)
+    }
+    mismatches = []
+    for key in expected.keys() | stored.keys():
+        want = expected.get(key)
+        have = stored.get(key)
+        if want is None or have is None or any(Decimal(want[n]) != Decimal(have[n]) for n in COUNTERS):
+            mismatches.append((key, have, want))
+    return mismatches
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from makeAccount import retention
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired open slots and move old completed/cancelled appointments "
+        "and their bills to the archive tables. Defaults come from the RETENTION_* "
+        "settings; run_workers also queues this once a day."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--open-slot-days', type=int, help="Keep open slots dated within this many days.")
+        parser.add_argument('--appointment-days', type=int, help="Keep appointments dated within this many days.")
+        parser.add_argument('--batch-size', type=int, help="Rows per transaction.")
+        parser.add_argument('--dry-run', action='store_true', help="Only count what would be purged or archived.")
+
+    def handle(self, *args, **options):
+        horizons = {'open_slot_days': options['open_slot_days'], 'appointment_days': options['appointment_days']}
+        if options['dry_run']:
+            counts = retention.pending(**horizons)
+            self.stdout.write(
+                f"Would delete {counts['slots']} slots and {counts['calendar_days']} calendar days "
+                f"and archive {counts['appointments']} appointments."
+            )
+            return
+        result = retention.apply(batch_size=options['batch_size'], **horizons)
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {result['slots']} slots and {result['calendar_days']} calendar days; "
+            f"archived {result['appointments']} appointments and {result['bills']} bills."
+        ))
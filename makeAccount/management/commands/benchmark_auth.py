@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory
+
+from makeAccount.authentication import SignedTokenAuthentication, issue_tokens
+from makeAccount.models import User
+
+
+class Command(BaseCommand):
+    help = "Measure per-request overhead of SignedTokenAuthentication in microseconds."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        # An unsaved user is enough: authenticating never reads the database
+        user = User(id=1, username='benchmark', category='admin')
+        token = issue_tokens(user)['token']
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        backend = SignedTokenAuthentication()
+
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter_ns()
+            backend.authenticate(request)
+            timings.append(time.perf_counter_ns() - start)
+        timings.sort()
+
+        def pct(p):
+            return timings[min(len(timings) - 1, int(len(timings) * p))] / 1000
+
+        self.stdout.write(
+            f"{iterations} authentications: "
+            f"mean {sum(timings) / len(timings) / 1000:.1f}us, "
+            f"p50 {pct(0.50):.1f}us, p95 {pct(0.95):.1f}us, p99 {pct(0.99):.1f}us"
+        )
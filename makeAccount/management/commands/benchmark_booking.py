@@ -0,0 +1,84 @@
+import datetime
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+
+from makeAccount.models import Doctor, DoctorSlot, Patient, User
+from makeAccount.services import SlotUnavailable, book_appointment
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure booking throughput against the configured database. Runs in a "
+        "throwaway test database, so compare configurations by running it under "
+        "different DB_* environment settings (e.g. the default SQLite file, then "
+        "DB_ENGINE=postgres against a local PostgreSQL, with and without DB_POOL=1)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--bookings', type=int, default=2000, help="Total slots to book.")
+        parser.add_argument('--contention', type=int, default=1,
+                            help="Threads competing for each slot; above 1 measures rejected double bookings too.")
+
+    def handle(self, *args, **options):
+        threads, total, contention = options['threads'], options['bookings'], options['contention']
+        creation = connection.creation
+        old_name = connection.settings_dict['NAME']
+        creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            result = self.run(threads, total, contention)
+        finally:
+            creation.destroy_test_db(old_name, verbosity=0)
+
+        vendor = connection.vendor
+        pooled = bool(connection.settings_dict.get('OPTIONS', {}).get('pool'))
+        self.stdout.write(
+            f"{vendor}{' (pooled)' if pooled else ''}: {result['booked']} booked, "
+            f"{result['rejected']} rejected, {result['errors']} errors in {result['seconds']:.2f}s "
+            f"with {threads} threads -> {result['booked'] / result['seconds']:.0f} bookings/s"
+        )
+
+    def run(self, threads, total, contention):
+        doctor_user = User.objects.create(username='bench-doctor', category='doctor')
+        doctor = Doctor.objects.create(user=doctor_user, specialty='General', fee='PKR 2000')
+        patient = User.objects.create(username='bench-patient', category='patient')
+        Patient.objects.create(user=patient, gender='Other', blood_group='O+')
+
+        start_day = datetime.date(2030, 1, 1)
+        times = [
+            (start_day + datetime.timedelta(days=i // 48), datetime.time((i % 48) // 2, (i % 2) * 30))
+            for i in range(total)
+        ]
+        DoctorSlot.objects.bulk_create(DoctorSlot(doctor=doctor, date=d, time=t) for d, t in times)
+        # Every slot appears `contention` times so that many threads race for it
+        work = [slot for slot in times for _ in range(contention)]
+        counts = {'booked': 0, 'rejected': 0, 'errors': 0}
+        lock = threading.Lock()
+        barrier = threading.Barrier(threads)
+
+        def worker(offset):
+            local = {'booked': 0, 'rejected': 0, 'errors': 0}
+            barrier.wait()
+            for date, slot_time in work[offset::threads]:
+                try:
+                    book_appointment(patient=patient, doctor=doctor, date=date, time=slot_time)
+                    local['booked'] += 1
+                except SlotUnavailable:
+                    local['rejected'] += 1
+                except Exception:
+                    local['errors'] += 1
+            connections.close_all()
+            with lock:
+                for key, value in local.items():
+                    counts[key] += value
+
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        started = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        return {**counts, 'seconds': time.perf_counter() - started}
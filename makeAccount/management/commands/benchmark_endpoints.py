@@ -0,0 +1,172 @@
+import datetime
+import json
+import logging
+import time
+from io import StringIO
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.conf import settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from makeAccount.management.commands.loadtest import percentile
+from makeAccount.metrics import QueryRecorder
+from makeAccount.models import Appointment, Bill, Doctor, DoctorSlot, Patient
+
+# Endpoints whose response grows with the whole table rather than a page of it
+FULL_LISTS = {'patient-list', 'doctor-slots', 'bill-list', 'async-bill-list',
+              'appointment-export', 'bill-export', 'medical-record-export'}
+
+
+def scale_counts(appointments):
+    """Seed sizes that keep the clinic's proportions at any number of appointments."""
+    return {
+        'appointments': appointments,
+        'doctors': max(5, appointments // 1000),
+        'patients': max(20, appointments // 20),
+        'open_slots': max(100, appointments // 10),
+        'records': appointments // 4,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database at each scale with seed_clinic and time every "
+        "API endpoint through the test client. Prints (or writes) JSON with p50/p95 "
+        "latency and query counts per endpoint, for diffing between releases."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', type=int, nargs='+', default=[1000, 100000, 1000000],
+                            help="Numbers of appointments to seed, one run each.")
+        parser.add_argument('--iterations', type=int, default=20, help="Requests per endpoint.")
+        parser.add_argument('--full-list-limit', type=int, default=100000,
+                            help="Skip unpaginated whole-table endpoints above this many appointments.")
+        parser.add_argument('--warm-cache', action='store_true',
+                            help="Keep the response and stats caches between requests instead of measuring cold.")
+        parser.add_argument('--output', help="Write the JSON here instead of stdout.")
+
+    def handle(self, *args, **options):
+        report = {
+            'generated_at': timezone.now().isoformat(),
+            'iterations': options['iterations'],
+            'warm_cache': options['warm_cache'],
+            'database': connection.vendor,
+            'scales': [],
+        }
+        # Lets the test client's "testserver" host through ALLOWED_HOSTS
+        setup_test_environment()
+        # N+1 warnings would drown the report; they are counted in it instead
+        logging.getLogger('makeAccount.metrics').setLevel(logging.ERROR)
+        try:
+            for appointments in options['scales']:
+                old_name = connection.settings_dict['NAME']
+                connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+                try:
+                    report['scales'].append(self.run_scale(appointments, options))
+                finally:
+                    connection.creation.destroy_test_db(old_name, verbosity=0)
+        finally:
+            teardown_test_environment()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def run_scale(self, appointments, options):
+        counts = scale_counts(appointments)
+        started = time.perf_counter()
+        call_command('seed_clinic', **counts, stdout=StringIO())
+        result = {**counts, 'seed_seconds': round(time.perf_counter() - started, 2), 'endpoints': {}}
+
+        doctor = Doctor.objects.order_by('id').first()
+        patient = Patient.objects.filter(user_id__in=Appointment.objects.values('patient_id')[:1]).get()
+        ids = {'doctor_id': doctor.id, 'user_id': patient.user_id, 'patient_id': patient.id,
+               'username': patient.user.username}
+        for name, method, url, body in self.endpoints(ids, options['iterations']):
+            if name in FULL_LISTS and appointments > options['full_list_limit']:
+                result['endpoints'][name] = {'skipped': 'whole-table response at this scale'}
+                continue
+            result['endpoints'][name] = self.measure(method, url, body, options)
+        return result
+
+    def endpoints(self, ids, iterations):
+        doctor_id, user_id, patient_id = ids['doctor_id'], ids['user_id'], ids['patient_id']
+        today = timezone.localdate()
+        week = f"?start={today}&end={today + datetime.timedelta(days=7)}"
+        reads = [
+            ('doctor-list', [], ''),
+            ('doctor-profile', [doctor_id], ''),
+            ('doctor-stats', [doctor_id], ''),
+            ('served-patients', [doctor_id], ''),
+            ('patient-list', [], ''),
+            ('appointment-list', [], ''),
+            ('doctor-slots', [], ''),
+            ('doctor-slots-public', [doctor_id], ''),
+            ('slot-search', [], '?limit=20'),
+            ('patient-appointments', [user_id], ''),
+            ('doctor-appointments', [doctor_id], ''),
+            ('bill-list', [], ''),
+            ('medical-record-list', [], f'?patient_id={patient_id}'),
+            ('admin-stats', [], ''),
+            ('admin-user-list', [], ''),
+            ('appointment-export', [], week),
+            ('bill-export', [], week),
+            ('medical-record-export', [], ''),
+            ('async-doctor-list', [], ''),
+            ('async-doctor-slots-public', [doctor_id], ''),
+            ('async-patient-appointments', [user_id], ''),
+            ('async-doctor-appointments', [doctor_id], ''),
+            ('async-bill-list', [], ''),
+        ]
+        for name, args, query in reads:
+            yield name, 'get', [reverse(name, args=args) + query] * iterations, None
+
+        # seed_clinic gives every user the password "password"
+        yield 'login', 'post', [reverse('login')] * iterations, [
+            {'username': ids['username'], 'password': 'password'}
+        ] * iterations
+        # Each booking needs a slot of its own, each payment an unpaid bill
+        slots = DoctorSlot.objects.filter(is_booked=False, date__gt=today).order_by('date', 'time')[:iterations]
+        yield 'appointment-create', 'post', [reverse('appointment-create')] * len(slots), [
+            {'patient': user_id, 'doctor': s.doctor_id, 'date': str(s.date), 'time': str(s.time)} for s in slots
+        ]
+        bills = Bill.objects.filter(status='unpaid').values_list('id', flat=True)[:iterations]
+        yield 'bill-pay', 'put', [reverse('bill-pay', args=[bill_id]) for bill_id in bills], None
+
+    def measure(self, method, urls, bodies, options):
+        client = Client()
+        latencies, queries, statuses, repeated = [], [], set(), 0
+        for i, url in enumerate(urls):
+            if not options['warm_cache']:
+                caches['default'].clear()
+                caches['responses'].clear()
+            recorder = QueryRecorder()
+            with connection.execute_wrapper(recorder):
+                started = time.perf_counter()
+                if bodies is None:
+                    response = getattr(client, method)(url)
+                else:
+                    response = getattr(client, method)(url, bodies[i], content_type='application/json')
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                latencies.append(1000 * (time.perf_counter() - started))
+            queries.append(recorder.count)
+            statuses.add(response.status_code)
+            repeated = max(repeated, max(recorder.shapes.values(), default=0))
+        latencies.sort()
+        return {
+            'status': sorted(statuses),
+            'p50_ms': round(percentile(latencies, 0.5), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'queries': max(queries, default=0),
+            'n_plus_one': repeated > settings.METRICS_N_PLUS_ONE_THRESHOLD,
+        }
@@ -0,0 +1,60 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from makeAccount import user_import
+from makeAccount.models import ImportJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Create users with their patient/doctor profiles from a CSV or NDJSON file "
+        "(SignupSerializer's fields, one user per row). Rows are committed a chunk at "
+        "a time; an interrupted import continues with --resume."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help="CSV (with a header row) or NDJSON file.")
+        parser.add_argument('--format', choices=('csv', 'ndjson'), help="Defaults to the file's extension.")
+        parser.add_argument('--resume', type=int, metavar='JOB_ID', help="Continue an earlier import.")
+        parser.add_argument('--workers', type=int, help="Password hashing processes (default IMPORT_WORKERS).")
+        parser.add_argument('--chunk-size', type=int, help="Rows per transaction (default IMPORT_CHUNK_SIZE).")
+        parser.add_argument('--errors', metavar='OUT', help="Write the rejected rows to this NDJSON file.")
+
+    def handle(self, *args, **options):
+        if options['resume']:
+            job = ImportJob.objects.filter(id=options['resume']).first()
+            if job is None:
+                raise CommandError(f"No import job {options['resume']}.")
+            if job.status == 'done':
+                raise CommandError(f"Import job {job.id} already finished.")
+        elif options['path']:
+            fmt = options['format'] or user_import.guess_format(options['path'])
+            if fmt is None:
+                raise CommandError("Cannot tell the format from the file name; pass --format.")
+            job = ImportJob.objects.create(source=options['path'], format=fmt)
+        else:
+            raise CommandError("Give a file to import or --resume JOB_ID.")
+
+        def progress(job):
+            self.stdout.write(f"{job.rows_done} rows: {job.created_count} created, {job.failed_count} rejected")
+
+        try:
+            job = user_import.run(job, workers=options['workers'], chunk_size=options['chunk_size'],
+                                  on_chunk=progress)
+        except user_import.JobBusy as e:
+            raise CommandError(f"{e}; a job that another run stopped advancing can be resumed after "
+                               f"TASK_STALE_AFTER seconds.")
+        except KeyboardInterrupt:
+            raise CommandError(f"Interrupted; continue with --resume {job.id}.")
+        except OSError as e:
+            raise CommandError(f"Import job {job.id} failed: {e}")
+
+        if options['errors']:
+            with open(options['errors'], 'w') as f:
+                for error in job.row_errors.order_by('row', 'id'):
+                    f.write(json.dumps({'row': error.row, 'username': error.username, 'errors': error.errors}) + '\n')
+        self.stdout.write(self.style.SUCCESS(
+            f"Import job {job.id}: {job.rows_done} rows, {job.created_count} users created, "
+            f"{job.failed_count} rows rejected."
+        ))
@@ -0,0 +1,90 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+async def fetch(host, port, request, timeout):
+    """One GET over a fresh connection; returns the HTTP status code."""
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        writer.write(request)
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        await asyncio.wait_for(reader.read(), timeout)
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+async def run_target(url, concurrency, total, timeout):
+    parts = urlsplit(url)
+    if parts.scheme != 'http' or not parts.hostname:
+        raise CommandError(f"Only plain http:// URLs are supported: {url}")
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    request = (
+        f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\n"
+        "Accept: application/json\r\nConnection: close\r\n\r\n"
+    ).encode()
+
+    latencies, errors = [], 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                code = await fetch(parts.hostname, parts.port or 80, request, timeout)
+            except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+                code = None
+            if code == 200:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return sorted(latencies), errors, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire concurrent GETs at one or more running servers and report latency "
+        "percentiles, e.g. to compare the WSGI and ASGI setups described in "
+        "backendWeb/asgi.py:\n"
+        "  manage.py loadtest wsgi=http://127.0.0.1:8000/api/doctors/ "
+        "asgi=http://127.0.0.1:8001/api/async/doctors/ --concurrency 500"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='+', help="URL or name=URL; every target gets the same load.")
+        parser.add_argument('--concurrency', type=int, default=200, help="Requests in flight at once.")
+        parser.add_argument('--requests', type=int, default=5000, help="Requests per target.")
+        parser.add_argument('--timeout', type=float, default=30.0, help="Seconds before a request counts as failed.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'target':<12} {'ok':>7} {'errors':>7} {'req/s':>8} "
+                          f"{'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        for target in options['targets']:
+            name, sep, url = target.partition('=')
+            if not sep or '://' in name:
+                name, url = '', target
+            latencies, errors, seconds = asyncio.run(
+                run_target(url, options['concurrency'], options['requests'], options['timeout'])
+            )
+            ms = [1000 * value for value in latencies]
+            self.stdout.write(
+                f"{(name or url)[:12]:<12} {len(ms):>7} {errors:>7} {len(ms) / seconds:>8.0f} "
+                f"{percentile(ms, 0.5):>8.1f} {percentile(ms, 0.9):>8.1f} {percentile(ms, 0.99):>8.1f} "
+                f"{(ms[-1] if ms else 0):>8.1f}"
+            )
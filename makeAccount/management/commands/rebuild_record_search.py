@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from makeAccount import search
+from makeAccount.models import MedicalRecord
+
+
+class Command(BaseCommand):
+    help = "Recreate the medical record full-text index (and its SQLite triggers) and re-index every record."
+
+    def handle(self, *args, **options):
+        search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Re-indexed {MedicalRecord.objects.count()} medical records."))
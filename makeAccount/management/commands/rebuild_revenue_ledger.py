@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from makeAccount import ledger
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-doctor daily/monthly revenue ledger from the bill table and verify it."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify-only', action='store_true',
+            help="Compare the stored ledger with the bills without rewriting it.",
+        )
+
+    def handle(self, *args, **options):
+        if not options['verify_only']:
+            count = ledger.rebuild()
+            self.stdout.write(f"Rebuilt {count} ledger buckets.")
+
+        mismatches = ledger.verify()
+        for key, stored, expected in mismatches[:20]:
+            self.stderr.write(f"{key}: stored={stored} expected={expected}")
+        if mismatches:
+            raise CommandError(f"{len(mismatches)} ledger buckets disagree with the bill table.")
+        self.stdout.write(self.style.SUCCESS("Revenue ledger matches the bill table."))
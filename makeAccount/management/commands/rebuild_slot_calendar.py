@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+
+from makeAccount import slot_calendar
+from makeAccount.models import Doctor, DoctorSlot, SlotCalendar
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-doctor daily slot calendar from the DoctorSlot table."
+
+    def handle(self, *args, **options):
+        bounds = DoctorSlot.objects.aggregate(start=Min('date'), end=Max('date'))
+        doctor_ids = list(Doctor.objects.values_list('id', flat=True))
+        SlotCalendar.objects.all().delete()
+        if bounds['start'] is None:
+            self.stdout.write("No slots to summarise.")
+            return
+        for doctor_id in doctor_ids:
+            slot_calendar.refresh([doctor_id], bounds['start'], bounds['end'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt slot calendar for {len(doctor_ids)} doctors."))
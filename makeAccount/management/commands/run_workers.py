@@ -0,0 +1,66 @@
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.utils import timezone
+
+from makeAccount import tasks
+
+PRUNE_EVERY = 60 * 60
+
+
+def run_in_thread(claimed):
+    # Pool threads keep their own connection; treat each task like a request
+    close_old_connections()
+    try:
+        return tasks.run(claimed)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background tasks (bills, reminders, daily retention) in a thread "
+        "pool until interrupted. Any number of these processes can share the queue."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help="Tasks run at once.")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds to sleep when no task is due.")
+        parser.add_argument('--keep-days', type=int, default=7, help="Delete done tasks older than this.")
+        parser.add_argument('--once', action='store_true', help="Exit once no task is due instead of polling.")
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        if threads < 1:
+            raise CommandError("--threads must be at least 1.")
+        ok = failed = 0
+        pruned_at = None
+        executor = ThreadPoolExecutor(threads, thread_name_prefix='task') if threads > 1 else None
+        try:
+            while True:
+                if pruned_at is None or time.monotonic() - pruned_at > PRUNE_EVERY:
+                    tasks.prune(timezone.now() - datetime.timedelta(days=options['keep_days']))
+                    # Once a day, however many workers are running
+                    tasks.enqueue('retention.apply', key=f'retention:{timezone.localdate()}')
+                    pruned_at = time.monotonic()
+                tasks.requeue_stale()
+                batch = tasks.claim(threads)
+                if not batch:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                # A single thread needs no pool, and keeps the caller's connection and transaction
+                results = list(executor.map(run_in_thread, batch)) if executor else [tasks.run(t) for t in batch]
+                ok += results.count(True)
+                failed += results.count(False)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if executor:
+                executor.shutdown(wait=True)
+        self.stdout.write(self.style.SUCCESS(f"Ran {ok + failed} tasks: {ok} succeeded, {failed} failed."))
@@ -0,0 +1,155 @@
+import datetime
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from makeAccount import ledger, response_cache, slot_calendar
+from makeAccount.models import Appointment, Bill, Doctor, DoctorSlot, MedicalRecord, Patient, User, parse_fee
+from makeAccount.stats import invalidate_doctor_stats
+
+SPECIALTIES = ['General', 'Cardiology', 'Dermatology', 'Pediatrics', 'Orthopedics', 'Neurology', 'ENT', 'Gynecology']
+FEES = ['PKR 1500', 'PKR 2000', 'PKR 2500', 'PKR 3000', 'PKR 4000', 'PKR 5000']
+BLOOD_GROUPS = ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']
+DIAGNOSES = ['Hypertension', 'Type 2 diabetes', 'Seasonal allergy', 'Migraine', 'Asthma', 'Back pain', 'Gastritis']
+PRESCRIPTIONS = ['Paracetamol 500mg', 'Amlodipine 5mg', 'Metformin 500mg', 'Cetirizine 10mg', 'Omeprazole 20mg']
+TESTS = ['CBC', 'Lipid profile', 'HbA1c', 'X-ray', 'ECG', 'Urinalysis']
+REASONS = ['Checkup', 'Follow-up', 'Fever', 'Consultation', 'Lab results', '']
+
+SLOTS_PER_DAY = 16          # 09:00-16:30 every half hour
+PAST_SHARE = 0.8            # share of each doctor's appointments that lie in the past
+
+
+def slot_at(start, index):
+    minutes = 9 * 60 + 30 * (index % SLOTS_PER_DAY)
+    return start + datetime.timedelta(days=index // SLOTS_PER_DAY), datetime.time(minutes // 60, minutes % 60)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic clinic: doctors with schedules, patients, appointments on "
+        "booked slots with their bills, extra open slots and medical records. "
+        "Derived tables (revenue ledger, slot calendar) are rebuilt afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=50)
+        parser.add_argument('--patients', type=int, default=1000)
+        parser.add_argument('--appointments', type=int, default=10000)
+        parser.add_argument('--open-slots', type=int, default=2000, help="Unbooked future slots on top of the booked ones.")
+        parser.add_argument('--records', type=int, default=2500, help="Medical records.")
+        parser.add_argument('--paid-share', type=float, default=0.8, help="Share of completed appointments whose bill is paid.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='seed', help="Username prefix; must not be in use yet.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed, for reproducible data.")
+
+    def handle(self, *args, **options):
+        if options['doctors'] < 1 or options['patients'] < 1:
+            raise CommandError("Need at least one doctor and one patient.")
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}-').exists():
+            raise CommandError(f"Users named '{prefix}-*' already exist; pass another --prefix.")
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+
+        with transaction.atomic():
+            doctors = self.create_doctors(prefix, options['doctors'])
+            patients = self.create_patients(prefix, options['patients'])
+            last_day = self.create_appointments(doctors, patients, options['appointments'], options['paid_share'])
+            last_day = max(last_day, self.create_open_slots(doctors, options['appointments'], options['open_slots']))
+            self.create_records(doctors, patients, options['records'])
+
+        # Bulk inserts bypass the services and signals that keep derived data current
+        doctor_ids = [d.id for d in doctors]
+        ledger.rebuild()
+        slot_calendar.refresh(doctor_ids, self.start_day, last_day)
+        response_cache.invalidate("doctors", "patients")
+        for doctor_id in doctor_ids:
+            invalidate_doctor_stats(doctor_id)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(doctors)} doctors, {len(patients)} patients, {options['appointments']} appointments, "
+            f"{options['open_slots']} open slots and {options['records']} medical records."
+        ))
+
+    def bulk(self, model, objects):
+        return model.objects.bulk_create(objects, batch_size=self.batch_size)
+
+    def create_users(self, prefix, kind, count):
+        # Hashing is deliberately slow; every seeded user shares one password
+        password = make_password('password')
+        return self.bulk(User, [
+            User(username=f'{prefix}-{kind}{i}', password=password, category=kind, phone=f'03{i:09d}'[:15])
+            for i in range(count)
+        ])
+
+    def create_doctors(self, prefix, count):
+        doctors = []
+        for user in self.create_users(prefix, 'doctor', count):
+            fee = self.rng.choice(FEES)
+            amount, currency = parse_fee(fee)
+            doctors.append(Doctor(user=user, specialty=self.rng.choice(SPECIALTIES), fee=fee,
+                                  fee_amount=amount, fee_currency=currency))
+        return self.bulk(Doctor, doctors)
+
+    def create_patients(self, prefix, count):
+        users = self.create_users(prefix, 'patient', count)
+        return self.bulk(Patient, [
+            Patient(user=user, gender=self.rng.choice(['Male', 'Female']), blood_group=self.rng.choice(BLOOD_GROUPS))
+            for user in users
+        ])
+
+    def create_appointments(self, doctors, patients, count, paid_share):
+        """Appointment i goes to doctor i % len(doctors) in that doctor's next free slot."""
+        per_doctor = -(-count // len(doctors))
+        today = timezone.localdate()
+        self.start_day = today - datetime.timedelta(days=int(per_doctor * PAST_SHARE) // SLOTS_PER_DAY)
+        last_day = today
+        for offset in range(0, count, self.batch_size):
+            slots, appointments = [], []
+            for i in range(offset, min(offset + self.batch_size, count)):
+                doctor = doctors[i % len(doctors)]
+                date, time = slot_at(self.start_day, i // len(doctors))
+                if date < today:
+                    status = 'cancelled' if self.rng.random() < 0.1 else 'completed'
+                else:
+                    status = 'confirmed'
+                last_day = max(last_day, date)
+                slots.append(DoctorSlot(doctor=doctor, date=date, time=time, is_booked=status != 'cancelled'))
+                appointments.append(Appointment(
+                    patient_id=self.rng.choice(patients).user_id, doctor=doctor, date=date, time=time,
+                    reason=self.rng.choice(REASONS), status=status,
+                ))
+            self.bulk(DoctorSlot, slots)
+            self.bulk(Bill, [
+                Bill(appointment=a, amount=a.doctor.fee_amount,
+                     status='paid' if a.status == 'completed' and self.rng.random() < paid_share else 'unpaid')
+                for a in self.bulk(Appointment, appointments) if a.status != 'cancelled'
+            ])
+        return last_day
+
+    def create_open_slots(self, doctors, booked, count):
+        first = -(-booked // len(doctors))
+        last_day = self.start_day
+        for offset in range(0, count, self.batch_size):
+            self.bulk(DoctorSlot, [
+                DoctorSlot(doctor=doctors[j % len(doctors)], date=date, time=time)
+                for j in range(offset, min(offset + self.batch_size, count))
+                for date, time in [slot_at(self.start_day, first + j // len(doctors))]
+            ])
+        if count:
+            last_day = slot_at(self.start_day, first + (count - 1) // len(doctors))[0]
+        return last_day
+
+    def create_records(self, doctors, patients, count):
+        for offset in range(0, count, self.batch_size):
+            self.bulk(MedicalRecord, [
+                MedicalRecord(
+                    patient=self.rng.choice(patients), doctor=self.rng.choice(doctors),
+                    diagnosis=self.rng.choice(DIAGNOSES), prescription=self.rng.choice(PRESCRIPTIONS),
+                    notes=f"Seeded record {i}", tests=self.rng.sample(TESTS, self.rng.randint(0, 3)),
+                )
+                for i in range(offset, min(offset + self.batch_size, count))
+            ])
@@ -0,0 +1,258 @@
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.views import View
+
+from .slot_events import subscriber_count
+from .tasks import queue_stats
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+_lock = threading.Lock()
+_requests = Counter()                 # (view, method, status) -> count
+_latency = defaultdict(lambda: [0] * (len(LATENCY_BUCKETS) + 1))  # (view, method) -> bucket counts
+_latency_sum = Counter()              # (view, method) -> seconds
+_queries = Counter()                  # view -> queries
+_db_time = Counter()                  # view -> seconds
+_response_bytes = Counter()           # view -> bytes
+_n_plus_one = Counter()               # view -> flagged requests
+_END = object()
+
+# The recorder of the request being handled. A context variable rather than
+# connection.execute_wrapper(), because async views query from a thread
+# sync_to_async picked, and streamed bodies after the middleware returned
+_current = ContextVar('metrics_recorder', default=None)
+
+
+class QueryRecorder:
+    """execute_wrapper that counts queries, their time and how often each SQL shape repeats."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+            # Parameters are already placeholders; only IN lists vary in length
+            self.shapes[IN_LIST.sub('IN (...)', sql)] += 1
+
+
+def _record_query(execute, sql, params, many, context):
+    recorder = _current.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install(connection):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    install(connection)
+
+
+def record(view, method, status, seconds, recorder, size):
+    repeated = [(sql, n) for sql, n in recorder.shapes.items() if n > settings.METRICS_N_PLUS_ONE_THRESHOLD]
+    with _lock:
+        _requests[view, method, status] += 1
+        _latency[view, method][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        _latency_sum[view, method] += seconds
+        _queries[view] += recorder.count
+        _db_time[view] += recorder.seconds
+        _response_bytes[view] += size
+        if repeated:
+            _n_plus_one[view] += 1
+    for sql, n in repeated:
+        logger.warning("Possible N+1 in %s: %d x %s", view, n, sql[:300])
+
+
+def reset():
+    with _lock:
+        for metric in (_requests, _latency, _latency_sum, _queries, _db_time, _response_bytes, _n_plus_one):
+            metric.clear()
+
+
+class MetricsMiddleware:
+    """
+    Records, per URL name, request counts, a latency histogram, DB query
+    count and time, and response bytes, and flags requests that run one SQL
+    shape more than METRICS_N_PLUS_ONE_THRESHOLD times. The cost is a timer
+    and a Counter update per query. Streamed responses are recorded when
+    their body is finished. With METRICS_RESPONSE_HEADERS (on when DEBUG)
+    responses carry X-Query-Count and X-DB-Time-Ms.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        # Connections opened before this module was imported
+        for connection in connections.all(initialized_only=True):
+            install(connection)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        recorder, started = QueryRecorder(), time.perf_counter()
+        token = _current.set(recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        recorder, started = QueryRecorder(), time.perf_counter()
+        token = _current.set(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, recorder, started)
+
+    def finish(self, request, response, recorder, started):
+        match = request.resolver_match
+        view = (match.url_name or match.view_name) if match else 'unmatched'
+        if settings.METRICS_RESPONSE_HEADERS:
+            # For a streamed body, only what ran before its first chunk
+            response['X-Query-Count'] = recorder.count
+            response['X-DB-Time-Ms'] = f"{1000 * recorder.seconds:.1f}"
+
+        def done(size):
+            record(view, request.method, response.status_code, time.perf_counter() - started, recorder, size)
+
+        if not response.streaming:
+            done(len(response.content))
+        elif response.is_async:
+            response.streaming_content = self.measure_async(response.streaming_content, recorder, done)
+        else:
+            response.streaming_content = self.measure(response.streaming_content, recorder, done)
+        return response
+
+    @staticmethod
+    def measure(stream, recorder, done):
+        # Records the request once its body has been sent (or the client went away)
+        size = 0
+        try:
+            while True:
+                token = _current.set(recorder)
+                try:
+                    chunk = next(stream, _END)
+                finally:
+                    _current.reset(token)
+                if chunk is _END:
+                    break
+                size += len(chunk)
+                yield chunk
+        finally:
+            done(size)
+
+    @staticmethod
+    async def measure_async(stream, recorder, done):
+        size = 0
+        try:
+            while True:
+                token = _current.set(recorder)
+                try:
+                    chunk = await anext(stream, _END)
+                finally:
+                    _current.reset(token)
+                if chunk is _END:
+                    break
+                size += len(chunk)
+                yield chunk
+        finally:
+            done(size)
+
+
+def _labels(**labels):
+    return ','.join(f'{name}="{value}"' for name, value in labels.items())
+
+
+def render():
+    """Prometheus text exposition of this process's metrics."""
+    with _lock:
+        requests = dict(_requests)
+        latency = {key: list(buckets) for key, buckets in _latency.items()}
+        latency_sum = dict(_latency_sum)
+        per_view = [
+            ('clinic_db_queries_total', 'counter', 'Database queries run', dict(_queries)),
+            ('clinic_db_time_seconds_total', 'counter', 'Time spent in database queries', dict(_db_time)),
+            ('clinic_response_bytes_total', 'counter', 'Response body bytes', dict(_response_bytes)),
+            ('clinic_n_plus_one_total', 'counter', 'Requests that repeated one SQL shape too often', dict(_n_plus_one)),
+        ]
+
+    lines = [
+        '# HELP clinic_http_requests_total HTTP requests handled',
+        '# TYPE clinic_http_requests_total counter',
+    ]
+    for (view, method, status), count in sorted(requests.items()):
+        lines.append(f'clinic_http_requests_total{{{_labels(view=view, method=method, status=status)}}} {count}')
+
+    lines += [
+        '# HELP clinic_http_request_duration_seconds Request latency',
+        '# TYPE clinic_http_request_duration_seconds histogram',
+    ]
+    for (view, method), buckets in sorted(latency.items()):
+        labels = _labels(view=view, method=method)
+        cumulative = 0
+        for bound, count in zip((*LATENCY_BUCKETS, '+Inf'), buckets):
+            cumulative += count
+            lines.append(f'clinic_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'clinic_http_request_duration_seconds_sum{{{labels}}} {latency_sum[view, method]:.6f}')
+        lines.append(f'clinic_http_request_duration_seconds_count{{{labels}}} {cumulative}')
+
+    for name, kind, help_text, values in per_view:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        lines += [f'{name}{{{_labels(view=view)}}} {value}' for view, value in sorted(values.items())]
+    return '\n'.join(lines) + '\n'
+
+
+def render_gauges():
+    """Task queue gauges, read from the database, and this process's live feed subscribers."""
+    stats = queue_stats()
+    lines = ['# HELP clinic_tasks Background tasks by status', '# TYPE clinic_tasks gauge']
+    lines += [f'clinic_tasks{{{_labels(status=status)}}} {stats[status]}' for status in ('queued', 'running', 'failed')]
+    lines += [
+        '# HELP clinic_task_queue_depth Queued tasks that are due to run',
+        '# TYPE clinic_task_queue_depth gauge',
+        f'clinic_task_queue_depth {stats["due"]}',
+        '# HELP clinic_task_queue_lag_seconds How long the oldest due task has been waiting',
+        '# TYPE clinic_task_queue_lag_seconds gauge',
+        f'clinic_task_queue_lag_seconds {stats["lag_seconds"]:.3f}',
+        '# HELP clinic_slot_event_subscribers Open slot event streams waiting for a change',
+        '# TYPE clinic_slot_event_subscribers gauge',
+        f'clinic_slot_event_subscribers {subscriber_count()}',
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsView(View):
+    def get(self, request):
+        return HttpResponse(render() + render_gauges(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-18 19:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('makeAccount', '0009_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='doctorslot',
+            index=models.Index(condition=models.Q(('is_booked', False)), fields=['date', 'time'], name='slot_open_date_idx'),
+        ),
+    ]
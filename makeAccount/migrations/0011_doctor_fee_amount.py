@@ -0,0 +1,61 @@
+# Generated by Django 6.0 on 2026-10-18 19:02
+
+import re
+from decimal import Decimal
+from django.db import migrations, models
+
+# A frozen copy of makeAccount.models.parse_fee
+MAX_FEE = Decimal('99999999.99')
+CURRENCIES = frozenset({
+    'AED', 'AUD', 'BDT', 'CAD', 'CHF', 'CNY', 'EUR', 'GBP', 'INR', 'JPY',
+    'KWD', 'LKR', 'MYR', 'NPR', 'OMR', 'PKR', 'QAR', 'SAR', 'SGD', 'TRY', 'USD',
+})
+FEE_PATTERN = re.compile(
+    r'(?:\b(?P<before>[A-Za-z]{3})\s*)?(?P<amount>\d[\d,]*(?:\.\d{1,2})?)(?:\s*(?P<after>[A-Za-z]{3})\b)?'
+)
+
+
+def parse_existing_fees(apps, schema_editor):
+    Doctor = apps.get_model('makeAccount', 'Doctor')
+    doctors = list(Doctor.objects.only('id', 'fee'))
+    for doctor in doctors:
+        match = FEE_PATTERN.search(doctor.fee or '')
+        if not match:
+            continue
+        amount = Decimal(match.group('amount').replace(',', ''))
+        if amount > MAX_FEE:
+            # Keeps the default rather than overflowing the column
+            continue
+        codes = [code.upper() for code in match.group('before', 'after') if code]
+        doctor.fee_amount = amount
+        doctor.fee_currency = next((code for code in codes if code in CURRENCIES), 'PKR')
+    Doctor.objects.bulk_update(doctors, ['fee_amount', 'fee_currency'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('makeAccount', '0010_slot_open_date_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctor',
+            name='fee_amount',
+            field=models.DecimalField(decimal_places=2, default=Decimal('2000'), max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='doctor',
+            name='fee_currency',
+            field=models.CharField(default='PKR', max_length=3),
+        ),
+        migrations.RunPython(parse_existing_fees, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(fields=['specialty', 'fee_amount'], name='doctor_specialty_fee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(fields=['fee_amount'], name='doctor_fee_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 6.0 on 2026-10-18 19:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_calendar(apps, schema_editor):
+    DoctorSlot = apps.get_model('makeAccount', 'DoctorSlot')
+    SlotCalendar = apps.get_model('makeAccount', 'SlotCalendar')
+    days = {}
+    for doctor_id, date, is_booked in DoctorSlot.objects.values_list('doctor_id', 'date', 'is_booked').iterator():
+        day = days.setdefault((doctor_id, date), SlotCalendar(doctor_id=doctor_id, date=date))
+        if is_booked:
+            day.booked_count += 1
+        else:
+            day.free_count += 1
+    SlotCalendar.objects.bulk_create(days.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('makeAccount', '0012_updated_at'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='doctor',
+            name='slots',
+        ),
+        migrations.CreateModel(
+            name='SlotCalendar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('free_count', models.PositiveSmallIntegerField(default=0)),
+                ('booked_count', models.PositiveSmallIntegerField(default=0)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_calendar', to='makeAccount.doctor')),
+            ],
+            options={
+                'unique_together': {('doctor', 'date')},
+            },
+        ),
+        migrations.RunPython(build_calendar, migrations.RunPython.noop),
+    ]
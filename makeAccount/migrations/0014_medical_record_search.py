@@ -0,0 +1,62 @@
+# Generated by Django 6.0 on 2026-10-18 19:30
+
+from django.db import migrations
+
+# Frozen copies of what makeAccount.search installs, so replaying this
+# migration does not depend on the current app code.
+FTS_INSERT = (
+    'INSERT INTO "makeAccount_medicalrecord_fts"(rowid, diagnosis, prescription, notes, tests) '
+    'VALUES (new.id, new.diagnosis, new.prescription, new.notes, new.tests);'
+)
+FTS_DELETE = (
+    'INSERT INTO "makeAccount_medicalrecord_fts"("makeAccount_medicalrecord_fts", rowid, diagnosis, prescription, '
+    'notes, tests) VALUES (\'delete\', old.id, old.diagnosis, old.prescription, old.notes, old.tests);'
+)
+SQLITE_INSTALL = [
+    'CREATE VIRTUAL TABLE IF NOT EXISTS "makeAccount_medicalrecord_fts" USING fts5(diagnosis, prescription, '
+    'notes, tests, content=\'makeAccount_medicalrecord\', content_rowid=\'id\', tokenize=\'porter unicode61\')',
+    f'CREATE TRIGGER IF NOT EXISTS "makeAccount_medicalrecord_fts_ai" AFTER INSERT ON "makeAccount_medicalrecord" '
+    f'BEGIN {FTS_INSERT} END',
+    f'CREATE TRIGGER IF NOT EXISTS "makeAccount_medicalrecord_fts_ad" AFTER DELETE ON "makeAccount_medicalrecord" '
+    f'BEGIN {FTS_DELETE} END',
+    f'CREATE TRIGGER IF NOT EXISTS "makeAccount_medicalrecord_fts_au" AFTER UPDATE ON "makeAccount_medicalrecord" '
+    f'BEGIN {FTS_DELETE} {FTS_INSERT} END',
+    # Index the records that already exist
+    'INSERT INTO "makeAccount_medicalrecord_fts"("makeAccount_medicalrecord_fts") VALUES (\'rebuild\')',
+]
+SQLITE_UNINSTALL = [
+    'DROP TRIGGER IF EXISTS "makeAccount_medicalrecord_fts_ai"',
+    'DROP TRIGGER IF EXISTS "makeAccount_medicalrecord_fts_ad"',
+    'DROP TRIGGER IF EXISTS "makeAccount_medicalrecord_fts_au"',
+    'DROP TABLE IF EXISTS "makeAccount_medicalrecord_fts"',
+]
+# The expression search.record_vector() compiles to, so queries can use the index
+POSTGRES_INSTALL = [
+    'CREATE INDEX IF NOT EXISTS "record_search_idx" ON "makeAccount_medicalrecord" USING gin (('
+    'setweight(to_tsvector(\'english\'::regconfig, COALESCE("diagnosis", \'\')), \'A\') || '
+    'setweight(to_tsvector(\'english\'::regconfig, COALESCE("prescription", \'\')), \'B\') || '
+    'setweight(to_tsvector(\'english\'::regconfig, COALESCE("notes", \'\')), \'C\') || '
+    'setweight(to_tsvector(\'english\'::regconfig, COALESCE(("tests")::text, \'\')), \'C\')))',
+]
+POSTGRES_UNINSTALL = ['DROP INDEX IF EXISTS "record_search_idx"']
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, ()):
+            schema_editor.execute(sql)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('makeAccount', '0013_slot_calendar'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_INSTALL, 'postgresql': POSTGRES_INSTALL}),
+            run({'sqlite': SQLITE_UNINSTALL, 'postgresql': POSTGRES_UNINSTALL}),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-18 21:05
+
+from django.db import migrations
+
+# Pattern-opclass indexes for user_counts.prefix_filter(), by column
+PREFIX_INDEXES = {'username': 'user_username_prefix_idx', 'phone': 'user_phone_prefix_idx'}
+
+
+def create_prefix_indexes(apps, schema_editor):
+    # Only PostgreSQL needs these: prefix_filter() uses LIKE there, which a
+    # btree serves only with pattern opclasses under a locale collation
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for column, name in PREFIX_INDEXES.items():
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS "{name}" ON "makeAccount_user" ("{column}" varchar_pattern_ops)'
+        )
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in PREFIX_INDEXES.values():
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('makeAccount', '0019_user_list_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_prefix_indexes, drop_prefix_indexes),
+    ]
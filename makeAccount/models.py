@@ -1,7 +1,39 @@
+import re
+from decimal import Decimal
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
 
+DEFAULT_FEE = Decimal('2000')
+DEFAULT_CURRENCY = 'PKR'
+# Largest amount Doctor.fee_amount (max_digits=10, decimal_places=2) can hold
+MAX_FEE = Decimal('99999999.99')
+# Only these are read as a currency, so words like "Fee" or "Per" are not
+CURRENCIES = frozenset({
+    'AED', 'AUD', 'BDT', 'CAD', 'CHF', 'CNY', 'EUR', 'GBP', 'INR', 'JPY',
+    'KWD', 'LKR', 'MYR', 'NPR', 'OMR', 'PKR', 'QAR', 'SAR', 'SGD', 'TRY', 'USD',
+})
+FEE_PATTERN = re.compile(
+    r'(?:\b(?P<before>[A-Za-z]{3})\s*)?(?P<amount>\d[\d,]*(?:\.\d{1,2})?)(?:\s*(?P<after>[A-Za-z]{3})\b)?'
+)
+
+
+def parse_fee(text):
+    """
+    Split a free-text fee like "PKR 2,000" or "1500 USD" into
+    (Decimal('2000'), 'PKR'). A code on either side of the amount that is
+    not in CURRENCIES is ignored. Raises ValueError for amounts above MAX_FEE.
+    """
+    match = FEE_PATTERN.search(text or '')
+    if not match:
+        return DEFAULT_FEE, DEFAULT_CURRENCY
+    amount = Decimal(match.group('amount').replace(',', ''))
+    if amount > MAX_FEE:
+        raise ValueError(f"Fee amount must not exceed {MAX_FEE}")
+    codes = [code.upper() for code in match.group('before', 'after') if code]
+    return amount, next((code for code in codes if code in CURRENCIES), DEFAULT_CURRENCY)
+
 class Patient(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="patient_profile")
     gender = models.CharField(max_length=10)
@@ -26,6 +58,17 @@ class Appointment(models.Model):
     reason = models.TextField(blank=True)
     status = models.CharField(max_length=20, default="confirmed")
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Keyset-paginated feeds order by (-date, -time, -id)
+            models.Index(fields=['date', 'time', 'id'], name='appt_date_time_idx'),
+            models.Index(fields=['patient', 'date', 'time', 'id'], name='appt_patient_date_idx'),
+            models.Index(fields=['doctor', 'date', 'time', 'id'], name='appt_doctor_date_idx'),
+            models.Index(fields=['doctor', 'status', 'patient'], name='appt_doctor_status_idx'),
+            models.Index(fields=['updated_at', 'id'], name='appt_updated_idx'),
+        ]
 
     @property
     def doctor_name(self):
@@ -44,6 +87,13 @@ class MedicalRecord(models.Model):
     tests = models.JSONField(default=list, blank=True)
     date = models.DateField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Keyset-paginated record lists order by (-date, -id)
+            models.Index(fields=['patient', 'date', 'id'], name='record_patient_date_idx'),
+            models.Index(fields=['date', 'id'], name='record_date_idx'),
+        ]
+
     def __str__(self):
         return f"Record for {self.patient.user.username} - {self.date}"
 
@@ -53,11 +103,178 @@ class Bill(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=10, choices=[('paid', 'Paid'), ('unpaid', 'Unpaid')], default='unpaid')
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status'], name='bill_status_idx'),
+            models.Index(fields=['created_at'], name='bill_created_idx'),
+            models.Index(fields=['updated_at', 'id'], name='bill_updated_idx'),
+        ]
 
     def __str__(self):
         return f"Bill {self.id} for {self.appointment}"
 
 
+class ArchivedAppointment(models.Model):
+    """
+    A completed or cancelled Appointment moved out of the hot table by
+    makeAccount.retention. Keeps the appointment's id and timestamps.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    patient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="archived_appointments")
+    doctor = models.ForeignKey('Doctor', on_delete=models.CASCADE, related_name="archived_appointments")
+    date = models.DateField()
+    time = models.TimeField()
+    reason = models.TextField(blank=True)
+    status = models.CharField(max_length=20)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'time', 'id'], name='archived_appt_date_idx'),
+            models.Index(fields=['patient', 'date', 'time', 'id'], name='archived_appt_patient_idx'),
+            models.Index(fields=['doctor', 'date', 'time', 'id'], name='archived_appt_doctor_idx'),
+            models.Index(fields=['doctor', 'status', 'patient'], name='archived_appt_status_idx'),
+        ]
+
+    @property
+    def doctor_name(self):
+        return self.doctor.user.username
+
+    def __str__(self):
+        return f"Archived appointment {self.id} on {self.date}"
+
+
+class ArchivedBill(models.Model):
+    """The Bill of an ArchivedAppointment, with its original id."""
+    id = models.BigIntegerField(primary_key=True)
+    appointment = models.OneToOneField(ArchivedAppointment, on_delete=models.CASCADE, related_name="bill")
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=10, choices=[('paid', 'Paid'), ('unpaid', 'Unpaid')])
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='archived_bill_created_idx'),
+            models.Index(fields=['updated_at', 'id'], name='archived_bill_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived bill {self.id}"
+
+
+class RevenueLedger(models.Model):
+    PERIOD_CHOICES = (
+        ('day', 'Day'),
+        ('month', 'Month'),
+    )
+
+    doctor = models.ForeignKey('Doctor', on_delete=models.CASCADE, related_name='revenue')
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    billed_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    paid_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    bill_count = models.PositiveIntegerField(default=0)
+    paid_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('doctor', 'period', 'period_start')
+        indexes = [models.Index(fields=['period', 'period_start'])]
+
+    def __str__(self):
+        return f"{self.doctor} {self.period} {self.period_start}: {self.paid_amount}/{self.billed_amount}"
+
+
+class RevokedToken(models.Model):
+    jti = models.CharField(max_length=64, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.jti
+
+
+class Task(models.Model):
+    """A unit of background work, run by `manage.py run_workers` (see makeAccount.tasks)."""
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    # Enqueueing twice with one key yields one task
+    key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField()
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers poll for the earliest due queued tasks
+            models.Index(fields=['run_at', 'id'], condition=models.Q(status='queued'), name='task_due_idx'),
+            models.Index(fields=['status', 'locked_at'], name='task_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})"
+
+
+class ImportJob(models.Model):
+    """
+    A bulk user import (makeAccount.user_import). `rows_done` is the
+    checkpoint: it is committed with each chunk, so a resumed job skips
+    exactly the rows already imported or rejected.
+    """
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    FORMAT_CHOICES = (
+        ('csv', 'CSV'),
+        ('ndjson', 'NDJSON'),
+    )
+
+    source = models.CharField(max_length=500)
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    rows_done = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Import {self.id} of {self.source} ({self.status})"
+
+
+class ImportRowError(models.Model):
+    job = models.ForeignKey(ImportJob, on_delete=models.CASCADE, related_name="row_errors")
+    row = models.PositiveIntegerField()
+    username = models.CharField(max_length=150, blank=True)
+    errors = models.JSONField()
+
+    class Meta:
+        indexes = [models.Index(fields=['job', 'row'], name='import_error_row_idx')]
+
+    def __str__(self):
+        return f"Import {self.job_id} row {self.row}"
+
+
 class Feedback(models.Model):
     patient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     content = models.TextField()
@@ -79,16 +296,58 @@ class DoctorSlot(models.Model):
 
     class Meta:
         unique_together = ('doctor', 'date', 'time')
+        indexes = [
+            # Only open slots are ever searched, and they are a small share of the table
+            models.Index(
+                fields=['doctor', 'date', 'time'],
+                condition=models.Q(is_booked=False),
+                name='slot_open_idx',
+            ),
+            # Cross-doctor availability search walks open slots in time order
+            models.Index(
+                fields=['date', 'time'],
+                condition=models.Q(is_booked=False),
+                name='slot_open_date_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.doctor.user.username} - {self.date} {self.time} ({'Booked' if self.is_booked else 'Available'})"
 
 
+class SlotCalendar(models.Model):
+    """One row per doctor per day counting that day's free and booked DoctorSlot rows."""
+    doctor = models.ForeignKey('Doctor', on_delete=models.CASCADE, related_name='slot_calendar')
+    date = models.DateField()
+    free_count = models.PositiveSmallIntegerField(default=0)
+    booked_count = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('doctor', 'date')
+
+    def __str__(self):
+        return f"{self.doctor} {self.date}: {self.free_count} free / {self.booked_count} booked"
+
+
 class Doctor(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="doctor_profile")
     specialty = models.CharField(max_length=100)
     fee = models.CharField(max_length=20)
-    slots = models.JSONField(default=list, blank=True)
+    fee_amount = models.DecimalField(max_digits=10, decimal_places=2, default=DEFAULT_FEE)
+    fee_currency = models.CharField(max_length=3, default=DEFAULT_CURRENCY)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['specialty', 'fee_amount'], name='doctor_specialty_fee_idx'),
+            models.Index(fields=['fee_amount'], name='doctor_fee_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # `fee` stays the display text; the numeric columns follow it
+        self.fee_amount, self.fee_currency = parse_fee(self.fee)
+        if kwargs.get('update_fields') is not None and 'fee' in kwargs['update_fields']:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'fee_amount', 'fee_currency'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.user.username
@@ -104,5 +363,12 @@ class User(AbstractUser):
     phone = models.CharField(max_length=15)
     category = models.CharField(max_length=10, choices=CATEGORY_CHOICES)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # The admin user list: one category, newest first
+            models.Index(fields=['category', 'id'], name='user_category_idx'),
+            models.Index(fields=['phone'], name='user_phone_idx'),
+        ]
+
     def __str__(self):
         return self.username
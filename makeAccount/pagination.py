@@ -0,0 +1,150 @@
+import base64
+import json
+from functools import reduce
+from operator import attrgetter, or_
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination seeking on the full ordering tuple, so every page is a
+    single indexed range scan no matter how deep the client has paged.
+    The last field of `ordering` must be unique (normally the primary key).
+    """
+    ordering = ('-date', '-time', '-id')
+    page_size = None
+    page_size_query_param = 'page_size'
+    max_page_size = None
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_queryset(queryset, request)))
+
+    def paginate_querysets(self, querysets, request, view=None):
+        """
+        One page across several querysets with the same ordering fields (a
+        table and its archive): each contributes its first page after the
+        cursor and the merged rows are cut to one page.
+        """
+        return self.merge_page([row for queryset in querysets for row in self.page_queryset(queryset, request)])
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() for async views, fetching through the async ORM."""
+        return self.set_page([row async for row in self.page_queryset(queryset, request)])
+
+    async def apaginate_querysets(self, querysets, request, view=None):
+        """paginate_querysets() for async views."""
+        return self.merge_page([row for queryset in querysets async for row in self.page_queryset(queryset, request)])
+
+    def merge_page(self, rows):
+        # Stable sorts from the last ordering field to the first
+        for name in reversed(self.ordering):
+            rows.sort(key=attrgetter(name.lstrip('-')), reverse=name.startswith('-'))
+        return self.set_page(rows)
+
+    def page_queryset(self, queryset, request):
+        self.request = request
+        self.limit = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            try:
+                queryset = queryset.filter(self.seek_filter(position))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+        return queryset[:self.limit + 1]
+
+    def set_page(self, rows):
+        self.has_next = len(rows) > self.limit
+        self.page = rows[:self.limit]
+        return self.page
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'results': data,
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        default = self.page_size or settings.API_PAGE_SIZE
+        limit = self.max_page_size or settings.API_MAX_PAGE_SIZE
+        try:
+            size = int(request.GET[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return default
+        if size <= 0:
+            return default
+        return min(size, limit)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        position = [str(getattr(last, name.lstrip('-'))) for name in self.ordering]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position))
+
+    def seek_filter(self, position):
+        # (a, b, c) "after" (x, y, z) expands to
+        # a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+        clauses = []
+        for i, name in enumerate(self.ordering):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            equal = {f.lstrip('-'): v for f, v in zip(self.ordering[:i], position[:i])}
+            clauses.append(Q(**equal, **{f'{field}__{lookup}': position[i]}))
+        return reduce(or_, clauses)
+
+    def encode_cursor(self, position):
+        raw = json.dumps(position, separators=(',', ':')).encode('ascii')
+        return base64.urlsafe_b64encode(raw).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.GET.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+
+class AppointmentPagination(KeysetPagination):
+    ordering = ('-date', '-time', '-id')
+
+
+class MedicalRecordPagination(KeysetPagination):
+    ordering = ('-date', '-id')
+
+
+class UserPagination(KeysetPagination):
+    ordering = ('-id',)
+
+
+class ImportErrorPagination(KeysetPagination):
+    ordering = ('row', 'id')
@@ -0,0 +1,121 @@
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from .models import Doctor
+
+_counters = Counter()
+_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def _count(view, outcome):
+    with _lock:
+        _counters[view, outcome] += 1
+
+
+def stats():
+    """Per-view hit/miss counters of this process."""
+    with _lock:
+        views = {view for view, _ in _counters}
+        return {view: {"hits": _counters[view, "hit"], "misses": _counters[view, "miss"]} for view in sorted(views)}
+
+
+def _tag_key(tag):
+    return f"response-tag:{tag}"
+
+
+def tag_versions(tags):
+    cache = get_cache()
+    keys = [_tag_key(tag) for tag in tags]
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def invalidate(*tags):
+    """Make every cached response that depends on one of `tags` unreachable."""
+    now = time.time_ns()
+    get_cache().set_many({_tag_key(tag): now for tag in tags}, None)
+
+
+def invalidate_doctor(doctor_id, user_id=None):
+    if user_id is None:
+        user_id = Doctor.objects.filter(id=doctor_id).values_list('user_id', flat=True).first()
+    invalidate("doctors", f"doctor:{doctor_id}", f"user:{user_id}")
+
+
+class CachedResponseMixin:
+    """
+    Caches successful GET responses of an APIView, keyed by path, query
+    string and Accept header plus the current version of every tag returned
+    by `cache_tags()`. Bumping a tag (see signals.py) invalidates exactly the
+    responses built from it. Responses carry ETag and Last-Modified so
+    clients can revalidate with a 304.
+    """
+
+    def cache_tags(self, request, *args, **kwargs):
+        raise NotImplementedError
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != "GET":
+            return super().dispatch(request, *args, **kwargs)
+
+        view = type(self).__name__
+        versions = tag_versions(self.cache_tags(request, *args, **kwargs))
+        raw = "|".join([request.get_full_path(), request.META.get("HTTP_ACCEPT", ""), *map(str, versions)])
+        key = f"response:{view}:{hashlib.md5(raw.encode()).hexdigest()}"
+
+        cache = get_cache()
+        entry = cache.get(key)
+        if entry is not None:
+            _count(view, "hit")
+            if self._not_modified(request, entry):
+                response = HttpResponseNotModified()
+            else:
+                response = HttpResponse(entry["content"], content_type=entry["content_type"])
+            return self._decorate(response, entry, "HIT")
+
+        _count(view, "miss")
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code != 200 or response.streaming:
+            return response
+        if hasattr(response, "render"):
+            response.render()
+        entry = {
+            "content": response.content,
+            "content_type": response["Content-Type"],
+            "etag": quote_etag(hashlib.md5(response.content).hexdigest()),
+            "last_modified": int(time.time()),
+        }
+        cache.set(key, entry, settings.RESPONSE_CACHE_TIMEOUT)
+        if self._not_modified(request, entry):
+            response = HttpResponseNotModified()
+        return self._decorate(response, entry, "MISS")
+
+    def _not_modified(self, request, entry):
+        if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+        if if_none_match:
+            return entry["etag"] in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+        since = parse_http_date_safe(request.META.get("HTTP_IF_MODIFIED_SINCE", ""))
+        return since is not None and entry["last_modified"] <= since
+
+    def _decorate(self, response, entry, outcome):
+        response["ETag"] = entry["etag"]
+        response["Last-Modified"] = http_date(entry["last_modified"])
+        response["X-Cache"] = outcome
+        patch_vary_headers(response, ["Accept"])
+        return response
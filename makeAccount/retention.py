@@ -0,0 +1,130 @@
+"""
+Retention: keeps the hot tables to rows that are still live.
+
+- Open slots dated more than RETENTION_OPEN_SLOT_DAYS days ago can no
+  longer be booked and are deleted, along with every slot (booked or not)
+  and slot calendar day older than the appointment horizon.
+- Completed and cancelled appointments dated more than
+  RETENTION_APPOINTMENT_DAYS days ago are moved, with their bills, to
+  ArchivedAppointment / ArchivedBill under their original ids. Appointments
+  with an unpaid bill stay put so the bill can still be paid.
+
+Every batch of RETENTION_BATCH_SIZE rows is its own transaction. Reads that
+cover history (the appointment feeds and bill list with ?include_archived=1,
+exports, doctor stats, the revenue ledger rebuild) consult both tables.
+Medical records are clinical history and are never archived.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import response_cache
+from .models import Appointment, ArchivedAppointment, ArchivedBill, Bill, DoctorSlot, SlotCalendar
+
+ARCHIVED_STATUSES = ('completed', 'cancelled')
+APPOINTMENT_FIELDS = [f.attname for f in Appointment._meta.concrete_fields]
+BILL_FIELDS = [f.attname for f in Bill._meta.concrete_fields]
+
+
+def horizons(today=None, open_slot_days=None, appointment_days=None):
+    """(open slot cutoff, appointment cutoff): rows dated before these expire."""
+    today = today or timezone.localdate()
+    if open_slot_days is None:
+        open_slot_days = settings.RETENTION_OPEN_SLOT_DAYS
+    if appointment_days is None:
+        appointment_days = settings.RETENTION_APPOINTMENT_DAYS
+    return (today - datetime.timedelta(days=open_slot_days),
+            today - datetime.timedelta(days=appointment_days))
+
+
+def expired_slots(open_before, booked_before):
+    return DoctorSlot.objects.filter(Q(date__lt=open_before, is_booked=False) | Q(date__lt=booked_before))
+
+
+def archivable(before):
+    return Appointment.objects.filter(status__in=ARCHIVED_STATUSES, date__lt=before).exclude(bill__status='unpaid')
+
+
+def _delete_raw(model, column, ids):
+    # Raw DELETE: sends no post_delete signals
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE {column} IN ({", ".join(["%s"] * len(ids))})', ids)
+
+
+def purge_slots_batch(open_before, booked_before, batch_size):
+    ids = list(expired_slots(open_before, booked_before).values_list('id', flat=True)[:batch_size])
+    if ids:
+        # The ORM would load every slot to send its post_delete signal
+        _delete_raw(DoctorSlot, 'id', ids)
+    return len(ids)
+
+
+@transaction.atomic
+def archive_batch(before, batch_size):
+    """Move one batch of archivable appointments and their bills. Returns (appointments, bills)."""
+    ids = list(archivable(before).order_by('date', 'time', 'id').values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return 0, 0
+    appointments = Appointment.objects.filter(id__in=ids)
+    bills = Bill.objects.filter(appointment_id__in=ids)
+    ArchivedAppointment.objects.bulk_create(
+        [ArchivedAppointment(**row) for row in appointments.values(*APPOINTMENT_FIELDS)]
+    )
+    archived_bills = ArchivedBill.objects.bulk_create(
+        [ArchivedBill(**row) for row in bills.values(*BILL_FIELDS)]
+    )
+    # The bills stay in the revenue ledger from the archive, so bypass its delete signal
+    _delete_raw(Bill, 'appointment_id', ids)
+    appointments.delete()
+    return len(ids), len(archived_bills)
+
+
+def _in_batches(step, batch_size, max_batches):
+    """Call step() until it handles a short batch or max_batches ran; returns (totals, finished)."""
+    totals, ran = None, 0
+    while max_batches is None or ran < max_batches:
+        counts = step()
+        totals = counts if totals is None else [a + b for a, b in zip(totals, counts)]
+        ran += 1
+        if counts[0] < batch_size:
+            return totals, True
+    return totals, False
+
+
+def apply(today=None, open_slot_days=None, appointment_days=None, batch_size=None, max_batches=None):
+    """
+    Run retention, at most `max_batches` batches of each kind. Returns
+    counts of what was purged and archived and whether anything is left.
+    """
+    batch_size = batch_size or settings.RETENTION_BATCH_SIZE
+    open_before, booked_before = horizons(today, open_slot_days, appointment_days)
+
+    def purge():
+        with transaction.atomic():
+            return (purge_slots_batch(open_before, booked_before, batch_size),)
+
+    (slots,), slots_done = _in_batches(purge, batch_size, max_batches)
+    calendar_days = SlotCalendar.objects.filter(date__lt=min(open_before, booked_before)).delete()[0]
+    if slots or calendar_days:
+        # The doctor list carries calendar availability
+        response_cache.invalidate("doctors")
+
+    (appointments, bills), archive_done = _in_batches(
+        lambda: archive_batch(booked_before, batch_size), batch_size, max_batches
+    )
+    return {'slots': slots, 'calendar_days': calendar_days, 'appointments': appointments, 'bills': bills,
+            'done': slots_done and archive_done}
+
+
+def pending(today=None, open_slot_days=None, appointment_days=None):
+    """What apply() would purge and archive, without changing anything."""
+    open_before, booked_before = horizons(today, open_slot_days, appointment_days)
+    return {
+        'slots': expired_slots(open_before, booked_before).count(),
+        'calendar_days': SlotCalendar.objects.filter(date__lt=min(open_before, booked_before)).count(),
+        'appointments': archivable(booked_before).count(),
+    }
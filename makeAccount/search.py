@@ -0,0 +1,166 @@
+"""
+Full-text search over medical records.
+
+SQLite: an external-content FTS5 table over diagnosis, prescription, notes
+and tests, kept in sync by triggers on the record table, so saves,
+deletes, bulk inserts and queryset updates are all indexed. Ranked with
+bm25, diagnosis matches weighing most.
+
+PostgreSQL: a GIN index on the same tsvector expression the query uses, so
+there is nothing to keep in sync. Ranked with ts_rank.
+
+Other backends fall back to unranked icontains matching.
+
+SQLite drops triggers when a migration rebuilds the record table; run
+`manage.py rebuild_record_search` after such a migration.
+"""
+import re
+from functools import reduce
+from operator import add
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F, Q, TextField
+from django.db.models.functions import Cast
+
+from .models import MedicalRecord
+
+FTS_TABLE = 'makeAccount_medicalrecord_fts'
+RECORD_TABLE = 'makeAccount_medicalrecord'
+COLUMNS = ('diagnosis', 'prescription', 'notes', 'tests')
+PG_INDEX = 'record_search_idx'
+PG_CONFIG = 'english'
+# Relative weight of a match in each column, in COLUMNS order
+WEIGHTS = (4.0, 2.0, 1.0, 1.0)
+PG_WEIGHTS = ('A', 'B', 'C', 'C')
+
+
+def record_vector():
+    vectors = [
+        SearchVector(Cast(column, TextField()) if column == 'tests' else column, config=PG_CONFIG, weight=weight)
+        for column, weight in zip(COLUMNS, PG_WEIGHTS)
+    ]
+    return reduce(add, vectors)
+
+
+def _sqlite_install_sql():
+    columns = ', '.join(COLUMNS)
+    new = ', '.join(f'new.{c}' for c in COLUMNS)
+    old = ', '.join(f'old.{c}' for c in COLUMNS)
+    insert = f'INSERT INTO "{FTS_TABLE}"(rowid, {columns}) VALUES (new.id, {new});'
+    delete = f'INSERT INTO "{FTS_TABLE}"("{FTS_TABLE}", rowid, {columns}) VALUES (\'delete\', old.id, {old});'
+    return [
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS "{FTS_TABLE}" USING fts5({columns}, '
+        f'content=\'{RECORD_TABLE}\', content_rowid=\'id\', tokenize=\'porter unicode61\')',
+        f'CREATE TRIGGER IF NOT EXISTS "{FTS_TABLE}_ai" AFTER INSERT ON "{RECORD_TABLE}" BEGIN {insert} END',
+        f'CREATE TRIGGER IF NOT EXISTS "{FTS_TABLE}_ad" AFTER DELETE ON "{RECORD_TABLE}" BEGIN {delete} END',
+        f'CREATE TRIGGER IF NOT EXISTS "{FTS_TABLE}_au" AFTER UPDATE ON "{RECORD_TABLE}" BEGIN {delete} {insert} END',
+    ]
+
+
+def install(schema_editor, model=MedicalRecord):
+    """Create the index (idempotent). Used by the migration and the rebuild command."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for sql in _sqlite_install_sql():
+            schema_editor.execute(sql)
+    elif vendor == 'postgresql':
+        with schema_editor.connection.cursor() as cursor:
+            existing = schema_editor.connection.introspection.get_constraints(cursor, model._meta.db_table)
+        if PG_INDEX not in existing:
+            schema_editor.add_index(model, GinIndex(record_vector(), name=PG_INDEX))
+
+
+def uninstall(schema_editor, model=MedicalRecord):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS "{FTS_TABLE}_{suffix}"')
+        schema_editor.execute(f'DROP TABLE IF EXISTS "{FTS_TABLE}"')
+    elif vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{PG_INDEX}"')
+
+
+def rebuild():
+    """Recreate missing triggers/indexes and re-index every record."""
+    if connection.vendor == 'sqlite':
+        # The SQLite schema editor refuses to run inside a transaction; plain SQL is enough
+        with connection.cursor() as cursor:
+            for sql in _sqlite_install_sql():
+                cursor.execute(sql)
+            cursor.execute(f'INSERT INTO "{FTS_TABLE}"("{FTS_TABLE}") VALUES (\'rebuild\')')
+    elif connection.vendor == 'postgresql':
+        with connection.schema_editor() as schema_editor:
+            install(schema_editor)
+        with connection.cursor() as cursor:
+            cursor.execute(f'REINDEX INDEX "{PG_INDEX}"')
+
+
+def terms(query):
+    return re.findall(r'\w+', query)
+
+
+def search_records(query, patient_id=None, doctor_id=None, offset=0, limit=20):
+    """
+    Records matching every word of `query` (as a prefix, on SQLite), best
+    first, as a list of (record, rank) with higher rank meaning more
+    relevant. Fetches `limit + 1` so the caller can tell whether more follow.
+    """
+    words = terms(query)
+    if not words:
+        return []
+    if connection.vendor == 'sqlite':
+        hits = _sqlite_hits(words, patient_id, doctor_id, offset, limit + 1)
+    elif connection.vendor == 'postgresql':
+        hits = _postgres_hits(query, patient_id, doctor_id, offset, limit + 1)
+    else:
+        hits = _fallback_hits(words, patient_id, doctor_id, offset, limit + 1)
+    records = MedicalRecord.objects.select_related('doctor__user').in_bulk([record_id for record_id, _ in hits])
+    return [(records[record_id], rank) for record_id, rank in hits if record_id in records]
+
+
+def _sqlite_hits(words, patient_id, doctor_id, offset, limit):
+    # Quote every word so user input can never be parsed as FTS5 syntax
+    match = ' '.join('"%s"*' % word for word in words)
+    bm25 = f'bm25("{FTS_TABLE}", {", ".join(map(str, WEIGHTS))})'
+    sql = [
+        f'SELECT f.rowid, -{bm25} FROM "{FTS_TABLE}" f',
+        f'JOIN "{RECORD_TABLE}" r ON r.id = f.rowid WHERE "{FTS_TABLE}" MATCH %s',
+    ]
+    params = [match]
+    if patient_id is not None:
+        sql.append('AND r.patient_id = %s')
+        params.append(patient_id)
+    if doctor_id is not None:
+        sql.append('AND r.doctor_id = %s')
+        params.append(doctor_id)
+    sql.append(f'ORDER BY {bm25}, f.rowid LIMIT %s OFFSET %s')
+    with connection.cursor() as cursor:
+        cursor.execute(' '.join(sql), params + [limit, offset])
+        return cursor.fetchall()
+
+
+def _postgres_hits(query, patient_id, doctor_id, offset, limit):
+    search = SearchQuery(query, config=PG_CONFIG, search_type='websearch')
+    records = MedicalRecord.objects.annotate(document=record_vector()).filter(document=search)
+    if patient_id is not None:
+        records = records.filter(patient_id=patient_id)
+    if doctor_id is not None:
+        records = records.filter(doctor_id=doctor_id)
+    records = records.annotate(rank=SearchRank(F('document'), search)).order_by('-rank', 'id')
+    return list(records.values_list('id', 'rank')[offset:offset + limit])
+
+
+def _fallback_hits(words, patient_id, doctor_id, offset, limit):
+    records = MedicalRecord.objects.all()
+    for word in words:
+        records = records.filter(
+            Q(diagnosis__icontains=word) | Q(prescription__icontains=word)
+            | Q(notes__icontains=word) | Q(tests__icontains=word)
+        )
+    if patient_id is not None:
+        records = records.filter(patient_id=patient_id)
+    if doctor_id is not None:
+        records = records.filter(doctor_id=doctor_id)
+    return [(record_id, 0.0) for record_id in records.order_by('-date', '-id').values_list('id', flat=True)[offset:offset + limit]]
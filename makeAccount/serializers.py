@@ -1,42 +1,234 @@
+from django.contrib.auth.validators import UnicodeUsernameValidator
 from rest_framework import serializers
-from .models import User, Doctor, DoctorSlot, Appointment, Patient, Bill, MedicalRecord, Feedback
+from . import search, slot_calendar
+from .models import User, Doctor, DoctorSlot, Appointment, Patient, Bill, MedicalRecord, Feedback, RevenueLedger, parse_fee
 
-class UserSerializer(serializers.ModelSerializer):
+def parse_fields(value):
+    """"id,user.username" -> {'id': None, 'user': ['username']}; None means every field."""
+    selected = {}
+    for item in value.split(','):
+        name, dot, rest = item.strip().partition('.')
+        if not name or (dot and not rest):
+            raise serializers.ValidationError({"fields": f"Empty field name in {value!r}"})
+        if rest:
+            selected[name] = (selected.get(name) or []) + [rest]
+        else:
+            selected.setdefault(name, None)
+    return selected
+
+class SparseFieldsMixin:
+    """
+    `fields` (a list of names or a parse_fields() dict) keeps only those of
+    the declared fields. A relation in Meta.expandable then renders as its
+    primary key unless it is named in `expand` or given sub-fields
+    (`user.username`), which narrow the nested serializer the same way.
+    Without `fields` the serializer is unchanged.
+    """
+    def __init__(self, *args, fields=None, expand=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is None:
+            return
+        if not isinstance(fields, dict):
+            fields = dict.fromkeys(fields)
+        for name in set(self.fields) - set(fields):
+            self.fields.pop(name)
+        for name, nested in getattr(self.Meta, 'expandable', {}).items():
+            if name not in self.fields:
+                continue
+            if fields[name] is not None:
+                self.fields[name] = nested(read_only=True, fields=parse_fields(','.join(fields[name])))
+            elif name not in expand:
+                self.fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+
+def _check_fields(serializer_class, selected, expand=()):
+    declared = serializer_class().fields
+    expandable = getattr(serializer_class.Meta, 'expandable', {})
+    unknown = [name for name in selected if name not in declared]
+    unknown += [name for name in expand if name not in expandable]
+    if unknown:
+        raise serializers.ValidationError({"fields": f"Unknown fields: {', '.join(sorted(unknown))}"})
+    for name, sub in selected.items():
+        if sub is None:
+            continue
+        if name not in expandable:
+            raise serializers.ValidationError({"fields": f"{name} has no sub-fields"})
+        _check_fields(expandable[name], parse_fields(','.join(sub)))
+
+def _query_paths(serializer_class, selected, expand=(), prefix=''):
+    """The only() paths, select_related() relations and whether prefetches are needed for `selected`."""
+    declared = serializer_class().fields
+    expandable = getattr(serializer_class.Meta, 'expandable', {})
+    sources = getattr(serializer_class.Meta, 'sparse_sources', {})
+    paths, relations, prefetch = [], [], False
+
+    def add(path):
+        paths.append(prefix + path)
+        if '__' in path:
+            relations.append(prefix + path.rsplit('__', 1)[0])
+
+    for name, sub in selected.items():
+        if name in expandable and (sub is not None or name in expand):
+            relations.append(prefix + name)
+            nested = expandable[name]
+            nested_selected = parse_fields(','.join(sub)) if sub else dict.fromkeys(nested().fields)
+            nested_paths, nested_relations, _ = _query_paths(nested, nested_selected, prefix=f'{prefix}{name}__')
+            paths += nested_paths
+            relations += nested_relations
+        elif name in sources:
+            for path in sources[name]:
+                add(path)
+        elif isinstance(declared[name], serializers.SerializerMethodField):
+            prefetch = True
+        else:
+            add(declared[name].source.replace('.', '__'))
+    return paths, relations, prefetch
+
+def sparse_fields(request, serializer_class, queryset=None, required=()):
+    """
+    Apply ?fields= and ?expand= for `serializer_class`: narrow `queryset` to
+    the columns and joins those fields read (plus `required` paths, e.g.
+    pagination keys) and return it with the serializer kwargs. Prefetches
+    are kept only when a method field is selected. Raises ValidationError
+    for unknown or empty fields.
+    """
+    raw = request.GET.get('fields')
+    if not raw:
+        return queryset, {}
+    selected = parse_fields(raw)
+    expand = [name.strip() for name in request.GET.get('expand', '').split(',') if name.strip()]
+    _check_fields(serializer_class, selected, expand)
+    if queryset is not None:
+        paths, relations, prefetch = _query_paths(serializer_class, selected, expand)
+        queryset = queryset.select_related(None).select_related(*relations).only(*paths, *required)
+        if not prefetch:
+            queryset = queryset.prefetch_related(None)
+    return queryset, {'fields': selected, 'expand': expand}
+
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'phone', 'category']
 
-class PatientSerializer(serializers.ModelSerializer):
+class PatientSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     class Meta:
         model = Patient
         fields = ['id', 'user', 'gender', 'blood_group']
+        expandable = {'user': UserSerializer}
 
-class DoctorSerializer(serializers.ModelSerializer):
+class DoctorSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
+    availability = serializers.SerializerMethodField()
     class Meta:
         model = Doctor
-        fields = ['id', 'user', 'specialty', 'fee', 'slots']
+        fields = ['id', 'user', 'specialty', 'fee', 'fee_amount', 'fee_currency', 'availability']
+        read_only_fields = ['fee_amount', 'fee_currency']
+        expandable = {'user': UserSerializer}
+
+    def get_availability(self, obj):
+        return slot_calendar.availability(obj.slot_calendar.all())
 
 class DoctorSlotSerializer(serializers.ModelSerializer):
     class Meta:
         model = DoctorSlot
         fields = ['id', 'doctor', 'date', 'time']
 
-class AppointmentSerializer(serializers.ModelSerializer):
+class SlotRuleSerializer(serializers.Serializer):
+    doctor_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+    weekdays = serializers.ListField(
+        child=serializers.IntegerField(min_value=0, max_value=6),
+        default=lambda: list(range(7)),
+        help_text="0 = Monday ... 6 = Sunday",
+    )
+    start_time = serializers.TimeField()
+    end_time = serializers.TimeField()
+    slot_minutes = serializers.IntegerField(min_value=5, max_value=24 * 60)
+    exclude_dates = serializers.ListField(child=serializers.DateField(), default=list)
+
+    MAX_DAYS = 366
+
+    def validate(self, data):
+        if data['end_date'] < data['start_date']:
+            raise serializers.ValidationError("end_date must not be before start_date")
+        if (data['end_date'] - data['start_date']).days >= self.MAX_DAYS:
+            raise serializers.ValidationError(f"Date range is limited to {self.MAX_DAYS} days")
+        if data['end_time'] <= data['start_time']:
+            raise serializers.ValidationError("end_time must be after start_time")
+        return data
+
+class DoctorFilterSerializer(serializers.Serializer):
+    specialty = serializers.CharField(required=False)
+    min_fee = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    max_fee = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    ordering = serializers.ChoiceField(choices=['id', 'fee', '-fee'], default='id')
+
+class SlotSearchSerializer(serializers.Serializer):
+    specialty = serializers.CharField(required=False)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    time_from = serializers.TimeField(required=False)
+    time_to = serializers.TimeField(required=False)
+    max_fee = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=10)
+    order = serializers.ChoiceField(choices=['time', 'fee'], default='time')
+
+    def validate(self, data):
+        if data.get('date_from') and data.get('date_to') and data['date_to'] < data['date_from']:
+            raise serializers.ValidationError("date_to must not be before date_from")
+        return data
+
+class RecordSearchSerializer(serializers.Serializer):
+    q = serializers.CharField()
+    patient_id = serializers.IntegerField(required=False)
+    doctor_id = serializers.IntegerField(required=False)
+    page = serializers.IntegerField(min_value=1, default=1)
+    page_size = serializers.IntegerField(min_value=1, required=False)
+
+    def validate_q(self, value):
+        if not search.terms(value):
+            raise serializers.ValidationError("Enter at least one word to search for")
+        return value
+
+class AdminStatsSerializer(serializers.Serializer):
+    period = serializers.ChoiceField(choices=RevenueLedger.PERIOD_CHOICES, default='month')
+    doctor_id = serializers.IntegerField(required=False)
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+
+class AppointmentBatchSerializer(serializers.Serializer):
+    STATUS_CHOICES = ['confirmed', 'completed', 'cancelled']
+
+    status = serializers.ChoiceField(choices=STATUS_CHOICES)
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=5000)
+    doctor_id = serializers.IntegerField(required=False)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+    def validate(self, data):
+        by_range = all(data.get(f) is not None for f in ('doctor_id', 'date_from', 'date_to'))
+        if ('ids' in data) == by_range:
+            raise serializers.ValidationError("Give either ids or doctor_id with date_from and date_to")
+        if by_range and data['date_to'] < data['date_from']:
+            raise serializers.ValidationError("date_to must not be before date_from")
+        return data
+
+class AppointmentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     doctor_name = serializers.ReadOnlyField()
     class Meta:
         model = Appointment
         fields = ["id", "patient", "doctor", "date", "time", "reason", "status", "doctor_name"]
+        sparse_sources = {"doctor_name": ["doctor__user__username"]}
 
-class BillSerializer(serializers.ModelSerializer):
+class BillSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     doctor_name = serializers.ReadOnlyField(source='appointment.doctor.user.username')
     date = serializers.ReadOnlyField(source='appointment.date')
     class Meta:
         model = Bill
         fields = ['id', 'appointment', 'amount', 'status', 'doctor_name', 'date']
 
-class MedicalRecordSerializer(serializers.ModelSerializer):
+class MedicalRecordSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     doctor_name = serializers.ReadOnlyField(source='doctor.user.username')
     class Meta:
         model = MedicalRecord
@@ -47,12 +239,18 @@ class FeedbackSerializer(serializers.ModelSerializer):
         model = Feedback
         fields = ['id', 'patient', 'content', 'created_at']
 
+def check_fee(value):
+    try:
+        parse_fee(value)
+    except ValueError as e:
+        raise serializers.ValidationError(str(e))
+
 class SignupSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
     gender = serializers.CharField(write_only=True, required=False)
     blood_group = serializers.CharField(write_only=True, required=False)
     specialty = serializers.CharField(write_only=True, required=False)
-    fee = serializers.CharField(write_only=True, required=False)
+    fee = serializers.CharField(write_only=True, required=False, validators=[check_fee])
 
     class Meta:
         model = User
@@ -75,3 +273,15 @@ class SignupSerializer(serializers.ModelSerializer):
              Patient.objects.create(user=user, gender=gender or "Other", blood_group=blood_group or "N/A")
              
         return user
+
+class ImportRowSerializer(serializers.Serializer):
+    """One row of a bulk user import: SignupSerializer's fields, checked without queries."""
+    username = serializers.CharField(max_length=150, validators=[UnicodeUsernameValidator()])
+    password = serializers.CharField(trim_whitespace=False)
+    phone = serializers.CharField(max_length=15)
+    # Admin accounts are never created in bulk
+    category = serializers.ChoiceField(choices=[c for c in User.CATEGORY_CHOICES if c[0] != 'admin'])
+    gender = serializers.CharField(max_length=10, required=False, allow_blank=True)
+    blood_group = serializers.CharField(max_length=5, required=False, allow_blank=True)
+    specialty = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    fee = serializers.CharField(max_length=20, required=False, allow_blank=True, validators=[check_fee])
@@ -0,0 +1,196 @@
+import datetime
+from functools import reduce
+from itertools import islice
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import ledger, slot_calendar, slot_events, tasks
+from .stats import invalidate_doctor_stats
+from .models import Appointment, Bill, Doctor, DoctorSlot
+
+SLOT_BATCH_SIZE = 1000
+SEARCH_WINDOW_DAYS = 14
+RELEASE_BATCH_SIZE = 500
+
+
+class SlotUnavailable(Exception):
+    pass
+
+
+def claim_slot(doctor, date, time):
+    """
+    Flip the matching slot to booked with one conditional UPDATE. Returns
+    False when no slot exists for that time (walk-in bookings are allowed),
+    raises SlotUnavailable when it exists but somebody else holds it.
+    """
+    claimed = DoctorSlot.objects.filter(
+        doctor=doctor, date=date, time=time, is_booked=False
+    ).update(is_booked=True)
+    if claimed:
+        slot_calendar.refresh_day(doctor.id, date)
+        slot_events.publish_on_commit(doctor.id, date, time, True)
+        return True
+    if DoctorSlot.objects.filter(doctor=doctor, date=date, time=time).exists():
+        raise SlotUnavailable("This slot is already booked")
+    return False
+
+
+def release_slot(doctor_id, date, time):
+    released = DoctorSlot.objects.filter(
+        doctor_id=doctor_id, date=date, time=time, is_booked=True
+    ).update(is_booked=False)
+    if released:
+        slot_calendar.refresh_day(doctor_id, date)
+        slot_events.publish_on_commit(doctor_id, date, time, False)
+    return bool(released)
+
+
+def book_appointment(patient, doctor, date, time, **extra):
+    with transaction.atomic():
+        claim_slot(doctor, date, time)
+        appointment = Appointment.objects.create(
+            patient=patient, doctor=doctor, date=date, time=time, **extra
+        )
+        # Billing and the reminder run in a worker; the request only claims the slot
+        tasks.enqueue_booking_work(appointment)
+        transaction.on_commit(lambda: invalidate_doctor_stats(doctor.id))
+    return appointment
+
+
+def batch_update_status(status, ids=None, doctor_id=None, date_from=None, date_to=None):
+    """
+    Move many appointments to `status` in one transaction: one UPDATE for the
+    appointments and, for cancellations, one UPDATE releasing their slots.
+    Select them by `ids` or by doctor and date range. Returns one
+    {"id", "result"} per appointment with result updated, unchanged or
+    not_found.
+    """
+    appointments = Appointment.objects.all()
+    if ids is not None:
+        appointments = appointments.filter(id__in=ids)
+    else:
+        appointments = appointments.filter(doctor_id=doctor_id, date__gte=date_from, date__lte=date_to)
+
+    with transaction.atomic():
+        rows = list(appointments.select_for_update().values('id', 'doctor_id', 'date', 'time', 'status'))
+        changed = [row for row in rows if row['status'] != status]
+        Appointment.objects.filter(id__in=[row['id'] for row in changed]).update(
+            status=status, updated_at=timezone.now()
+        )
+
+        # Only slots this UPDATE frees: walk-ins have none and a slot may already be free
+        released = []
+        if status == 'cancelled':
+            slots = [Q(doctor_id=row['doctor_id'], date=row['date'], time=row['time']) for row in changed]
+            for start in range(0, len(slots), RELEASE_BATCH_SIZE):
+                booked = list(DoctorSlot.objects.select_for_update().filter(
+                    reduce(or_, slots[start:start + RELEASE_BATCH_SIZE]), is_booked=True
+                ).values_list('id', 'doctor_id', 'date', 'time'))
+                DoctorSlot.objects.filter(id__in=[pk for pk, *_ in booked]).update(is_booked=False)
+                released += [key for _, *key in booked]
+
+        for doctor in {row['doctor_id'] for row in changed}:
+            transaction.on_commit(lambda doctor=doctor: invalidate_doctor_stats(doctor))
+        if released:
+            doctors = {doctor for doctor, _, _ in released}
+            dates = [date for _, date, _ in released]
+            transaction.on_commit(lambda: slot_calendar.refresh(doctors, min(dates), max(dates)), robust=True)
+            for doctor, date, time in released:
+                slot_events.publish_on_commit(doctor, date, time, False)
+
+    changed_ids = {row['id'] for row in changed}
+    found = [row['id'] for row in rows]
+    results = [{"id": pk, "result": "updated" if pk in changed_ids else "unchanged"} for pk in sorted(found)]
+    if ids is not None:
+        results += [{"id": pk, "result": "not_found"} for pk in sorted(set(ids) - set(found))]
+    return results
+
+
+def pay_bill(bill_id):
+    """Mark a bill paid; paying an already paid bill is a no-op for the ledger."""
+    with transaction.atomic():
+        bill = Bill.objects.select_related('appointment').get(id=bill_id)
+        if Bill.objects.filter(id=bill.id, status='unpaid').update(status='paid', updated_at=timezone.now()):
+            ledger.record_payment(bill, bill.appointment.doctor_id)
+    return bill
+
+
+def expand_slot_rule(rule):
+    """Yield every (date, time) the rule describes, in chronological order."""
+    step = datetime.timedelta(minutes=rule['slot_minutes'])
+    excluded = set(rule.get('exclude_dates', ()))
+    weekdays = set(rule['weekdays'])
+    day = rule['start_date']
+    while day <= rule['end_date']:
+        if day.weekday() in weekdays and day not in excluded:
+            start = datetime.datetime.combine(day, rule['start_time'])
+            end = datetime.datetime.combine(day, rule['end_time'])
+            while start + step <= end:
+                yield day, start.time()
+                start += step
+        day += datetime.timedelta(days=1)
+
+
+def generate_slots(rule, batch_size=SLOT_BATCH_SIZE):
+    """
+    Insert the slots described by `rule` for each doctor in
+    rule['doctor_ids'] (every doctor when omitted). Slots that already exist
+    are left alone via the (doctor, date, time) unique constraint.
+    Returns (created, skipped).
+    """
+    doctor_ids = rule.get('doctor_ids')
+    if doctor_ids is None:
+        doctor_ids = list(Doctor.objects.values_list('id', flat=True))
+    else:
+        doctor_ids = list(Doctor.objects.filter(id__in=doctor_ids).values_list('id', flat=True))
+    if not doctor_ids:
+        return 0, 0
+
+    times = list(expand_slot_rule(rule))
+    slots = (
+        DoctorSlot(doctor_id=doctor_id, date=date, time=time)
+        for doctor_id in doctor_ids
+        for date, time in times
+    )
+    created = 0
+    with transaction.atomic():
+        while batch := list(islice(slots, batch_size)):
+            # Counted per batch, so slots other requests add or remove elsewhere in the range do not skew it
+            keys = {(slot.doctor_id, slot.date, slot.time) for slot in batch}
+            existing = DoctorSlot.objects.filter(
+                doctor_id__in={doctor_id for doctor_id, _, _ in keys},
+                date__range=(min(date for _, date, _ in keys), max(date for _, date, _ in keys)),
+            ).values_list('doctor_id', 'date', 'time')
+            created += len(keys - set(existing))
+            DoctorSlot.objects.bulk_create(batch, ignore_conflicts=True)
+        transaction.on_commit(lambda: slot_calendar.refresh(doctor_ids, rule['start_date'], rule['end_date']), robust=True)
+    return created, len(doctor_ids) * len(times) - created
+
+
+def search_available_slots(params):
+    """
+    Earliest open, future slots across all doctors matching `params`
+    (validated SlotSearchSerializer data). The (date, time) partial index on
+    open slots lets the database walk slots in order and stop after `limit`.
+    """
+    today = timezone.localdate()
+    start = max(params.get('date_from') or today, today)
+    end = params.get('date_to') or start + datetime.timedelta(days=SEARCH_WINDOW_DAYS)
+
+    slots = DoctorSlot.objects.filter(is_booked=False, date__gte=start, date__lte=end)
+    slots = slots.exclude(date=today, time__lt=timezone.localtime().time())
+    if params.get('time_from'):
+        slots = slots.filter(time__gte=params['time_from'])
+    if params.get('time_to'):
+        slots = slots.filter(time__lte=params['time_to'])
+    if params.get('specialty'):
+        slots = slots.filter(doctor__specialty__iexact=params['specialty'])
+    if params.get('max_fee') is not None:
+        slots = slots.filter(doctor__fee_amount__lte=params['max_fee'])
+    ordering = ('date', 'time', 'id')
+    if params.get('order') == 'fee':
+        ordering = ('doctor__fee_amount',) + ordering
+    return slots.select_related('doctor__user').order_by(*ordering)[:params['limit']]
@@ -0,0 +1,49 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import ledger, response_cache
+from .models import ArchivedBill, Bill, Doctor, DoctorSlot, Patient, User
+from .user_counts import invalidate_user_counts
+
+
+# Cache invalidation waits for the commit: a request that reads the old rows
+# before then would otherwise cache them under the new tag versions.
+
+@receiver([post_save, post_delete], sender=Doctor)
+def doctor_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: response_cache.invalidate_doctor(instance.id, instance.user_id))
+
+
+@receiver([post_save, post_delete], sender=DoctorSlot)
+def slot_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: response_cache.invalidate_doctor(instance.doctor_id))
+
+
+@receiver([post_save, post_delete], sender=Patient)
+def patient_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: response_cache.invalidate("patients"))
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # Logins save last_login alone, which leaves the totals as they were
+    if update_fields is None or 'category' in update_fields:
+        transaction.on_commit(invalidate_user_counts)
+    tags = [f"user:{instance.id}"]
+    if instance.category == 'doctor':
+        tags.append("doctors")
+        tags.extend(f"doctor:{pk}" for pk in Doctor.objects.filter(user_id=instance.id).values_list('id', flat=True))
+    elif instance.category == 'patient':
+        tags.append("patients")
+    transaction.on_commit(lambda: response_cache.invalidate(*tags))
+
+
+@receiver(post_delete, sender=Bill)
+@receiver(post_delete, sender=ArchivedBill)
+def bill_deleted(sender, instance, **kwargs):
+    # Deletes cascade bills before their appointment, so the doctor can still be read
+    appointments = sender._meta.get_field('appointment').related_model.objects
+    doctor_id = appointments.filter(id=instance.appointment_id).values_list('doctor_id', flat=True).first()
+    if doctor_id is not None:
+        ledger.remove_bill(instance, doctor_id)
@@ -0,0 +1,64 @@
+import datetime
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from . import response_cache
+from .models import DoctorSlot, SlotCalendar
+
+AVAILABILITY_DAYS = 14
+
+
+def summarise(slots):
+    """Fold (doctor_id, date, is_booked) tuples into SlotCalendar field values per (doctor_id, date)."""
+    days = defaultdict(lambda: {'free_count': 0, 'booked_count': 0})
+    for doctor_id, date, is_booked in slots:
+        days[doctor_id, date]['booked_count' if is_booked else 'free_count'] += 1
+    return days
+
+
+@transaction.atomic
+def refresh(doctor_ids, start, end=None):
+    """Recompute the calendar rows of `doctor_ids` for every day from start to end (inclusive)."""
+    end = end or start
+    # Write first: on SQLite a transaction that reads before writing cannot
+    # wait for the lock and fails immediately under concurrent bookings.
+    SlotCalendar.objects.filter(doctor_id__in=doctor_ids, date__gte=start, date__lte=end).delete()
+    slots = DoctorSlot.objects.filter(doctor_id__in=doctor_ids, date__gte=start, date__lte=end)
+    days = summarise(slots.values_list('doctor_id', 'date', 'is_booked').iterator(chunk_size=5000))
+    SlotCalendar.objects.bulk_create(
+        [SlotCalendar(doctor_id=doctor_id, date=date, **fields) for (doctor_id, date), fields in days.items()],
+        update_conflicts=True,
+        unique_fields=['doctor', 'date'],
+        update_fields=['free_count', 'booked_count'],
+        batch_size=1000,
+    )
+    # Slot changes arrive as queryset updates and bulk inserts, which send no
+    # model signals, so the response cache is invalidated from here. After
+    # commit: a request that read the old rows before then would otherwise
+    # cache them under the new tag versions
+    transaction.on_commit(lambda: [response_cache.invalidate_doctor(doctor_id) for doctor_id in doctor_ids])
+
+
+def refresh_day(doctor_id, date):
+    # The calendar is derived data; a failed refresh must not fail the booking
+    transaction.on_commit(lambda: refresh([doctor_id], date), robust=True)
+
+
+def with_availability(doctors, days=AVAILABILITY_DAYS):
+    start = timezone.localdate()
+    window = SlotCalendar.objects.filter(date__gte=start, date__lt=start + datetime.timedelta(days=days))
+    return doctors.prefetch_related(Prefetch('slot_calendar', queryset=window))
+
+
+def availability(calendar_rows, days=AVAILABILITY_DAYS):
+    """Dense free-slot counts per day from today, read from (prefetched) SlotCalendar rows."""
+    start = timezone.localdate()
+    free = [0] * days
+    for row in calendar_rows:
+        offset = (row.date - start).days
+        if 0 <= offset < days:
+            free[offset] = row.free_count
+    return {"start": str(start), "free": free}
@@ -0,0 +1,138 @@
+"""
+Live slot availability as server-sent events.
+
+claim_slot and release_slot publish a delta here once their transaction
+commits, and SlotEventsView streams the deltas of one doctor. Fan-out is
+in process: each doctor's channel keeps its last SLOT_EVENTS_BUFFER events
+for replay plus the futures of the subscribers waiting on it, and a
+publish resolves each of those futures on its own event loop. An idle
+subscriber is a suspended coroutine and one future.
+
+Event ids are "<process>-<sequence>". A client that reconnects with a
+Last-Event-ID from this process whose successors are still buffered gets
+the events it missed; otherwise it gets a `reset` event and should refetch
+the slot list. Only changes made in this process are seen, so serve the
+booking endpoints and the feed from the same ASGI process.
+"""
+import asyncio
+import itertools
+import json
+import threading
+import uuid
+from collections import deque
+
+from django.conf import settings
+from django.db import transaction
+
+PROCESS = uuid.uuid4().hex[:8]
+
+_lock = threading.Lock()
+_sequence = itertools.count(1)
+_last_seq = 0
+_channels = {}
+
+
+class Channel:
+    def __init__(self):
+        self.events = deque(maxlen=settings.SLOT_EVENTS_BUFFER)  # (seq, data)
+        self.evicted_through = 0    # highest seq pushed out of the buffer
+        self.waiters = set()        # (loop, future)
+
+
+def _channel(doctor_id):
+    # Callers hold _lock
+    channel = _channels.get(doctor_id)
+    if channel is None:
+        channel = _channels[doctor_id] = Channel()
+    return channel
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def publish(doctor_id, date, time, is_booked):
+    global _last_seq
+    data = {"doctor_id": doctor_id, "date": str(date), "time": str(time),
+            "change": "booked" if is_booked else "released"}
+    with _lock:
+        channel = _channel(doctor_id)
+        _last_seq = next(_sequence)
+        if len(channel.events) == channel.events.maxlen:
+            channel.evicted_through = channel.events[0][0]
+        channel.events.append((_last_seq, data))
+        waiters, channel.waiters = channel.waiters, set()
+    for loop, future in waiters:
+        loop.call_soon_threadsafe(_wake, future)
+
+
+def publish_on_commit(doctor_id, date, time, is_booked):
+    transaction.on_commit(lambda: publish(doctor_id, date, time, is_booked), robust=True)
+
+
+def subscriber_count():
+    with _lock:
+        return sum(len(channel.waiters) for channel in _channels.values())
+
+
+def format_event(data, seq, event=None):
+    lines = [f'id: {PROCESS}-{seq}']
+    if event:
+        lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def _resume_from(last_event_id):
+    """The sequence to continue after, or None when the id cannot be honoured."""
+    process, _, seq = (last_event_id or '').partition('-')
+    if process != PROCESS or not seq.isdigit():
+        return None
+    return int(seq)
+
+
+async def listen(doctor_id, last_event_id=None, heartbeat=None):
+    """
+    Yield the SSE stream for `doctor_id` forever: a retry hint, then one
+    message per slot change, and a comment line every `heartbeat` seconds
+    of silence so proxies keep the connection open.
+    """
+    heartbeat = heartbeat or settings.SLOT_EVENTS_HEARTBEAT
+    loop = asyncio.get_running_loop()
+    yield f'retry: {settings.SLOT_EVENTS_RETRY_MS}\n\n'
+
+    last_seq = _resume_from(last_event_id)
+    with _lock:
+        channel = _channel(doctor_id)
+        head = _last_seq
+    if last_seq is None or last_seq > head:
+        if last_event_id:
+            yield format_event({"doctor_id": doctor_id}, head, event='reset')
+        last_seq = head
+
+    while True:
+        with _lock:
+            if last_seq < channel.evicted_through:
+                lost, pending, last_seq = True, [], _last_seq
+            else:
+                lost, pending = False, [(seq, data) for seq, data in channel.events if seq > last_seq]
+            if not lost and not pending:
+                future = loop.create_future()
+                channel.waiters.add((loop, future))
+        if lost:
+            # The client fell further behind than the buffer reaches
+            yield format_event({"doctor_id": doctor_id}, last_seq, event='reset')
+            continue
+        if pending:
+            for seq, data in pending:
+                yield format_event(data, seq)
+            last_seq = pending[-1][0]
+            continue
+        try:
+            await asyncio.wait_for(future, heartbeat)
+        except asyncio.TimeoutError:
+            yield ': keep-alive\n\n'
+        finally:
+            with _lock:
+                channel.waiters.discard((loop, future))
@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from .cache_versions import bump_version, current_version
+from .models import Appointment, ArchivedAppointment
+
+
+def _version_key(doctor_id):
+    return f"doctor-stats:{doctor_id}:version"
+
+
+def invalidate_doctor_stats(doctor_id):
+    # Moving the version makes every cached range for this doctor unreachable
+    bump_version(_version_key(doctor_id))
+
+
+def compute_doctor_stats(doctor_id, start=None, end=None):
+    # One query over the hot table and its archive together. Written as SQL
+    # because the ORM cannot aggregate with filters over a union.
+    parts, params = [], []
+    for model in (Appointment, ArchivedAppointment):
+        appointments = model.objects.filter(doctor_id=doctor_id)
+        if start:
+            appointments = appointments.filter(date__gte=start)
+        if end:
+            appointments = appointments.filter(date__lte=end)
+        sql, part_params = appointments.values_list('status', 'patient_id').query.sql_with_params()
+        parts.append(sql)
+        params += part_params
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT COUNT(*),"
+            " COUNT(CASE WHEN status = 'completed' THEN 1 END),"
+            " COUNT(CASE WHEN status = 'confirmed' THEN 1 END),"
+            " COUNT(DISTINCT CASE WHEN status = 'completed' THEN patient_id END)"
+            f" FROM ({' UNION ALL '.join(parts)}) appointments",
+            params,
+        )
+        row = cursor.fetchone()
+    return dict(zip(('total_appointments', 'completed_appointments', 'pending_appointments', 'total_patients'), row))
+
+
+def doctor_stats(doctor_id, start=None, end=None):
+    timeout = getattr(settings, 'DOCTOR_STATS_CACHE_TIMEOUT', None)
+    if not timeout:
+        return compute_doctor_stats(doctor_id, start, end)
+    key = f"doctor-stats:{doctor_id}:{current_version(_version_key(doctor_id))}:{start}:{end}"
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_doctor_stats(doctor_id, start, end)
+        cache.set(key, stats, timeout)
+    return stats
@@ -0,0 +1,218 @@
+"""
+Durable background tasks.
+
+Work that need not finish inside a request (bill creation, appointment
+reminders, daily retention, bulk user imports) is written to the Task
+table by `enqueue`, in the caller's transaction, so a task exists exactly
+when the change that asked for it is committed. `manage.py run_workers`
+drains the table with a thread pool.
+
+Workers claim a task with one conditional UPDATE, like claim_slot, so any
+number of worker processes can share the table without row locks. A task's
+handler runs in one transaction with marking it done, so a retry never
+sees half of an earlier attempt; handlers registered with atomic=False
+commit their own progress instead and must resume safely. Failed tasks are
+retried with exponential backoff until they have run `max_attempts` times
+and are then left as failed. A task with an idempotency key is enqueued at
+most once per key.
+"""
+import datetime
+import logging
+import traceback
+from contextlib import nullcontext
+from contextvars import ContextVar
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from . import ledger, retention, user_import
+from .models import Appointment, Bill, ImportJob, Task
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+_running = ContextVar('running_task', default=None)
+
+
+def task(name, max_attempts=None, atomic=True):
+    """
+    Register the decorated function as the handler for tasks called `name`.
+    With atomic=False the handler runs outside a transaction, for long jobs
+    that commit in batches.
+    """
+    def register(func):
+        _handlers[name] = (func, max_attempts, atomic)
+        return func
+    return register
+
+
+def enqueue(name, payload=None, key=None, run_at=None):
+    """
+    Queue `name` to run with `payload` as keyword arguments at `run_at`
+    (now by default). When a task with `key` already exists it is
+    returned instead of queueing another.
+    """
+    if name not in _handlers:
+        raise LookupError(f"No task named {name!r}")
+    max_attempts = _handlers[name][1] or settings.TASK_MAX_ATTEMPTS
+    fields = dict(name=name, payload=payload or {}, key=key, max_attempts=max_attempts,
+                  run_at=run_at or timezone.now())
+    if key is None:
+        return Task.objects.create(**fields)
+    try:
+        with transaction.atomic():
+            return Task.objects.create(**fields)
+    except IntegrityError:
+        return Task.objects.get(key=key)
+
+
+def claim(limit, now=None):
+    """Mark up to `limit` due tasks as running for this worker and return them."""
+    now = now or timezone.now()
+    due = Task.objects.filter(status='queued', run_at__lte=now).order_by('run_at', 'id')
+    claimed = []
+    for pk in due.values_list('id', flat=True)[:limit]:
+        # Another worker may have taken it since the SELECT
+        if Task.objects.filter(id=pk, status='queued').update(status='running', locked_at=now,
+                                                              attempts=F('attempts') + 1):
+            claimed.append(pk)
+    return list(Task.objects.filter(id__in=claimed).order_by('run_at', 'id'))
+
+
+def backoff(attempts):
+    return min(settings.TASK_RETRY_BACKOFF * 2 ** (attempts - 1), settings.TASK_RETRY_BACKOFF_MAX)
+
+
+def run(claimed):
+    """Run one claimed task and record the outcome. Returns True on success."""
+    handler, _, atomic = _handlers.get(claimed.name, (None, None, True))
+    running = Task.objects.filter(id=claimed.id, status='running')
+    token = _running.set(claimed.id)
+    try:
+        if handler is None:
+            raise LookupError(f"No task named {claimed.name!r}")
+        with transaction.atomic() if atomic else nullcontext():
+            handler(**claimed.payload)
+            running.update(status='done', finished_at=timezone.now(), last_error='')
+        return True
+    except Exception as e:
+        logger.exception("Task %s failed (attempt %d of %d)", claimed, claimed.attempts, claimed.max_attempts)
+        error = ''.join(traceback.format_exception_only(e)).strip()
+        now = timezone.now()
+        if claimed.attempts >= claimed.max_attempts:
+            running.update(status='failed', finished_at=now, last_error=error)
+        else:
+            retry_at = now + datetime.timedelta(seconds=backoff(claimed.attempts))
+            running.update(status='queued', run_at=retry_at, locked_at=None, last_error=error)
+        return False
+    finally:
+        _running.reset(token)
+
+
+def heartbeat():
+    """
+    Keep the task being run from looking stale to requeue_stale. Handlers
+    that run longer than TASK_STALE_AFTER call this between batches.
+    """
+    task_id = _running.get()
+    if task_id is not None:
+        Task.objects.filter(id=task_id, status='running').update(locked_at=timezone.now())
+
+
+def requeue_stale(now=None):
+    """Put back tasks whose worker died mid-run (running for over TASK_STALE_AFTER seconds)."""
+    now = now or timezone.now()
+    cutoff = now - datetime.timedelta(seconds=settings.TASK_STALE_AFTER)
+    return Task.objects.filter(status='running', locked_at__lt=cutoff).update(status='queued', locked_at=None)
+
+
+def prune(before):
+    """Delete finished tasks older than `before`; failed ones are kept for inspection."""
+    return Task.objects.filter(status='done', finished_at__lt=before).delete()[0]
+
+
+def drain(limit=None):
+    """Run due tasks one by one in this thread until none are left (or `limit` ran)."""
+    ran = 0
+    while limit is None or ran < limit:
+        batch = claim(1)
+        if not batch:
+            break
+        run(batch[0])
+        ran += 1
+    return ran
+
+
+def queue_stats(now=None):
+    """Task counts by status, queued tasks already due, and how late the oldest of them is."""
+    now = now or timezone.now()
+    due = Q(status='queued', run_at__lte=now)
+    stats = Task.objects.filter(status__in=('queued', 'running', 'failed')).aggregate(
+        queued=Count('id', filter=Q(status='queued')),
+        running=Count('id', filter=Q(status='running')),
+        failed=Count('id', filter=Q(status='failed')),
+        due=Count('id', filter=due),
+        oldest_due=Min('run_at', filter=due),
+    )
+    oldest = stats.pop('oldest_due')
+    stats['lag_seconds'] = (now - oldest).total_seconds() if oldest else 0.0
+    return stats
+
+
+def enqueue_booking_work(appointment):
+    """Queue the side effects of a new booking: its bill and its reminder."""
+    # The fee as booked, not as it is whenever the worker (or a retry) gets to it
+    enqueue('bill.create', {'appointment_id': appointment.id, 'fee_amount': str(appointment.doctor.fee_amount)},
+            key=f'bill:{appointment.id}')
+    starts = timezone.make_aware(datetime.datetime.combine(appointment.date, appointment.time))
+    if starts > timezone.now():
+        remind_at = max(starts - datetime.timedelta(seconds=settings.APPOINTMENT_REMINDER_LEAD), timezone.now())
+        enqueue('appointment.remind', {'appointment_id': appointment.id},
+                key=f'reminder:{appointment.id}', run_at=remind_at)
+
+
+@task('bill.create')
+def create_bill(appointment_id, fee_amount=None):
+    appointment = Appointment.objects.select_related('doctor').filter(id=appointment_id).first()
+    if appointment is None or Bill.objects.filter(appointment_id=appointment_id).exists():
+        return
+    # Tasks queued before the fee was part of the payload bill the current fee
+    amount = Decimal(fee_amount) if fee_amount is not None else appointment.doctor.fee_amount
+    bill = Bill.objects.create(appointment=appointment, amount=amount)
+    ledger.record_bill(bill, appointment.doctor_id)
+
+
+@task('appointment.remind', max_attempts=3)
+def send_reminder(appointment_id):
+    appointment = Appointment.objects.select_related('patient', 'doctor__user').filter(id=appointment_id).first()
+    if appointment is None or appointment.status != 'confirmed' or not appointment.patient.email:
+        return
+    send_mail(
+        "Appointment reminder",
+        f"Dear {appointment.patient.username}, this is a reminder of your appointment with "
+        f"{appointment.doctor_name} on {appointment.date} at {appointment.time:%H:%M}.",
+        None,
+        [appointment.patient.email],
+    )
+
+
+@task('retention.apply', atomic=False)
+def apply_retention():
+    # apply() commits each batch itself, so this runs outside the task transaction.
+    # Bounded so one task does not hold a worker for long; the rest is queued behind it
+    if not retention.apply(max_batches=settings.RETENTION_TASK_BATCHES)['done']:
+        enqueue('retention.apply')
+
+
+@task('users.import', max_attempts=3, atomic=False)
+def import_users(job_id):
+    # Commits per chunk; a retry carries on from the job's checkpoint
+    try:
+        user_import.run(ImportJob.objects.get(id=job_id), on_chunk=lambda job: heartbeat())
+    except user_import.JobBusy:
+        # Finished, or still being imported by the run this task was requeued behind
+        logger.info("Skipping import job %s: already finished or running", job_id)
@@ -1,3 +1,1192 @@
-from django.test import TestCase
+import asyncio
+import csv
+import datetime
+import json
+import re
+import tempfile
+import threading
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import global_settings, settings
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from django.db import connection
+from django.db.models import Q
+from django.http import HttpResponse
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIRequestFactory
+
+from . import authentication, ledger, metrics, retention, slot_calendar, slot_events, tasks, user_import
+from .authentication import SignedTokenAuthentication
+from .models import (
+    User, Doctor, Patient, Appointment, ArchivedAppointment, ArchivedBill, Bill, DoctorSlot, ImportJob,
+    MedicalRecord, SlotCalendar, Task, parse_fee,
+)
+from .serializers import ImportRowSerializer
+from .services import SlotUnavailable, book_appointment, generate_slots, pay_bill
+from .user_counts import prefix_filter
+
+
+def make_doctor(username='doc', fee='PKR 2000'):
+    user = User.objects.create(username=username, category='doctor')
+    return Doctor.objects.create(user=user, specialty='General', fee=fee)
+
+
+def make_patient(username='pat'):
+    user = User.objects.create(username=username, category='patient')
+    Patient.objects.create(user=user, gender='Other', blood_group='O+')
+    return user
+
+
+class AppointmentPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = make_doctor()
+        cls.patient = make_patient()
+        day = datetime.date(2025, 1, 1)
+        Appointment.objects.bulk_create([
+            Appointment(patient=cls.patient, doctor=cls.doctor,
+                        date=day + datetime.timedelta(days=i // 3),
+                        time=datetime.time(9 + i % 2))
+            for i in range(12)
+        ])
+
+    def test_pages_cover_every_row_once_in_order(self):
+        url = reverse('appointment-list') + '?page_size=5'
+        seen = []
+        while url:
+            with self.assertNumQueries(1):
+                body = self.client.get(url).json()
+            seen.extend(body['results'])
+            url = body['next']
+        self.assertEqual(len(seen), 12)
+        self.assertEqual(len({a['id'] for a in seen}), 12)
+        keys = [(a['date'], a['time'], a['id']) for a in seen]
+        self.assertEqual(keys, sorted(keys, reverse=True))
+        self.assertEqual(seen[0]['doctor_name'], 'doc')
+
+    def test_invalid_cursor_is_404(self):
+        response = self.client.get(reverse('appointment-list') + '?cursor=garbage')
+        self.assertEqual(response.status_code, 404)
+
+    def test_patient_feed_is_paginated(self):
+        url = reverse('patient-appointments', args=[self.patient.id])
+        body = self.client.get(url + '?page_size=20').json()
+        self.assertEqual(len(body['results']), 12)
+        self.assertIsNone(body['next'])
+
+
+class BookingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = make_doctor(fee='PKR 3500')
+        cls.patient = make_patient()
+        cls.slot = DoctorSlot.objects.create(doctor=cls.doctor, date='2025-02-01', time='10:00')
+
+    def book(self, **extra):
+        data = {'patient': self.patient.id, 'doctor': self.doctor.id, 'date': '2025-02-01', 'time': '10:00'}
+        data.update(extra)
+        return self.client.post(reverse('appointment-create'), data, content_type='application/json')
+
+    def test_booking_claims_slot_and_bills_fee(self):
+        response = self.book()
+        self.assertEqual(response.status_code, 201)
+        self.slot.refresh_from_db()
+        self.assertTrue(self.slot.is_booked)
+        self.assertFalse(Bill.objects.exists())
+        tasks.drain()
+        bill = Bill.objects.get(appointment_id=response.json()['appointment']['id'])
+        self.assertEqual(bill.amount, Decimal('3500'))
+
+    def test_second_booking_is_rejected(self):
+        self.assertEqual(self.book().status_code, 201)
+        response = self.book()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_booking_without_slot_is_allowed(self):
+        self.assertEqual(self.book(time='11:00').status_code, 201)
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    attempts = 8
+
+    def test_exactly_one_parallel_booking_wins(self):
+        doctor = make_doctor()
+        patient = make_patient()
+        DoctorSlot.objects.create(doctor=doctor, date='2025-02-01', time='10:00')
+        barrier = threading.Barrier(self.attempts)
+        outcomes = []
+
+        def attempt():
+            try:
+                barrier.wait()
+                book_appointment(patient=patient, doctor=doctor,
+                                 date=datetime.date(2025, 2, 1), time=datetime.time(10))
+                outcomes.append('booked')
+            except SlotUnavailable:
+                outcomes.append('rejected')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=attempt) for _ in range(self.attempts)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(outcomes.count('booked'), 1)
+        self.assertEqual(outcomes.count('rejected'), self.attempts - 1)
+        self.assertEqual(Appointment.objects.count(), 1)
+        tasks.drain()
+        self.assertEqual(Bill.objects.count(), 1)
+
+
+class BulkSlotTests(TestCase):
+    def test_rule_is_expanded_and_rerun_skips_existing(self):
+        doctors = [make_doctor('a'), make_doctor('b')]
+        DoctorSlot.objects.create(doctor=doctors[0], date='2025-03-03', time='09:00')
+        rule = {
+            'start_date': '2025-03-03', 'end_date': '2025-03-09',
+            'weekdays': [0, 2], 'exclude_dates': ['2025-03-05'],
+            'start_time': '09:00', 'end_time': '10:00', 'slot_minutes': 20,
+        }
+        url = reverse('doctor-slots-bulk')
+        body = self.client.post(url, rule, content_type='application/json').json()
+        # Monday 3rd only (Wednesday 5th excluded): 3 slots x 2 doctors, one pre-existing
+        self.assertEqual((body['created'], body['skipped']), (5, 1))
+        self.assertEqual(DoctorSlot.objects.count(), 6)
+
+        body = self.client.post(url, {'schedules': [rule]}, content_type='application/json').json()
+        self.assertEqual((body['created'], body['skipped']), (0, 6))
+
+    def test_counts_ignore_other_writes_in_the_range(self):
+        doctor = make_doctor()
+        rule = {'doctor_ids': [doctor.id], 'start_date': datetime.date(2025, 3, 3), 'end_date': datetime.date(2025, 3, 3),
+                'weekdays': [0], 'start_time': datetime.time(9), 'end_time': datetime.time(10), 'slot_minutes': 30}
+        bulk_create = DoctorSlot.objects.bulk_create
+
+        def with_concurrent_insert(batch, **kwargs):
+            # Another request adds a slot outside the rule while this one runs
+            DoctorSlot.objects.get_or_create(doctor=doctor, date=datetime.date(2025, 3, 3), time=datetime.time(15))
+            return bulk_create(batch, **kwargs)
+
+        with mock.patch.object(DoctorSlot.objects, 'bulk_create', with_concurrent_insert):
+            self.assertEqual(generate_slots(rule, batch_size=1), (2, 0))
+
+    def test_invalid_rule_is_rejected(self):
+        rule = {'start_date': '2025-03-09', 'end_date': '2025-03-03',
+                'start_time': '09:00', 'end_time': '10:00', 'slot_minutes': 20}
+        response = self.client.post(reverse('doctor-slots-bulk'), rule, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class RevenueLedgerTests(TestCase):
+    def test_booking_and_payment_update_ledger(self):
+        doctor = make_doctor(fee='PKR 1500.50')
+        patient = make_patient()
+        url = reverse('appointment-create')
+        for hour in ('10:00', '11:00'):
+            self.client.post(url, {'patient': patient.id, 'doctor': doctor.id, 'date': '2025-02-01', 'time': hour},
+                             content_type='application/json')
+        tasks.drain()
+        bill = Bill.objects.first()
+        pay = reverse('bill-pay', args=[bill.id])
+        self.client.put(pay)
+        self.client.put(pay)
+
+        stats = self.client.get(reverse('admin-stats')).json()
+        self.assertEqual(stats['total_revenue'], 1500.5)
+        self.assertEqual(stats['revenue']['bill_count'], 2)
+        self.assertEqual(stats['revenue']['paid_count'], 1)
+        self.assertEqual(len(stats['revenue']['series']), 1)
+        self.assertEqual(ledger.verify(), [])
+
+        for query in ({'start': 'bad'}, {'doctor_id': 'x'}, {'period': 'year'}):
+            response = self.client.get(reverse('admin-stats'), query)
+            self.assertEqual(response.status_code, 400, query)
+            self.assertIn(next(iter(query)), response.json())
+
+    def test_rebuild_matches_bills(self):
+        doctor = make_doctor()
+        patient = make_patient()
+        appointment = Appointment.objects.create(patient=patient, doctor=doctor, date='2025-02-01', time='10:00')
+        Bill.objects.create(appointment=appointment, amount=Decimal('10.25'), status='paid')
+        self.assertEqual(len(ledger.verify()), 2)
+        call_command('rebuild_revenue_ledger', stdout=StringIO())
+        self.assertEqual(ledger.verify(), [])
+        self.assertEqual(ledger.totals()['paid_amount'], Decimal('10.25'))
+
+    def test_deletes_take_bills_out_of_ledger(self):
+        doctor = make_doctor()
+        patients = [make_patient('pat1'), make_patient('pat2')]
+        appointments = [
+            book_appointment(patient=patient, doctor=doctor, date=datetime.date(2025, 2, 1), time=datetime.time(hour))
+            for patient, hour in ((patients[0], 10), (patients[0], 11), (patients[1], 12))
+        ]
+        tasks.drain()
+        pay_bill(appointments[0].bill.id)
+
+        self.client.delete(reverse('appointment-delete', args=[appointments[0].id]))
+        self.assertEqual(ledger.verify(), [])
+        self.assertEqual(ledger.totals()['bill_count'], 2)
+        self.client.delete(reverse('admin-user-detail', args=[patients[0].id]))
+        self.assertEqual(ledger.verify(), [])
+        self.client.delete(reverse('admin-user-detail', args=[doctor.user_id]))
+        self.assertEqual(ledger.verify(), [])
+        self.assertEqual(ledger.totals()['bill_count'], 0)
+
+
+class DoctorStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        for day, state in (('2025-01-01', 'completed'), ('2025-01-02', 'completed'), ('2025-02-01', 'confirmed')):
+            Appointment.objects.create(patient=self.patient, doctor=self.doctor, date=day, time='10:00', status=state)
+        self.url = reverse('doctor-stats', args=[self.doctor.id])
+
+    def test_single_query_and_date_range(self):
+        with self.assertNumQueries(1):
+            stats = self.client.get(self.url).json()
+        self.assertEqual(stats, {'total_appointments': 3, 'completed_appointments': 2,
+                                 'pending_appointments': 1, 'total_patients': 1})
+        stats = self.client.get(self.url + '?start=2025-02-01').json()
+        self.assertEqual(stats['total_appointments'], 1)
+        self.assertEqual(self.client.get(self.url + '?start=soon').status_code, 400)
+
+    def test_cache_is_invalidated_by_updates(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+        appointment = Appointment.objects.get(status='confirmed')
+        self.client.put(reverse('appointment-update', args=[appointment.id]), {'status': 'completed'},
+                        content_type='application/json')
+        self.assertEqual(self.client.get(self.url).json()['completed_appointments'], 3)
+
+
+@skipUnless(connection.vendor == 'sqlite', "plan assertions are written against SQLite's EXPLAIN QUERY PLAN")
+class QueryPlanTests(TestCase):
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        for line in plan.splitlines():
+            if 'SCAN' in line and 'USING' not in line:
+                self.fail(f"full table scan in plan for {queryset.query}:\n{plan}")
+        self.assertNotIn('TEMP B-TREE', plan, f"sort not served by an index:\n{plan}")
+        self.assertIn('INDEX', plan)
+
+    def test_hot_queries_use_indexes(self):
+        keyset = ('-date', '-time', '-id')
+        cursor = Q(date__lt='2025-01-01') | Q(date='2025-01-01', time__lt='10:00')
+        querysets = [
+            Appointment.objects.order_by(*keyset)[:50],
+            Appointment.objects.filter(cursor).order_by(*keyset)[:50],
+            Appointment.objects.filter(patient_id=1).order_by(*keyset)[:50],
+            Appointment.objects.filter(doctor_id=1).order_by(*keyset)[:50],
+            Appointment.objects.filter(doctor_id=1, status='completed').values('patient_id').distinct(),
+            Appointment.objects.filter(doctor_id=1, date='2025-01-01', time='10:00'),
+            DoctorSlot.objects.filter(doctor_id=1, is_booked=False),
+            DoctorSlot.objects.filter(doctor_id=1, date='2025-01-01', time='10:00', is_booked=False),
+            DoctorSlot.objects.filter(is_booked=False, date__gte='2025-01-01', date__lte='2025-01-14')
+            .order_by('date', 'time', 'id')[:10],
+            Bill.objects.filter(status='paid'),
+            Bill.objects.filter(appointment__patient_id=1),
+            Bill.objects.order_by('-created_at')[:50],
+            MedicalRecord.objects.filter(patient_id=1).order_by('-date', '-id')[:50],
+            MedicalRecord.objects.filter(patient__user_id=1).order_by('-date', '-id')[:50],
+            MedicalRecord.objects.order_by('-date', '-id')[:50],
+            User.objects.filter(category='patient').order_by('-id')[:50],
+            User.objects.filter(category='patient', id__lt=100).order_by('-id')[:50],
+            User.objects.filter(prefix_filter('phone', '0300')),
+            User.objects.filter(prefix_filter('username', 'pat')),
+        ]
+        for queryset in querysets:
+            with self.subTest(query=str(queryset.query)):
+                self.assertUsesIndex(queryset)
+
+
+class TokenAuthTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_patient()
+        self.user.set_password('s3cret-pass')
+        self.user.save()
+
+    def login(self):
+        response = self.client.post(reverse('login'), {'username': 'pat', 'password': 's3cret-pass'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return SignedTokenAuthentication().authenticate(request)
+
+    def test_access_token_resolves_user_without_queries(self):
+        body = self.login()
+        self.assertEqual(body['patient_id'], self.user.patient_profile.id)
+        with self.assertNumQueries(0):
+            user, _ = self.authenticate(body['token'])
+        self.assertEqual((user.id, user.category, user.patient_id), (self.user.id, 'patient', body['patient_id']))
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(body['token'] + 'x')
+
+    def test_refresh_rotates_and_logout_revokes(self):
+        body = self.login()
+        url = reverse('token-refresh')
+        rotated = self.client.post(url, {'refresh': body['refresh']}, content_type='application/json')
+        self.assertEqual(rotated.status_code, 200)
+        replay = self.client.post(url, {'refresh': body['refresh']}, content_type='application/json')
+        self.assertEqual(replay.status_code, 401)
+
+        rotated = rotated.json()
+        self.client.post(reverse('logout'), {'refresh': rotated['refresh']}, content_type='application/json')
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(rotated['token'])
+        response = self.client.post(url, {'refresh': rotated['refresh']}, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_concurrent_refreshes_mint_one_pair(self):
+        refresh = self.login()['refresh']
+        payload = authentication.load_refresh_token(refresh)
+        # Both requests passed the revocation check before either rotated the token
+        with mock.patch.object(authentication, 'load_refresh_token', return_value=payload):
+            authentication.refresh_tokens(refresh)
+            with self.assertRaises(AuthenticationFailed):
+                authentication.refresh_tokens(refresh)
+
+
+class SlotSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cheap = make_doctor('cheap', fee='PKR 1000')
+        cls.pricey = make_doctor('pricey', fee='PKR 5000')
+        cls.pricey.specialty = 'Cardiology'
+        cls.pricey.save()
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        for doctor, day, hour, booked in [
+            (cls.cheap, tomorrow, 9, False), (cls.cheap, tomorrow, 10, True),
+            (cls.pricey, tomorrow, 8, False), (cls.pricey, tomorrow, 11, False),
+            (cls.cheap, yesterday, 9, False),
+        ]:
+            DoctorSlot.objects.create(doctor=doctor, date=day, time=datetime.time(hour), is_booked=booked)
+
+    def search(self, **params):
+        return self.client.get(reverse('slot-search'), params).json()['slots']
+
+    def test_earliest_open_future_slots_across_doctors(self):
+        with self.assertNumQueries(1):
+            slots = self.search(limit=2)
+        self.assertEqual([(s['doctor_name'], s['time']) for s in slots], [('pricey', '08:00:00'), ('cheap', '09:00:00')])
+
+    def test_filters(self):
+        self.assertEqual({s['doctor_name'] for s in self.search(max_fee=2000)}, {'cheap'})
+        self.assertEqual({s['doctor_name'] for s in self.search(specialty='cardiology')}, {'pricey'})
+        self.assertEqual([s['time'] for s in self.search(time_from='10:00')], ['11:00:00'])
+
+    def test_order_by_fee(self):
+        slots = self.search(order='fee')
+        self.assertEqual([s['doctor_name'] for s in slots], ['cheap', 'pricey', 'pricey'])
+
+    def test_public_slots_hide_past_slots(self):
+        body = self.client.get(reverse('doctor-slots-public', args=[self.cheap.id])).json()
+        self.assertEqual(len(body['slots']), 1)
+
+
+class DoctorFeeTests(TestCase):
+    def test_parse_fee(self):
+        self.assertEqual(parse_fee('PKR 2,000'), (Decimal('2000'), 'PKR'))
+        self.assertEqual(parse_fee('usd 45.50'), (Decimal('45.50'), 'USD'))
+        self.assertEqual(parse_fee('1500'), (Decimal('1500'), 'PKR'))
+        self.assertEqual(parse_fee('free'), (Decimal('2000'), 'PKR'))
+        self.assertEqual(parse_fee('Consultation: USD50'), (Decimal('50'), 'USD'))
+        for text in ('Fees 1500', 'Fee 1500', 'Per 1500', '1500 per visit'):
+            self.assertEqual(parse_fee(text), (Decimal('1500'), 'PKR'), text)
+        self.assertEqual(parse_fee('1500 usd'), (Decimal('1500'), 'USD'))
+        with self.assertRaises(ValueError):
+            parse_fee('PKR 99999999999')
+
+    def test_fee_columns_follow_text_and_drive_list_filters(self):
+        for name, fee in (('a', 'PKR 3000'), ('b', 'PKR 1000'), ('c', 'PKR 2000')):
+            make_doctor(name, fee=fee)
+        doctor = Doctor.objects.get(user__username='c')
+        self.client.put(reverse('doctor-profile', args=[doctor.id]), {'fee': 'PKR 500'},
+                        content_type='application/json')
+        doctor.refresh_from_db()
+        self.assertEqual(doctor.fee_amount, Decimal('500'))
+        response = self.client.put(reverse('doctor-profile', args=[doctor.id]), {'fee': 'PKR 99999999999'},
+                                   content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post(reverse('signup'), {
+            'username': 'd', 'password': 'pw', 'phone': '1', 'category': 'doctor', 'fee': 'PKR 1000000000'
+        }).status_code, 400)
+
+        url = reverse('doctor-list')
+        body = self.client.get(url, {'ordering': 'fee', 'max_fee': 2500}).json()
+        self.assertEqual([d['user']['username'] for d in body], ['c', 'b'])
+        self.assertEqual(self.client.get(url, {'max_fee': 'cheap'}).status_code, 400)
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = make_doctor()
+        cls.patient = make_patient()
+        cls.appointments = [
+            book_appointment(patient=cls.patient, doctor=cls.doctor, date=datetime.date(2025, 1, day), time=datetime.time(10))
+            for day in (1, 2, 3)
+        ]
+        tasks.drain()
+
+    def read(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_and_ndjson(self):
+        text = self.read(self.client.get(reverse('appointment-export'), {'end': '2025-01-02'}))
+        rows = list(csv.DictReader(StringIO(text)))
+        self.assertEqual([r['date'] for r in rows], ['2025-01-01', '2025-01-02'])
+        self.assertEqual(rows[0]['doctor_name'], 'doc')
+
+        text = self.read(self.client.get(reverse('bill-export'), {'format': 'ndjson'}))
+        bills = [json.loads(line) for line in text.splitlines()]
+        self.assertEqual(len(bills), 3)
+        self.assertEqual(bills[0]['amount'], '2000.00')
+
+    def test_incremental_since(self):
+        first = self.appointments[0].id
+        text = self.read(self.client.get(reverse('appointment-export'), {'format': 'ndjson', 'since': first}))
+        self.assertEqual([json.loads(line)['id'] for line in text.splitlines()], [a.id for a in self.appointments[1:]])
+
+        before = timezone.now()
+        pay_bill(self.appointments[2].bill.id)
+        text = self.read(self.client.get(reverse('bill-export'), {'format': 'ndjson', 'since': before.isoformat()}))
+        self.assertEqual([json.loads(line)['status'] for line in text.splitlines()], ['paid'])
+
+        response = self.client.get(reverse('medical-record-export'), {'since': before.isoformat()})
+        self.assertEqual(response.status_code, 400)
+
+    def test_since_cursor_keeps_rows_sharing_a_timestamp(self):
+        stamp = timezone.now()
+        Bill.objects.update(updated_at=stamp)
+        first, *rest = Bill.objects.order_by('id').values_list('id', flat=True)
+        url = reverse('bill-export')
+        text = self.read(self.client.get(url, {'format': 'ndjson', 'since': f'{stamp.isoformat()},{first}'}))
+        self.assertEqual([json.loads(line)['id'] for line in text.splitlines()], rest)
+        text = self.read(self.client.get(url, {'format': 'ndjson', 'since': stamp.isoformat()}))
+        self.assertEqual(len(text.splitlines()), 3)
+        self.assertEqual(self.client.get(url, {'since': f'{stamp.isoformat()},x'}).status_code, 400)
+
+
+class SlotCalendarTests(TestCase):
+    def test_calendar_follows_slot_changes(self):
+        cache.clear()
+        doctor = make_doctor()
+        patient = make_patient()
+        today = datetime.date.today()
+        rule = {'start_date': str(today), 'end_date': str(today + datetime.timedelta(days=1)),
+                'start_time': '09:00', 'end_time': '10:00', 'slot_minutes': 30}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('doctor-slots-bulk'), rule, content_type='application/json')
+        self.assertEqual(SlotCalendar.objects.get(doctor=doctor, date=today).free_count, 2)
+
+        # refresh() invalidates the doctor list once its transaction commits
+        self.client.get(reverse('doctor-list'))
+        with self.captureOnCommitCallbacks(execute=True):
+            slot_calendar.refresh([doctor.id], today)
+            self.assertEqual(self.client.get(reverse('doctor-list'))['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get(reverse('doctor-list'))['X-Cache'], 'MISS')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('appointment-create'), {
+                'patient': patient.id, 'doctor': doctor.id, 'date': str(today), 'time': '09:30'
+            }, content_type='application/json')
+        day = SlotCalendar.objects.get(doctor=doctor, date=today)
+        self.assertEqual((day.free_count, day.booked_count), (1, 1))
+
+        with self.assertNumQueries(2):
+            body = self.client.get(reverse('doctor-list')).json()
+        self.assertEqual(body[0]['availability']['free'][:3], [1, 2, 0])
+
+        appointment_id = response.json()['appointment']['id']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse('appointment-delete', args=[appointment_id]))
+        self.assertEqual(SlotCalendar.objects.get(doctor=doctor, date=today).free_count, 2)
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        caches['responses'].clear()
+        self.doctor = make_doctor()
+
+    def test_hit_then_invalidated_by_model_change(self):
+        url = reverse('doctor-list')
+        first = self.client.get(url)
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual((second['X-Cache'], second.content), ('HIT', first.content))
+
+        self.doctor.specialty = 'Dermatology'
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.doctor.save()
+            # Not before the commit, or a concurrent read could cache the old row again
+            self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+        self.assertEqual(len(callbacks), 1)
+        third = self.client.get(url)
+        self.assertEqual(third['X-Cache'], 'MISS')
+        self.assertEqual(third.json()[0]['specialty'], 'Dermatology')
+
+    def test_conditional_get_returns_304(self):
+        url = reverse('doctor-profile', args=[self.doctor.id])
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_booking_invalidates_public_slots(self):
+        patient = make_patient()
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        DoctorSlot.objects.create(doctor=self.doctor, date=tomorrow, time='10:00')
+        url = reverse('doctor-slots-public', args=[self.doctor.id])
+        self.assertEqual(len(self.client.get(url).json()['slots']), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            book_appointment(patient=patient, doctor=self.doctor, date=tomorrow, time=datetime.time(10))
+        self.assertEqual(self.client.get(url).json()['slots'], [])
+
+
+class BatchStatusTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        self.appointments = []
+        for day in (1, 2, 3):
+            DoctorSlot.objects.create(doctor=self.doctor, date=datetime.date(2025, 4, day), time='10:00')
+            self.appointments.append(book_appointment(
+                patient=self.patient, doctor=self.doctor, date=datetime.date(2025, 4, day), time=datetime.time(10)))
+
+    def post(self, data):
+        return self.client.post(reverse('appointment-batch'), data, content_type='application/json')
+
+    def test_cancel_by_ids_releases_slots(self):
+        ids = [a.id for a in self.appointments[:2]]
+        body = self.post({'status': 'cancelled', 'ids': ids + [999]}).json()
+        self.assertEqual(body['updated'], 2)
+        self.assertEqual(body['results'][-1], {'id': 999, 'result': 'not_found'})
+        self.assertEqual(DoctorSlot.objects.filter(is_booked=False).count(), 2)
+
+        body = self.post({'status': 'cancelled', 'ids': ids}).json()
+        self.assertEqual({r['result'] for r in body['results']}, {'unchanged'})
+
+    def test_cancel_doctor_date_range(self):
+        body = self.post({'status': 'cancelled', 'doctor_id': self.doctor.id,
+                          'date_from': '2025-04-02', 'date_to': '2025-04-03'}).json()
+        self.assertEqual(body['updated'], 2)
+        self.assertEqual(Appointment.objects.filter(status='cancelled').count(), 2)
+        self.assertEqual(self.post({'status': 'cancelled'}).status_code, 400)
+
+
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = make_doctor()
+        cls.patient = make_patient()
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        for hour in (9, 10, 11):
+            DoctorSlot.objects.create(doctor=cls.doctor, date=tomorrow, time=datetime.time(hour))
+        for hour in (9, 10):
+            book_appointment(patient=cls.patient, doctor=cls.doctor, date=tomorrow, time=datetime.time(hour))
+
+    async def test_async_endpoints_match_sync_ones(self):
+        for name, args in (('doctor-list', []), ('doctor-slots-public', [self.doctor.id]),
+                           ('patient-appointments', [self.patient.id]), ('doctor-appointments', [self.doctor.id]),
+                           ('bill-list', [])):
+            sync = (await self.async_client.get(reverse(name, args=args))).json()
+            response = await self.async_client.get(reverse(f'async-{name}', args=args))
+            self.assertEqual(response.status_code, 200, name)
+            self.assertEqual(response.json(), sync, name)
+
+    async def test_async_endpoints_apply_sparse_fields(self):
+        for name, args, fields in (('doctor-list', [], 'id,user.username'), ('bill-list', [], 'id,amount'),
+                                   ('doctor-appointments', [self.doctor.id], 'id,status')):
+            params = {'fields': fields}
+            sync = (await self.async_client.get(reverse(name, args=args), params)).json()
+            self.assertEqual((await self.async_client.get(reverse(f'async-{name}', args=args), params)).json(), sync)
+            response = await self.async_client.get(reverse(f'async-{name}', args=args), {'fields': 'nope'})
+            self.assertEqual(response.status_code, 400, name)
+
+    async def test_async_appointments_follow_cursor(self):
+        url = reverse('async-doctor-appointments', args=[self.doctor.id]) + '?page_size=1'
+        first = (await self.async_client.get(url)).json()
+        second = (await self.async_client.get(first['next'])).json()
+        self.assertIsNone(second['next'])
+        self.assertNotEqual(first['results'][0]['id'], second['results'][0]['id'])
+        response = await self.async_client.get(url + '&cursor=garbage')
+        self.assertEqual(response.status_code, 404)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.doctor = make_doctor()
+
+    @override_settings(METRICS_RESPONSE_HEADERS=True)
+    def test_records_queries_and_exposes_prometheus_text(self):
+        response = self.client.get(reverse('doctor-profile', args=[self.doctor.id]))
+        self.assertGreater(int(response['X-Query-Count']), 0)
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('clinic_http_requests_total{view="doctor-profile",method="GET",status="200"} 1', body)
+        self.assertIn('clinic_http_request_duration_seconds_count{view="doctor-profile",method="GET"} 1', body)
+        self.assertIn(f'clinic_db_queries_total{{view="doctor-profile"}} {response["X-Query-Count"]}', body)
+
+    @override_settings(METRICS_N_PLUS_ONE_THRESHOLD=2)
+    def test_flags_repeated_query_shape(self):
+        # The all-doctors slot list loads each slot's doctor separately
+        for hour in (9, 10, 11):
+            DoctorSlot.objects.create(doctor=self.doctor, date='2025-01-01', time=datetime.time(hour))
+        with self.assertLogs('makeAccount.metrics', 'WARNING'):
+            self.client.get(reverse('doctor-slots'))
+        self.assertIn('clinic_n_plus_one_total{view="doctor-slots"} 1', metrics.render())
+
+    def test_streamed_exports_count_queries_run_while_streaming(self):
+        response = self.client.get(reverse('appointment-export'), {'format': 'ndjson'})
+        self.assertNotIn('clinic_http_requests_total{view="appointment-export"', metrics.render())
+        body = b''.join(response.streaming_content)
+        response.close()
+        rendered = metrics.render()
+        self.assertIn('clinic_http_requests_total{view="appointment-export",method="GET",status="200"} 1', rendered)
+        self.assertIn(f'clinic_response_bytes_total{{view="appointment-export"}} {len(body)}', rendered)
+        queries = re.search(r'clinic_db_queries_total\{view="appointment-export"\} (\d+)', rendered)
+        self.assertGreater(int(queries.group(1)), 0)
+
+    def test_middleware_keeps_the_async_chain_async(self):
+        async def view(request):
+            return HttpResponse()
+        middleware = metrics.MetricsMiddleware(view)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        self.assertFalse(asyncio.iscoroutinefunction(metrics.MetricsMiddleware(lambda request: HttpResponse())))
+
+
+class SeedClinicTests(TestCase):
+    def test_seeds_consistent_clinic(self):
+        call_command('seed_clinic', doctors=3, patients=10, appointments=90, open_slots=12, records=5,
+                     batch_size=20, stdout=StringIO())
+        self.assertEqual(Doctor.objects.count(), 3)
+        self.assertEqual(Appointment.objects.count(), 90)
+        self.assertEqual(Bill.objects.count(), Appointment.objects.exclude(status='cancelled').count())
+        self.assertEqual(DoctorSlot.objects.filter(is_booked=False).count(),
+                         12 + Appointment.objects.filter(status='cancelled').count())
+        self.assertEqual(ledger.verify(), [])
+        self.assertEqual(
+            sum(SlotCalendar.objects.values_list('free_count', flat=True)),
+            DoctorSlot.objects.filter(is_booked=False).count()
+        )
+
+
+class RecordSearchTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = make_patient().patient_profile
+        self.other = make_patient('other').patient_profile
+        self.record = MedicalRecord.objects.create(
+            patient=self.patient, doctor=self.doctor, diagnosis='Migraine with aura',
+            prescription='Sumatriptan 50mg', tests=['MRI brain'])
+        MedicalRecord.objects.create(patient=self.other, doctor=self.doctor, diagnosis='Tension headaches',
+                                     prescription='Ibuprofen', notes='Migraine ruled out')
+
+    def get(self, **params):
+        return self.client.get(reverse('medical-record-search'), params)
+
+    def test_ranked_search_across_fields(self):
+        body = self.get(q='migraine').json()
+        self.assertEqual([r['diagnosis'] for r in body['results']], ['Migraine with aura', 'Tension headaches'])
+        self.assertGreaterEqual(body['results'][0]['rank'], body['results'][1]['rank'])
+        self.assertEqual([r['id'] for r in self.get(q='mri').json()['results']], [self.record.id])
+        self.assertEqual(len(self.get(q='headache').json()['results']), 1)
+        self.assertEqual(len(self.get(q='migraine', patient_id=self.other.id).json()['results']), 1)
+        self.assertEqual(self.get(q='"(').status_code, 400)
+
+    def test_index_follows_updates_and_deletes(self):
+        self.record.diagnosis = 'Cluster headache'
+        self.record.save()
+        self.assertEqual(len(self.get(q='aura').json()['results']), 0)
+        self.assertEqual(len(self.get(q='cluster').json()['results']), 1)
+        self.record.delete()
+        self.assertEqual(self.get(q='cluster').json()['results'], [])
+
+    def test_pages_and_rebuild(self):
+        body = self.get(q='migraine', page_size=1).json()
+        self.assertEqual(len(body['results']), 1)
+        self.assertEqual(len(self.client.get(body['next']).json()['results']), 1)
+        call_command('rebuild_record_search', stdout=StringIO())
+        self.assertEqual(len(self.get(q='migraine').json()['results']), 2)
+
+
+class MedicalRecordListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = make_doctor()
+        cls.user = make_patient()
+        cls.patient = cls.user.patient_profile
+        other = make_patient('other').patient_profile
+        for i in range(3):
+            MedicalRecord.objects.create(patient=cls.patient, doctor=cls.doctor, diagnosis=f'D{i}',
+                                         prescription='P', notes='long notes', tests=['CBC'])
+        MedicalRecord.objects.create(patient=other, doctor=cls.doctor, diagnosis='X', prescription='P')
+
+    def test_lookup_by_patient_or_user_id(self):
+        url = reverse('medical-record-list')
+        with self.assertNumQueries(1):
+            by_patient = self.client.get(url, {'patient_id': self.patient.id}).json()
+        by_user = self.client.get(url, {'user_id': self.user.id}).json()
+        self.assertEqual(by_patient, by_user)
+        self.assertEqual([r['diagnosis'] for r in by_patient['results']], ['D2', 'D1', 'D0'])
+        self.assertEqual(by_patient['results'][0]['doctor_name'], 'doc')
+        self.assertEqual(len(self.client.get(url).json()['results']), 4)
+        self.assertEqual(self.client.get(url, {'user_id': 'x'}).status_code, 400)
+
+    def test_fields_projection_and_pages(self):
+        url = reverse('medical-record-list')
+        body = self.client.get(url, {'patient_id': self.patient.id, 'fields': 'id,diagnosis', 'page_size': 2}).json()
+        self.assertEqual(set(body['results'][0]), {'id', 'diagnosis'})
+        rest = self.client.get(body['next']).json()
+        self.assertEqual([r['diagnosis'] for r in rest['results']], ['D0'])
+        self.assertEqual(self.client.get(url, {'fields': 'id,secret'}).status_code, 400)
+
+
+class SparseFieldsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = make_doctor()
+        for i in range(3):
+            make_patient(f'pat{i}')
+
+    def setUp(self):
+        caches['responses'].clear()
+
+    def test_nested_user_narrowed_in_one_query(self):
+        with self.assertNumQueries(1):
+            body = self.client.get(reverse('patient-list'), {'fields': 'id,user.username'}).json()
+        self.assertEqual(body[0], {'id': body[0]['id'], 'user': {'username': 'pat0'}})
+
+    def test_relations_collapse_to_ids_unless_expanded(self):
+        url = reverse('doctor-list')
+        with self.assertNumQueries(1):
+            body = self.client.get(url, {'fields': 'id,user,fee_amount'}).json()
+        self.assertEqual(body, [{'id': self.doctor.id, 'user': self.doctor.user_id, 'fee_amount': '2000.00'}])
+        body = self.client.get(url, {'fields': 'id,user', 'expand': 'user'}).json()
+        self.assertEqual(body[0]['user']['username'], 'doc')
+        self.assertEqual(self.client.get(url, {'fields': 'id,nope'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'fields': 'fee.amount'}).status_code, 400)
+        for fields in (',', 'id,,user', 'user.', 'user..username'):
+            self.assertEqual(self.client.get(url, {'fields': fields}).status_code, 400, fields)
+
+    def test_paginated_feed_keeps_cursor_fields(self):
+        patient = User.objects.get(username='pat0')
+        Appointment.objects.bulk_create([
+            Appointment(patient=patient, doctor=self.doctor, date='2025-01-01', time=datetime.time(h)) for h in (9, 10)
+        ])
+        url = reverse('appointment-list')
+        with self.assertNumQueries(1):
+            body = self.client.get(url, {'fields': 'id,status', 'page_size': 1}).json()
+        self.assertEqual(set(body['results'][0]), {'id', 'status'})
+        self.assertEqual(len(self.client.get(body['next']).json()['results']), 1)
+
+
+class ResponseEncodingTests(TestCase):
+    def setUp(self):
+        caches['responses'].clear()
+        for i in range(30):
+            make_doctor(f'doc{i}')
+
+    def test_fast_renderer_matches_drf(self):
+        from rest_framework.renderers import JSONRenderer
+        from .renderers import FastJSONRenderer
+        data = {'when': timezone.now(), 'day': datetime.date(2025, 1, 1), 'fee': Decimal('10.50'), 1: ['x']}
+        self.assertEqual(json.loads(FastJSONRenderer().render(data)), json.loads(JSONRenderer().render(data)))
+
+    def test_large_lists_are_gzipped(self):
+        response = self.client.get(reverse('doctor-list'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        small = self.client.get(reverse('doctor-profile', args=[Doctor.objects.first().id]), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(small.has_header('Content-Encoding'))
+
+
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        self.patient.email = 'pat@example.com'
+        self.patient.save()
+
+    def book(self, date, hour=10):
+        return book_appointment(patient=self.patient, doctor=self.doctor, date=date, time=datetime.time(hour))
+
+    def test_booking_queues_bill_and_reminder(self):
+        from django.core import mail
+        soon = timezone.localdate() + datetime.timedelta(days=3)
+        appointment = self.book(soon)
+        self.assertEqual(sorted(Task.objects.values_list('name', flat=True)), ['appointment.remind', 'bill.create'])
+        # A fee change before the worker runs does not reach the bill
+        self.doctor.fee = 'PKR 3000'
+        self.doctor.save()
+        self.assertEqual(tasks.drain(), 1)
+        self.assertEqual(Bill.objects.get(appointment=appointment).amount, Decimal('2000'))
+
+        # The reminder is due a day before the appointment
+        self.assertEqual(tasks.queue_stats()['queued'], 1)
+        Task.objects.filter(name='appointment.remind').update(run_at=timezone.now())
+        out = StringIO()
+        call_command('run_workers', once=True, threads=1, stdout=out)
+        self.assertIn('0 failed', out.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(str(soon), mail.outbox[0].body)
+
+    def test_idempotency_key(self):
+        appointment = self.book(datetime.date(2025, 1, 1))
+        again = tasks.enqueue('bill.create', {'appointment_id': appointment.id}, key=f'bill:{appointment.id}')
+        self.assertEqual(Task.objects.count(), 1)
+        self.assertEqual(again.key, f'bill:{appointment.id}')
+        tasks.drain()
+        tasks.create_bill(appointment.id)
+        self.assertEqual(Bill.objects.count(), 1)
+
+    @override_settings(TASK_MAX_ATTEMPTS=2, TASK_RETRY_BACKOFF=30)
+    def test_failures_back_off_then_give_up(self):
+        calls = []
+
+        @tasks.task('test.flaky')
+        def flaky(**payload):
+            calls.append(payload)
+            raise RuntimeError("boom")
+
+        self.addCleanup(tasks._handlers.pop, 'test.flaky')
+        queued = tasks.enqueue('test.flaky', {'n': 1})
+        with self.assertLogs('makeAccount.tasks', 'ERROR'):
+            tasks.drain()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('queued', 1))
+        self.assertIn('RuntimeError: boom', queued.last_error)
+        self.assertGreater(queued.run_at, timezone.now() + datetime.timedelta(seconds=20))
+        self.assertEqual(tasks.drain(), 0)
+
+        stats = tasks.queue_stats(now=queued.run_at + datetime.timedelta(seconds=5))
+        self.assertEqual((stats['due'], stats['lag_seconds']), (1, 5.0))
+        self.assertIn('clinic_task_queue_depth 0', self.client.get(reverse('metrics')).content.decode())
+
+        Task.objects.filter(id=queued.id).update(run_at=timezone.now())
+        with self.assertLogs('makeAccount.tasks', 'ERROR'):
+            tasks.drain()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, len(calls)), ('failed', 2))
+
+
+class SlotEventTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = make_doctor()
+        cls.patient = make_patient()
+        cls.day = timezone.localdate() + datetime.timedelta(days=1)
+        DoctorSlot.objects.create(doctor=cls.doctor, date=cls.day, time='10:00')
+
+    def test_booking_and_cancelling_publish_after_commit(self):
+        slot_events.publish(self.doctor.id, self.day, datetime.time(9), False)
+        before = len(slot_events._channels[self.doctor.id].events)
+        data = {'patient': self.patient.id, 'doctor': self.doctor.id, 'date': str(self.day), 'time': '10:00'}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('appointment-create'), data, content_type='application/json')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(reverse('appointment-update', args=[response.json()['appointment']['id']]),
+                            {'status': 'cancelled'}, content_type='application/json')
+        changes = [data['change'] for _, data in list(slot_events._channels[self.doctor.id].events)[before:]]
+        self.assertEqual(changes, ['booked', 'released'])
+
+    def test_batch_cancel_publishes_only_released_slots(self):
+        booked = book_appointment(patient=self.patient, doctor=self.doctor, date=self.day, time=datetime.time(10))
+        walk_in = book_appointment(patient=self.patient, doctor=self.doctor, date=self.day, time=datetime.time(11))
+        slot_events.publish(self.doctor.id, self.day, datetime.time(9), False)
+        before = len(slot_events._channels[self.doctor.id].events)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('appointment-batch'), {'status': 'cancelled', 'ids': [booked.id, walk_in.id]},
+                             content_type='application/json')
+        events = [data for _, data in list(slot_events._channels[self.doctor.id].events)[before:]]
+        self.assertEqual([(e['time'], e['change']) for e in events], [('10:00:00', 'released')])
+
+    async def test_stream_delivers_and_resumes(self):
+        url = reverse('doctor-slot-events', args=[self.doctor.id])
+        response = await self.async_client.get(url)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = response.streaming_content
+        self.assertTrue((await anext(stream)).startswith(b'retry:'))
+        waiting = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        # Published from a thread, as sync booking views do under ASGI
+        await asyncio.to_thread(slot_events.publish, self.doctor.id, self.day, datetime.time(10), True)
+        first = (await waiting).decode()
+        self.assertIn('"change": "booked"', first)
+        await stream.aclose()
+
+        slot_events.publish(self.doctor.id, self.day, datetime.time(11), False)
+        event_id = first.split('\n')[0][len('id: '):]
+        resumed = (await self.async_client.get(url, headers={'Last-Event-ID': event_id})).streaming_content
+        await anext(resumed)
+        self.assertIn('"time": "11:00:00"', (await anext(resumed)).decode())
+        await resumed.aclose()
+
+        stale = (await self.async_client.get(url, headers={'Last-Event-ID': 'gone-1'})).streaming_content
+        await anext(stale)
+        self.assertIn('event: reset', (await anext(stale)).decode())
+        await stale.aclose()
+
+    def test_wsgi_requests_are_refused(self):
+        response = self.client.get(reverse('doctor-slot-events', args=[self.doctor.id]))
+        self.assertEqual(response.status_code, 501)
+
+
+class RetentionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        today = timezone.localdate()
+        old = today - datetime.timedelta(days=400)
+        DoctorSlot.objects.bulk_create([
+            DoctorSlot(doctor=self.doctor, date=today - datetime.timedelta(days=1), time='09:00'),
+            DoctorSlot(doctor=self.doctor, date=today - datetime.timedelta(days=1), time='10:00', is_booked=True),
+            DoctorSlot(doctor=self.doctor, date=old, time='10:00', is_booked=True),
+            DoctorSlot(doctor=self.doctor, date=today + datetime.timedelta(days=1), time='09:00'),
+        ])
+        self.appointments = {}
+        for name, day, hour, state, bill in (
+            ('paid', old, 10, 'completed', 'paid'),
+            ('cancelled', old, 11, 'cancelled', None),
+            ('unpaid', old, 12, 'completed', 'unpaid'),
+            ('no_show', old, 13, 'confirmed', None),
+            ('recent', today, 9, 'completed', 'paid'),
+        ):
+            appointment = Appointment.objects.create(patient=self.patient, doctor=self.doctor, date=day,
+                                                     time=datetime.time(hour), status=state)
+            if bill:
+                Bill.objects.create(appointment=appointment, amount=Decimal('100'), status=bill)
+            self.appointments[name] = appointment
+        ledger.rebuild()
+        self.stats = self.client.get(reverse('doctor-stats', args=[self.doctor.id])).json()
+
+    def test_purges_slots_and_archives_settled_appointments(self):
+        out = StringIO()
+        call_command('apply_retention', dry_run=True, stdout=out)
+        self.assertIn('Would delete 2 slots', out.getvalue())
+        call_command('apply_retention', batch_size=1, stdout=StringIO())
+
+        self.assertEqual(DoctorSlot.objects.count(), 2)
+        self.assertFalse(DoctorSlot.objects.filter(date__lt=timezone.localdate(), is_booked=False).exists())
+        archived = {self.appointments[name].id for name in ('paid', 'cancelled')}
+        self.assertEqual(set(ArchivedAppointment.objects.values_list('id', flat=True)), archived)
+        self.assertEqual(Appointment.objects.count(), 3)
+        self.assertEqual(ArchivedBill.objects.get().appointment_id, self.appointments['paid'].id)
+        self.assertEqual(retention.pending()['appointments'], 0)
+
+        # History reads see both tables
+        cache.clear()
+        self.assertEqual(self.client.get(reverse('doctor-stats', args=[self.doctor.id])).json(), self.stats)
+        self.assertEqual(ledger.verify(), [])
+        served = self.client.get(reverse('served-patients', args=[self.doctor.id])).json()
+        self.assertEqual([p['user']['id'] for p in served], [self.patient.id])
+
+    def test_feeds_and_exports_merge_the_archive(self):
+        retention.apply()
+        url = reverse('patient-appointments', args=[self.patient.id])
+        self.assertEqual(len(self.client.get(url).json()['results']), 3)
+        seen, page = [], url + '?include_archived=1&page_size=2'
+        while page:
+            body = self.client.get(page).json()
+            seen += body['results']
+            page = body['next']
+        self.assertEqual([a['id'] for a in seen],
+                         sorted((a.id for a in self.appointments.values()), key=lambda pk: -pk))
+        self.assertEqual(seen[-1]['doctor_name'], 'doc')
+
+        bills = self.client.get(reverse('bill-list'), {'include_archived': 1}).json()
+        self.assertEqual(len(bills), 3)
+        for name, args in (('patient-appointments', [self.patient.id]), ('bill-list', [])):
+            params = {'include_archived': 1, 'fields': 'id'}
+            self.assertEqual(self.client.get(reverse(f'async-{name}', args=args), params).json(),
+                             self.client.get(reverse(name, args=args), params).json(), name)
+        response = self.client.get(reverse('appointment-export'), {'format': 'ndjson', 'include_archived': 1})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([r['id'] for r in rows], sorted(a.id for a in self.appointments.values()))
+
+    def test_workers_queue_retention_daily(self):
+        call_command('run_workers', once=True, threads=1, stdout=StringIO())
+        call_command('run_workers', once=True, threads=1, stdout=StringIO())
+        self.assertEqual(Task.objects.filter(name='retention.apply', status='done').count(), 1)
+        self.assertEqual(ArchivedAppointment.objects.count(), 2)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class UserImportTests(TestCase):
+    ROWS = [
+        {'username': 'ann', 'password': 'pw-ann', 'phone': '0300', 'category': 'patient', 'blood_group': 'A+'},
+        {'username': 'drbob', 'password': 'pw-bob', 'phone': '0301', 'category': 'doctor', 'specialty': 'ENT',
+         'fee': 'USD 50'},
+        {'username': 'bad name', 'password': 'x', 'phone': '0302', 'category': 'patient'},
+        {'username': 'ann', 'password': 'again', 'phone': '0303', 'category': 'patient'},
+        {'username': 'taken', 'password': 'x', 'phone': '0304', 'category': 'doctor'},
+        {'username': 'cy', 'password': 'pw-cy', 'phone': '0305', 'category': 'patient'},
+    ]
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        make_patient('taken')
+
+    def write(self, name, rows):
+        path = f'{self.dir.name}/{name}'
+        with open(path, 'w', newline='') as f:
+            if name.endswith('.csv'):
+                writer = csv.DictWriter(f, fieldnames=['username', 'password', 'phone', 'category', 'gender',
+                                                       'blood_group', 'specialty', 'fee'])
+                writer.writeheader()
+                writer.writerows(rows)
+            else:
+                f.write('\n'.join(json.dumps(row) for row in rows) + '\n[1]\n')
+        return path
+
+    def test_csv_import_creates_profiles_and_reports_rejects(self):
+        errors = f'{self.dir.name}/errors.ndjson'
+        out = StringIO()
+        call_command('import_users', self.write('users.csv', self.ROWS), workers=1, chunk_size=4,
+                     errors=errors, stdout=out)
+        self.assertIn('6 rows, 3 users created, 3 rows rejected', out.getvalue())
+
+        ann = User.objects.get(username='ann')
+        self.assertTrue(ann.check_password('pw-ann'))
+        self.assertEqual((ann.patient_profile.gender, ann.patient_profile.blood_group), ('Other', 'A+'))
+        bob = Doctor.objects.get(user__username='drbob')
+        self.assertEqual((bob.specialty, bob.fee_amount, bob.fee_currency), ('ENT', Decimal('50'), 'USD'))
+        with open(errors) as f:
+            rejected = [json.loads(line) for line in f]
+        self.assertEqual([(e['row'], e['username']) for e in rejected], [(3, 'bad name'), (4, 'ann'), (5, 'taken')])
+        self.assertEqual(rejected[2]['errors'], {'username': [user_import.DUPLICATE_USERNAME]})
+
+    def test_resume_after_failure_skips_committed_rows(self):
+        job = ImportJob.objects.create(source=self.write('users.ndjson', self.ROWS), format='ndjson')
+
+        def stop(job):
+            raise RuntimeError("disk full")
+        with self.assertRaises(RuntimeError):
+            user_import.run(job, workers=1, chunk_size=2, on_chunk=stop)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rows_done, job.last_error), ('failed', 2, 'disk full'))
+        self.assertEqual(User.objects.filter(username__in=['ann', 'drbob']).count(), 2)
+
+        call_command('import_users', resume=job.id, workers=1, chunk_size=2, stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rows_done, job.created_count, job.failed_count), ('done', 7, 3, 4))
+        self.assertEqual(User.objects.filter(username='ann').count(), 1)
+        self.assertEqual(job.row_errors.get(row=7).errors, {'non_field_errors': ['Expected a JSON object']})
+
+    def test_one_run_per_job(self):
+        job = ImportJob.objects.create(source=self.write('users.csv', self.ROWS), format='csv', status='running')
+        with self.assertRaises(user_import.JobBusy):
+            user_import.run(job, workers=1)
+        err = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('import_users', resume=job.id, workers=1, stdout=StringIO(), stderr=err)
+        self.assertEqual(User.objects.count(), 1)
+
+        # A run that stopped advancing is taken over
+        stale = timezone.now() - datetime.timedelta(seconds=settings.TASK_STALE_AFTER + 1)
+        ImportJob.objects.filter(id=job.id).update(updated_at=stale)
+        self.assertEqual(user_import.run(job, workers=1).created_count, 3)
+
+    def test_import_task_keeps_its_lock_fresh(self):
+        job = ImportJob.objects.create(source=self.write('users.csv', self.ROWS), format='csv')
+        task = tasks.enqueue('users.import', {'job_id': job.id})
+        claimed, = tasks.claim(1)
+        Task.objects.filter(id=task.id).update(locked_at=timezone.now() - datetime.timedelta(hours=1))
+        with override_settings(IMPORT_CHUNK_SIZE=2, IMPORT_WORKERS=1):
+            self.assertTrue(tasks.run(claimed))
+        task.refresh_from_db()
+        self.assertGreater(task.locked_at, timezone.now() - datetime.timedelta(minutes=1))
+        self.assertEqual(tasks.requeue_stale(), 0)
+
+    def test_upload_is_imported_by_a_worker(self):
+        with open(self.write('users.csv', self.ROWS[:2]), 'rb') as f:
+            upload = SimpleUploadedFile('users.csv', f.read())
+        with self.settings(IMPORT_ROOT=self.dir.name, IMPORT_WORKERS=1):
+            response = self.client.post(reverse('admin-user-import'), {'file': upload})
+            self.assertEqual(response.status_code, 202)
+            status_url = reverse('admin-user-import-status', args=[response.json()['job_id']])
+            self.assertEqual(self.client.get(status_url).json()['status'], 'queued')
+            self.assertEqual(tasks.drain(), 1)
+        body = self.client.get(status_url).json()
+        self.assertEqual((body['status'], body['created'], body['errors']['results']), ('done', 2, []))
+        self.assertTrue(User.objects.filter(username='drbob', category='doctor').exists())
+
+        bad = SimpleUploadedFile('users.xlsx', b'')
+        self.assertEqual(self.client.post(reverse('admin-user-import'), {'file': bad}).status_code, 400)
+        with self.settings(IMPORT_ROOT=self.dir.name, IMPORT_MAX_UPLOAD_SIZE=10):
+            big = SimpleUploadedFile('users.csv', b'username,password\n' * 10)
+            self.assertEqual(self.client.post(reverse('admin-user-import'), {'file': big}).status_code, 413)
+        self.assertFalse(ImportRowSerializer(data={**self.ROWS[0], 'category': 'admin'}).is_valid())
+        self.assertEqual(self.client.get(reverse('admin-user-import-status', args=[999])).status_code, 404)
+
+    def test_passwords_hashed_in_worker_processes(self):
+        job = ImportJob.objects.create(source=self.write('users.csv', self.ROWS[:2]), format='csv')
+        job = user_import.run(job, workers=2)
+        self.assertEqual(job.created_count, 2)
+        # The worker processes hash with the configured hashers, not this test's override
+        with self.settings(PASSWORD_HASHERS=global_settings.PASSWORD_HASHERS):
+            self.assertTrue(User.objects.get(username='drbob').check_password('pw-bob'))
+
+
+class UserManagementTests(TestCase):
+    def setUp(self):
+        self.users = [make_patient(f'pat{i}') for i in range(5)] + [make_doctor(f'doc{i}').user for i in range(2)]
+        User.objects.filter(username='pat3').update(phone='0300111')
+        self.url = reverse('admin-user-list')
+
+    def test_category_filter_with_keyset_pages(self):
+        seen, page = [], self.url + '?category=patient&page_size=2'
+        while page:
+            body = self.client.get(page).json()
+            self.assertEqual(body['count'], 5)
+            seen += body['results']
+            page = body['next']
+        self.assertEqual([u['username'] for u in seen], [f'pat{i}' for i in reversed(range(5))])
+        self.assertEqual(self.client.get(self.url).json()['count'], 7)
+        self.assertEqual(self.client.get(self.url, {'category': 'nurse'}).status_code, 400)
+
+    def test_prefix_search_on_username_and_phone(self):
+        body = self.client.get(self.url, {'q': 'doc'}).json()
+        self.assertEqual((body['count'], [u['username'] for u in body['results']]), (2, ['doc1', 'doc0']))
+        body = self.client.get(self.url, {'q': '0300', 'category': 'patient'}).json()
+        self.assertEqual([u['username'] for u in body['results']], ['pat3'])
+        self.assertEqual(self.client.get(self.url, {'q': 'at'}).json()['count'], 0)
+        # Pinned on every backend: case-sensitive, and LIKE wildcards are literal
+        for query in ('DOC', 'pat_', 'pat%'):
+            self.assertEqual(self.client.get(self.url, {'q': query}).json()['count'], 0, query)
+
+    def test_cached_totals_follow_signups_and_deletes(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url).json()['count'], 7)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {'username': 'new', 'password': 'pw-12345', 'phone': '1',
+                                                   'category': 'patient'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.client.get(self.url, {'category': 'patient'}).json()['count'], 6)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse('admin-user-detail', args=[self.users[0].id]))
+        self.assertEqual(self.client.get(self.url).json()['count'], 7)
@@ -1,34 +1,59 @@
 from django.urls import path
+from .async_views import (
+    AsyncDoctorListView, AsyncDoctorSlotsPublicView, AsyncPatientAppointmentsView, AsyncDoctorAppointmentsView,
+    AsyncBillListView, SlotEventsView
+)
+from .metrics import MetricsView
+from .exports import AppointmentExportView, BillExportView, MedicalRecordExportView
 from .views import (
-    SignupView, LoginView, DoctorListView, PatientListView, AppointmentListView,
-    DoctorSlotsView, DoctorSlotsPublicView, AppointmentCreateView, AppointmentUpdateView,
-    AppointmentDeleteView, PatientAppointmentsView, DoctorAppointmentsView, FeedbackCreateView,
-    BillListView, BillPayView, MedicalRecordView, AdminStatsView,
-    UserManagementView, UserDetailView, DoctorProfileView, DoctorStatsView,
+    SignupView, LoginView, TokenRefreshView, LogoutView, DoctorListView, PatientListView, AppointmentListView,
+    DoctorSlotsView, DoctorSlotsBulkView, DoctorSlotsPublicView, SlotSearchView, AppointmentCreateView, AppointmentUpdateView,
+    AppointmentDeleteView, AppointmentBatchUpdateView, PatientAppointmentsView, DoctorAppointmentsView, FeedbackCreateView,
+    BillListView, BillPayView, MedicalRecordView, MedicalRecordSearchView, AdminStatsView,
+    UserManagementView, UserDetailView, UserImportView, UserImportStatusView, DoctorProfileView, DoctorStatsView,
     DoctorServedPatientsView
 )
 
 urlpatterns = [
     path('signup/', SignupView.as_view(), name='signup'),
     path('login/', LoginView.as_view() , name='login'),
+    path('token/refresh/', TokenRefreshView.as_view(), name='token-refresh'),
+    path('logout/', LogoutView.as_view(), name='logout'),
     path('doctors/', DoctorListView.as_view(), name='doctor-list'),
     path('doctor/<int:doctor_id>/', DoctorProfileView.as_view(), name='doctor-profile'),
     path('doctor/<int:doctor_id>/stats/', DoctorStatsView.as_view(), name='doctor-stats'),
     path('doctor/<int:doctor_id>/served-patients/', DoctorServedPatientsView.as_view(), name='served-patients'),
     path('patients/', PatientListView.as_view(), name='patient-list'),
     path('appointments/', AppointmentListView.as_view(), name='appointment-list'),
+    path('appointments/batch/', AppointmentBatchUpdateView.as_view(), name='appointment-batch'),
+    path('appointments/export/', AppointmentExportView.as_view(), name='appointment-export'),
     path('appointments/<int:appointment_id>/update/', AppointmentUpdateView.as_view(), name='appointment-update'),
     path('appointments/<int:appointment_id>/delete/', AppointmentDeleteView.as_view(), name='appointment-delete'),
     path('doctor/slots/', DoctorSlotsView.as_view(), name='doctor-slots'),
+    path('doctor/slots/bulk/', DoctorSlotsBulkView.as_view(), name='doctor-slots-bulk'),
     path('doctor/<int:doctor_id>/slots/', DoctorSlotsPublicView.as_view(), name='doctor-slots-public'),
+    path('doctor/<int:doctor_id>/slots/events/', SlotEventsView.as_view(), name='doctor-slot-events'),
+    path('slots/search/', SlotSearchView.as_view(), name='slot-search'),
     path('appointments/create/', AppointmentCreateView.as_view(), name='appointment-create'),
     path('patient/<int:patient_id>/appointments/', PatientAppointmentsView.as_view(), name='patient-appointments'),
     path('doctor/<int:doctor_id>/appointments/', DoctorAppointmentsView.as_view(), name='doctor-appointments'),
     path('feedback/', FeedbackCreateView.as_view(), name='feedback-create'),
     path('bills/', BillListView.as_view(), name='bill-list'),
     path('bills/<int:bill_id>/pay/', BillPayView.as_view(), name='bill-pay'),
+    path('bills/export/', BillExportView.as_view(), name='bill-export'),
     path('medical-records/', MedicalRecordView.as_view(), name='medical-record-list'),
+    path('medical-records/search/', MedicalRecordSearchView.as_view(), name='medical-record-search'),
+    path('medical-records/export/', MedicalRecordExportView.as_view(), name='medical-record-export'),
     path('admin/stats/', AdminStatsView.as_view(), name='admin-stats'),
     path('admin/users/', UserManagementView.as_view(), name='admin-user-list'),
     path('admin/users/<int:pk>/', UserDetailView.as_view(), name='admin-user-detail'),
+    path('admin/users/import/', UserImportView.as_view(), name='admin-user-import'),
+    path('admin/users/import/<int:job_id>/', UserImportStatusView.as_view(), name='admin-user-import-status'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    # Async read endpoints for ASGI deployments
+    path('async/doctors/', AsyncDoctorListView.as_view(), name='async-doctor-list'),
+    path('async/doctor/<int:doctor_id>/slots/', AsyncDoctorSlotsPublicView.as_view(), name='async-doctor-slots-public'),
+    path('async/patient/<int:patient_id>/appointments/', AsyncPatientAppointmentsView.as_view(), name='async-patient-appointments'),
+    path('async/doctor/<int:doctor_id>/appointments/', AsyncDoctorAppointmentsView.as_view(), name='async-doctor-appointments'),
+    path('async/bills/', AsyncBillListView.as_view(), name='async-bill-list'),
 ]
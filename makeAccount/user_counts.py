@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, Q
+
+from .cache_versions import bump_version, current_version
+from .models import User
+
+_VERSION_KEY = "user-counts:version"
+
+
+def invalidate_user_counts():
+    bump_version(_VERSION_KEY)
+
+
+def prefix_filter(field, prefix):
+    """Case-sensitive "starts with", in a form the backend can answer from an index."""
+    if connection.vendor == 'sqlite':
+        # A range rather than startswith: SQLite cannot use an index for LIKE ... ESCAPE.
+        # Equal to a prefix match because SQLite compares text bytewise
+        return Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix + '\U0010ffff'})
+    # Under a locale collation the range would not be a prefix match; LIKE is,
+    # and on PostgreSQL it uses the varchar_pattern_ops indexes of migration 0020
+    return Q(**{f'{field}__startswith': prefix})
+
+
+def compute_user_counts():
+    rows = User.objects.order_by().values_list('category').annotate(n=Count('id'))
+    counts = {category: 0 for category, _ in User.CATEGORY_CHOICES}
+    counts.update(rows)
+    return counts
+
+
+def user_counts():
+    """Users per category, cached until a user is added, removed or recategorised."""
+    timeout = getattr(settings, 'USER_COUNT_CACHE_TIMEOUT', None)
+    if not timeout:
+        return compute_user_counts()
+    key = f"user-counts:{current_version(_VERSION_KEY)}"
+    counts = cache.get(key)
+    if counts is None:
+        counts = compute_user_counts()
+        cache.set(key, counts, timeout)
+    return counts
@@ -0,0 +1,197 @@
+"""
+Bulk user import from CSV or NDJSON.
+
+Rows carry SignupSerializer's fields (username, password, phone, category,
+and gender/blood_group or specialty/fee for the profile); only patients
+and doctors are imported. The file is read
+as a stream and handled IMPORT_CHUNK_SIZE rows at a time. Each chunk is
+validated without per-row queries and its passwords are hashed in a
+process pool, since the deliberately slow hasher is most of the cost. The
+users, their Patient/Doctor profiles, the chunk's row errors and the job's
+checkpoint (ImportJob.rows_done) are then committed in one transaction.
+A job that stops part way resumes after the last committed chunk. Only
+one run of a job at a time: a run claims it, and a job still marked
+running is taken over only once it has not advanced for TASK_STALE_AFTER
+seconds.
+"""
+import csv
+import datetime
+import json
+import math
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import response_cache
+from .models import Doctor, ImportJob, ImportRowError, Patient, User, parse_fee
+from .serializers import ImportRowSerializer
+from .user_counts import invalidate_user_counts
+
+EXTENSIONS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+DUPLICATE_USERNAME = "A user with that username already exists."
+
+
+class JobBusy(Exception):
+    pass
+
+
+def guess_format(name):
+    return EXTENSIONS.get(os.path.splitext(name or '')[1].lower())
+
+
+def save_upload(chunks, fmt):
+    """Write an uploaded file under IMPORT_ROOT and create its job."""
+    root = Path(settings.IMPORT_ROOT)
+    root.mkdir(parents=True, exist_ok=True)
+    path = root / f"{uuid.uuid4().hex}.{fmt}"
+    with open(path, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+    return ImportJob.objects.create(source=str(path), format=fmt)
+
+
+def read_rows(f, fmt):
+    """Yield (row number, dict or error message) for every data row of a text stream."""
+    if fmt == 'csv':
+        yield from enumerate(csv.DictReader(f), 1)
+        return
+    number = 0
+    for line in f:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield number, "Invalid JSON"
+            continue
+        yield number, row if isinstance(row, dict) else "Expected a JSON object"
+
+
+def hash_passwords(passwords, pool=None, workers=1):
+    if pool is None:
+        return [make_password(password) for password in passwords]
+    return list(pool.map(make_password, passwords, chunksize=max(1, math.ceil(len(passwords) / (4 * workers)))))
+
+
+def row_error(job, number, raw, errors):
+    username = raw.get('username') if isinstance(raw, dict) else None
+    return ImportRowError(job=job, row=number, username=str(username or '')[:150], errors=errors)
+
+
+def import_chunk(job, chunk, seen, pool=None, workers=1):
+    """Validate, hash and insert one chunk, advancing the job's checkpoint. Returns (created, failed)."""
+    valid, errors = [], []
+    for number, raw in chunk:
+        if isinstance(raw, str):
+            errors.append(row_error(job, number, raw, {"non_field_errors": [raw]}))
+            continue
+        serializer = ImportRowSerializer(data=raw)
+        if not serializer.is_valid():
+            errors.append(row_error(job, number, raw, serializer.errors))
+        elif serializer.validated_data['username'] in seen:
+            errors.append(row_error(job, number, raw, {"username": ["Repeats an earlier row of this file."]}))
+        else:
+            seen.add(serializer.validated_data['username'])
+            valid.append((number, serializer.validated_data))
+    hashes = hash_passwords([data['password'] for _, data in valid], pool, workers)
+
+    with transaction.atomic():
+        taken = set(User.objects.filter(username__in=[data['username'] for _, data in valid])
+                    .values_list('username', flat=True))
+        users, profiles = [], []
+        for (number, data), password in zip(valid, hashes):
+            if data['username'] in taken:
+                errors.append(row_error(job, number, data, {"username": [DUPLICATE_USERNAME]}))
+                continue
+            users.append(User(username=data['username'], password=password, phone=data['phone'],
+                              category=data['category']))
+            profiles.append(data)
+        User.objects.bulk_create(users)
+
+        # Same defaults as SignupSerializer; bulk_create skips Doctor.save(), so parse the fee here
+        patients, doctors = [], []
+        for user, data in zip(users, profiles):
+            if user.category == 'patient':
+                patients.append(Patient(user=user, gender=data.get('gender') or "Other",
+                                        blood_group=data.get('blood_group') or "N/A"))
+            elif user.category == 'doctor':
+                fee = data.get('fee') or "PKR 2000"
+                amount, currency = parse_fee(fee)
+                doctors.append(Doctor(user=user, specialty=data.get('specialty') or "General", fee=fee,
+                                      fee_amount=amount, fee_currency=currency))
+        Patient.objects.bulk_create(patients)
+        Doctor.objects.bulk_create(doctors)
+
+        ImportRowError.objects.bulk_create(sorted(errors, key=lambda e: e.row))
+        ImportJob.objects.filter(id=job.id).update(
+            rows_done=F('rows_done') + len(chunk),
+            created_count=F('created_count') + len(users),
+            failed_count=F('failed_count') + len(errors),
+            updated_at=timezone.now(),
+        )
+        if users:
+            transaction.on_commit(invalidate_user_counts)
+    return len(users), len(errors)
+
+
+def claim(job):
+    """Mark `job` running for this run; False if it is done or another run is still advancing it."""
+    now = timezone.now()
+    stale = now - datetime.timedelta(seconds=settings.TASK_STALE_AFTER)
+    runnable = Q(status__in=('queued', 'failed')) | Q(status='running', updated_at__lt=stale)
+    return bool(ImportJob.objects.filter(runnable, id=job.id).update(status='running', last_error='', updated_at=now))
+
+
+def run(job, workers=None, chunk_size=None, on_chunk=None):
+    """
+    Import `job` from its checkpoint to the end of its file, with `workers`
+    hashing processes (IMPORT_WORKERS, else one per CPU). Returns the
+    refreshed job; on error it is marked failed and can be run again.
+    Raises JobBusy when the job cannot be claimed.
+    """
+    workers = workers or settings.IMPORT_WORKERS or os.cpu_count() or 1
+    chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+    if not claim(job):
+        job.refresh_from_db()
+        raise JobBusy(f"Import job {job.id} is {job.status}")
+    job.refresh_from_db()
+
+    pool = None
+    if workers > 1:
+        # spawn rather than fork: run_workers calls this from a thread. The
+        # workers only need settings, so nothing from this app is imported there
+        pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=django.setup)
+    seen = set()
+    try:
+        with open(job.source, newline='', encoding='utf-8-sig') as f:
+            rows = islice(read_rows(f, job.format), job.rows_done, None)
+            while chunk := list(islice(rows, chunk_size)):
+                import_chunk(job, chunk, seen, pool, workers)
+                if on_chunk:
+                    job.refresh_from_db()
+                    on_chunk(job)
+    except BaseException as e:
+        # Interrupts too, so the job can be resumed at once
+        ImportJob.objects.filter(id=job.id).update(status='failed', last_error=str(e) or type(e).__name__)
+        raise
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+        # bulk_create sends no signals, so the cached lists are not invalidated by it
+        response_cache.invalidate("doctors", "patients")
+
+    ImportJob.objects.filter(id=job.id).update(status='done', finished_at=timezone.now())
+    job.refresh_from_db()
+    return job
@@ -1,16 +1,51 @@
+import datetime
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.utils.urls import replace_query_param
+from django.conf import settings
 from django.contrib.auth import authenticate
-from django.db.models import Count
-from .models import User, Doctor, Patient, Appointment, Bill, MedicalRecord, Feedback, DoctorSlot
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from .models import User, Doctor, Patient, Appointment, Bill, MedicalRecord, Feedback, DoctorSlot, ArchivedAppointment, ArchivedBill, ImportJob, parse_fee
 from .serializers import (
     SignupSerializer, UserSerializer, DoctorSerializer, PatientSerializer,
-    AppointmentSerializer, BillSerializer, MedicalRecordSerializer, FeedbackSerializer
+    AppointmentSerializer, BillSerializer, MedicalRecordSerializer, FeedbackSerializer,
+    SlotRuleSerializer, SlotSearchSerializer, DoctorFilterSerializer, AppointmentBatchSerializer, RecordSearchSerializer,
+    AdminStatsSerializer, sparse_fields
 )
+from .authentication import issue_tokens, profile_ids, refresh_tokens, revoke_session
+from .pagination import AppointmentPagination, ImportErrorPagination, MedicalRecordPagination, UserPagination
+from .response_cache import CachedResponseMixin
+from . import ledger, response_cache, search, slot_calendar, tasks, user_import
+from .stats import doctor_stats, invalidate_doctor_stats
+from .user_counts import prefix_filter, user_counts
+from .services import SlotUnavailable, batch_update_status, book_appointment, release_slot, generate_slots, pay_bill, search_available_slots
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 
+def include_archived(request):
+    return request.GET.get("include_archived", "").lower() in ("1", "true", "yes")
+
+def appointment_querysets(request, appointments, archived):
+    # ?include_archived=1 merges in appointments moved out by makeAccount.retention
+    querysets = [appointments, archived] if include_archived(request) else [appointments]
+    for i, queryset in enumerate(querysets):
+        querysets[i], sparse = sparse_fields(
+            request, AppointmentSerializer, queryset.select_related('doctor__user'), required=('date', 'time')
+        )
+    return querysets, sparse
+
+def paginated_appointments(view, request, appointments, archived):
+    paginator = AppointmentPagination()
+    querysets, sparse = appointment_querysets(request, appointments, archived)
+    page = paginator.paginate_querysets(querysets, request, view=view)
+    serializer = AppointmentSerializer(page, many=True, **sparse)
+    return paginator.get_paginated_response(serializer.data)
+
 @method_decorator(csrf_exempt, name='dispatch')
 class SignupView(APIView):
     def post(self, request):
@@ -22,6 +57,8 @@ class SignupView(APIView):
 
 @method_decorator(csrf_exempt, name='dispatch')
 class LoginView(APIView):
+    authentication_classes = []
+
     def post(self, request):
         username = request.data.get("username")
         password = request.data.get("password")
@@ -31,36 +68,76 @@ class LoginView(APIView):
         if user is None:
             return Response({"error": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
         
-        extra_info = {}
-        if user.category == "patient":
-            try:
-                extra_info["patient_id"] = user.patient_profile.id
-            except: pass
-        elif user.category == "doctor":
-            try:
-                extra_info["doctor_id"] = user.doctor_profile.id
-            except: pass
-
         return Response({
             "username": user.username,
             "role": user.category.lower(),
-            "token": "dummy-token",
+            **issue_tokens(user),
             "user_id": user.id,
-            **extra_info
+            **profile_ids(user)
         }, status=status.HTTP_200_OK)
 
-class DoctorListView(APIView):
+@method_decorator(csrf_exempt, name='dispatch')
+class TokenRefreshView(APIView):
+    authentication_classes = []
+
+    def post(self, request):
+        refresh = request.data.get("refresh")
+        if not refresh:
+            return Response({"error": "Refresh token required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            return Response(refresh_tokens(refresh))
+        except AuthenticationFailed as e:
+            return Response({"error": e.detail}, status=status.HTTP_401_UNAUTHORIZED)
+
+@method_decorator(csrf_exempt, name='dispatch')
+class LogoutView(APIView):
+    authentication_classes = []
+
+    def post(self, request):
+        refresh = request.data.get("refresh")
+        if not refresh:
+            return Response({"error": "Refresh token required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            revoke_session(refresh)
+        except AuthenticationFailed as e:
+            return Response({"error": e.detail}, status=status.HTTP_401_UNAUTHORIZED)
+        return Response({"message": "Logged out"})
+
+DOCTOR_ORDERING = {'id': ('id',), 'fee': ('fee_amount', 'id'), '-fee': ('-fee_amount', 'id')}
+
+def doctor_queryset(request, params):
+    """The doctor list for DoctorFilterSerializer's validated `params`, with ?fields= applied."""
+    doctors = slot_calendar.with_availability(Doctor.objects.select_related('user')).order_by(*DOCTOR_ORDERING[params['ordering']])
+    if params.get('specialty'):
+        doctors = doctors.filter(specialty__iexact=params['specialty'])
+    if params.get('min_fee') is not None:
+        doctors = doctors.filter(fee_amount__gte=params['min_fee'])
+    if params.get('max_fee') is not None:
+        doctors = doctors.filter(fee_amount__lte=params['max_fee'])
+    return sparse_fields(request, DoctorSerializer, doctors)
+
+class DoctorListView(CachedResponseMixin, APIView):
+    def cache_tags(self, request):
+        return ["doctors"]
+
     def get(self, request):
-        doctors = Doctor.objects.all()
-        serializer = DoctorSerializer(doctors, many=True)
+        filters = DoctorFilterSerializer(data=request.GET)
+        if not filters.is_valid():
+            return Response(filters.errors, status=400)
+        doctors, sparse = doctor_queryset(request, filters.validated_data)
+        serializer = DoctorSerializer(doctors, many=True, **sparse)
         return Response(serializer.data)
 
 @method_decorator(csrf_exempt, name='dispatch')
-class DoctorProfileView(APIView):
+class DoctorProfileView(CachedResponseMixin, APIView):
+    def cache_tags(self, request, doctor_id):
+        return [f"doctor:{doctor_id}"]
+
     def get(self, request, doctor_id):
+        doctors, sparse = sparse_fields(request, DoctorSerializer, slot_calendar.with_availability(Doctor.objects.select_related('user')))
         try:
-            doctor = Doctor.objects.get(id=doctor_id)
-            serializer = DoctorSerializer(doctor)
+            doctor = doctors.get(id=doctor_id)
+            serializer = DoctorSerializer(doctor, **sparse)
             return Response(serializer.data)
         except Doctor.DoesNotExist:
             return Response({"error": "Doctor not found"}, status=404)
@@ -71,6 +148,10 @@ class DoctorProfileView(APIView):
             if 'specialty' in request.data:
                 doctor.specialty = request.data['specialty']
             if 'fee' in request.data:
+                try:
+                    parse_fee(request.data['fee'])
+                except ValueError as e:
+                    return Response({"error": str(e)}, status=400)
                 doctor.fee = request.data['fee']
             if 'username' in request.data:
                 doctor.user.username = request.data['username']
@@ -85,27 +166,29 @@ class DoctorProfileView(APIView):
         except Doctor.DoesNotExist:
             return Response({"error": "Doctor not found"}, status=404)
 
-class PatientListView(APIView):
+class PatientListView(CachedResponseMixin, APIView):
+    def cache_tags(self, request):
+        return ["patients"]
+
     def get(self, request):
-        patients = Patient.objects.all()
-        serializer = PatientSerializer(patients, many=True)
+        patients, sparse = sparse_fields(request, PatientSerializer, Patient.objects.select_related('user'))
+        serializer = PatientSerializer(patients, many=True, **sparse)
         return Response(serializer.data)
 
 class DoctorServedPatientsView(APIView):
     def get(self, request, doctor_id):
-        patient_ids = Appointment.objects.filter(
-            doctor_id=doctor_id, 
-            status='completed'
-        ).values_list('patient_id', flat=True).distinct()
-        patients = Patient.objects.filter(user_id__in=patient_ids)
-        serializer = PatientSerializer(patients, many=True)
+        served = [
+            model.objects.filter(doctor_id=doctor_id, status='completed').values_list('patient_id', flat=True)
+            for model in (Appointment, ArchivedAppointment)
+        ]
+        patients = Patient.objects.filter(Q(user_id__in=served[0]) | Q(user_id__in=served[1])).select_related('user')
+        patients, sparse = sparse_fields(request, PatientSerializer, patients)
+        serializer = PatientSerializer(patients, many=True, **sparse)
         return Response(serializer.data)
 
 class AppointmentListView(APIView):
     def get(self, request):
-        appointments = Appointment.objects.all().order_by('-date', '-time')
-        serializer = AppointmentSerializer(appointments, many=True)
-        return Response(serializer.data)
+        return paginated_appointments(self, request, Appointment.objects.all(), ArchivedAppointment.objects.all())
 
 @method_decorator(csrf_exempt, name='dispatch')
 class AppointmentDeleteView(APIView):
@@ -114,18 +197,10 @@ class AppointmentDeleteView(APIView):
             appointment = Appointment.objects.get(id=appointment_id)
             
             # Reset the slot if it exists
-            try:
-                slot = DoctorSlot.objects.get(
-                    doctor=appointment.doctor,
-                    date=appointment.date,
-                    time=appointment.time
-                )
-                slot.is_booked = False
-                slot.save()
-            except DoctorSlot.DoesNotExist:
-                pass
+            release_slot(appointment.doctor_id, appointment.date, appointment.time)
 
             appointment.delete()
+            invalidate_doctor_stats(appointment.doctor_id)
             return Response({"message": "Appointment deleted successfully"}, status=200)
         except Appointment.DoesNotExist:
             return Response({"error": "Appointment not found"}, status=404)
@@ -169,63 +244,85 @@ class DoctorSlotsView(APIView):
                 date=slot_data["date"],
                 time=slot_data["time"]
             )
+            slot_calendar.refresh_day(doctor.id, slot.date)
             return Response({"slot": {"id": slot.id, "date": str(slot.date), "time": str(slot.time), "is_booked": slot.is_booked}})
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-class DoctorSlotsPublicView(APIView):
+@method_decorator(csrf_exempt, name='dispatch')
+class DoctorSlotsBulkView(APIView):
+    def post(self, request):
+        rules = request.data.get("schedules") if "schedules" in request.data else [request.data]
+        if not isinstance(rules, list):
+            return Response({"error": "schedules must be a list"}, status=400)
+        serializer = SlotRuleSerializer(data=rules, many=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+
+        results = []
+        for rule in serializer.validated_data:
+            created, skipped = generate_slots(rule)
+            results.append({"created": created, "skipped": skipped})
+        return Response({
+            "created": sum(r["created"] for r in results),
+            "skipped": sum(r["skipped"] for r in results),
+            "schedules": results
+        }, status=status.HTTP_201_CREATED)
+
+class DoctorSlotsPublicView(CachedResponseMixin, APIView):
+    def cache_tags(self, request, doctor_id):
+        # doctor_id may name the doctor or its user
+        return [f"doctor:{doctor_id}", f"user:{doctor_id}"]
+
     def get(self, request, doctor_id):
-        try:
-            try:
-                 doctor = User.objects.get(id=doctor_id).doctor_profile
-            except:
-                 doctor = Doctor.objects.get(id=doctor_id)
-            
-            slots = DoctorSlot.objects.filter(doctor=doctor, is_booked=False)
-            return Response({
-                "slots": [{"date": str(s.date), "time": str(s.time)} for s in slots],
-                "fee": doctor.fee,
-                "specialty": doctor.specialty
-            })
-        except:
+        # doctor_id may be a user id or a doctor id; a user match wins, as before
+        doctors = sorted(
+            Doctor.objects.filter(Q(user_id=doctor_id) | Q(id=doctor_id)),
+            key=lambda d: d.user_id != doctor_id
+        )
+        if not doctors:
             return Response({"error": "Doctor not found"}, status=404)
+        doctor = doctors[0]
+
+        today = timezone.localdate()
+        slots = DoctorSlot.objects.filter(doctor=doctor, is_booked=False, date__gte=today).exclude(
+            date=today, time__lt=timezone.localtime().time()
+        ).order_by('date', 'time')
+        return Response({
+            "slots": [{"date": str(s.date), "time": str(s.time)} for s in slots],
+            "fee": doctor.fee,
+            "fee_amount": doctor.fee_amount,
+            "specialty": doctor.specialty
+        })
+
+class SlotSearchView(APIView):
+    def get(self, request):
+        serializer = SlotSearchSerializer(data=request.GET)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+        slots = search_available_slots(serializer.validated_data)
+        return Response({"slots": [{
+            "id": s.id,
+            "doctor_id": s.doctor_id,
+            "doctor_name": s.doctor.user.username,
+            "specialty": s.doctor.specialty,
+            "fee": s.doctor.fee,
+            "fee_amount": s.doctor.fee_amount,
+            "date": str(s.date),
+            "time": str(s.time)
+        } for s in slots]})
 
 @method_decorator(csrf_exempt, name='dispatch')
 class AppointmentCreateView(APIView):
     def post(self, request):
-        doctor_id = request.data.get("doctor")
-        date_str = request.data.get("date")
-        time_str = request.data.get("time")
-
-        try:
-            slot = DoctorSlot.objects.get(doctor_id=doctor_id, date=date_str, time=time_str)
-            if slot.is_booked:
-                return Response({"error": "This slot is already booked"}, status=400)
-        except DoctorSlot.DoesNotExist:
-            pass 
-
         serializer = AppointmentSerializer(data=request.data)
-        if serializer.is_valid():
-            appointment = serializer.save()
-            
-            try:
-                slot = DoctorSlot.objects.get(doctor_id=doctor_id, date=date_str, time=time_str)
-                slot.is_booked = True
-                slot.save()
-            except DoctorSlot.DoesNotExist:
-                pass
-
-            try:
-                fee_val = 2000
-                import re
-                match = re.search(r'\d+', appointment.doctor.fee)
-                if match:
-                    fee_val = float(match.group())
-                Bill.objects.create(appointment=appointment, amount=fee_val)
-            except:
-                Bill.objects.create(appointment=appointment, amount=2000)
-            return Response({"message": "Appointment booked successfully", "appointment": serializer.data}, status=201)
-        return Response(serializer.errors, status=400)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+        try:
+            appointment = book_appointment(**serializer.validated_data)
+        except SlotUnavailable as e:
+            return Response({"error": str(e)}, status=400)
+        return Response({"message": "Appointment booked successfully", "appointment": AppointmentSerializer(appointment).data}, status=201)
 
 @method_decorator(csrf_exempt, name='dispatch')
 class AppointmentUpdateView(APIView):
@@ -237,45 +334,49 @@ class AppointmentUpdateView(APIView):
                 old_status = appointment.status
                 appointment.status = status_val
                 appointment.save()
+                invalidate_doctor_stats(appointment.doctor_id)
 
                 if status_val == "cancelled" and old_status != "cancelled":
-                    try:
-                        slot = DoctorSlot.objects.get(
-                            doctor=appointment.doctor, 
-                            date=appointment.date, 
-                            time=appointment.time
-                        )
-                        slot.is_booked = False
-                        slot.save()
-                    except DoctorSlot.DoesNotExist:
-                        pass
+                    release_slot(appointment.doctor_id, appointment.date, appointment.time)
 
                 return Response({"message": f"Appointment marked as {status_val}"})
             return Response({"error": "Status required"}, status=400)
         except Appointment.DoesNotExist:
             return Response({"error": "Appointment not found"}, status=404)
 
+@method_decorator(csrf_exempt, name='dispatch')
+class AppointmentBatchUpdateView(APIView):
+    def post(self, request):
+        serializer = AppointmentBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+        results = batch_update_status(**serializer.validated_data)
+        return Response({
+            "updated": sum(r["result"] == "updated" for r in results),
+            "results": results
+        })
+
 class PatientAppointmentsView(APIView):
     def get(self, request, patient_id):
-        appointments = Appointment.objects.filter(patient_id=patient_id).order_by('-date', '-time')
-        serializer = AppointmentSerializer(appointments, many=True)
-        return Response(serializer.data)
+        return paginated_appointments(self, request, Appointment.objects.filter(patient_id=patient_id),
+                                      ArchivedAppointment.objects.filter(patient_id=patient_id))
 
 class DoctorAppointmentsView(APIView):
     def get(self, request, doctor_id):
-        appointments = Appointment.objects.filter(doctor_id=doctor_id).order_by('-date', '-time')
-        serializer = AppointmentSerializer(appointments, many=True)
-        return Response(serializer.data)
+        return paginated_appointments(self, request, Appointment.objects.filter(doctor_id=doctor_id),
+                                      ArchivedAppointment.objects.filter(doctor_id=doctor_id))
 
 class DoctorStatsView(APIView):
     def get(self, request, doctor_id):
-        appointments = Appointment.objects.filter(doctor_id=doctor_id)
-        return Response({
-            "total_appointments": appointments.count(),
-            "completed_appointments": appointments.filter(status='completed').count(),
-            "pending_appointments": appointments.filter(status='confirmed').count(),
-            "total_patients": Appointment.objects.filter(doctor_id=doctor_id, status='completed').values('patient').distinct().count()
-        })
+        start = request.GET.get("start")
+        end = request.GET.get("end")
+        try:
+            for value in (start, end):
+                if value:
+                    datetime.date.fromisoformat(value)
+        except ValueError:
+            return Response({"error": "start and end must be YYYY-MM-DD dates"}, status=400)
+        return Response(doctor_stats(doctor_id, start, end))
 
 @method_decorator(csrf_exempt, name='dispatch')
 class FeedbackCreateView(APIView):
@@ -287,40 +388,62 @@ class FeedbackCreateView(APIView):
         Feedback.objects.create(patient_id=patient_id, content=content)
         return Response({"message": "Feedback submitted"})
 
-class BillListView(APIView):
-    def get(self, request):
-        patient_id = request.GET.get("patient_id")
+def bill_querysets(request):
+    """A patient's bills, or all of them newest first, per ?include_archived= and ?fields=."""
+    patient_id = request.GET.get("patient_id")
+    tables = (Bill, ArchivedBill) if include_archived(request) else (Bill,)
+    querysets = []
+    for model in tables:
+        bills = model.objects.select_related('appointment__doctor__user')
         if patient_id:
-            bills = Bill.objects.filter(appointment__patient_id=patient_id)
+            bills = bills.filter(appointment__patient_id=patient_id)
         else:
-            bills = Bill.objects.all().order_by('-created_at')
-        serializer = BillSerializer(bills, many=True)
+            bills = bills.order_by('-created_at')
+        bills, sparse = sparse_fields(request, BillSerializer, bills, required=('created_at',))
+        querysets.append(bills)
+    return querysets, sparse
+
+def merge_bills(querysets, found):
+    if len(querysets) > 1:
+        found.sort(key=lambda bill: bill.created_at, reverse=True)
+    return found
+
+class BillListView(APIView):
+    def get(self, request):
+        querysets, sparse = bill_querysets(request)
+        found = merge_bills(querysets, [bill for bills in querysets for bill in bills])
+        serializer = BillSerializer(found, many=True, **sparse)
         return Response(serializer.data)
 
 @method_decorator(csrf_exempt, name='dispatch')
 class BillPayView(APIView):
     def put(self, request, bill_id):
         try:
-            bill = Bill.objects.get(id=bill_id)
-            bill.status = 'paid'
-            bill.save()
+            pay_bill(bill_id)
             return Response({"message": "Paid successfully"})
         except Bill.DoesNotExist:
             return Response({"error": "Bill not found"}, status=404)
 
 class MedicalRecordView(APIView):
     def get(self, request):
-        patient_id = request.GET.get("patient_id")
-        if patient_id:
-            try:
-                 records = MedicalRecord.objects.filter(patient__id=patient_id).order_by('-date')
-            except:
-                 records = MedicalRecord.objects.filter(patient__user_id=patient_id).order_by('-date')
-        else:
-            records = MedicalRecord.objects.all().order_by('-date')
-        serializer = MedicalRecordSerializer(records, many=True)
-        return Response(serializer.data)
-    
+        # ?patient_id= is a Patient id, ?user_id= the patient's User id
+        records = MedicalRecord.objects.all()
+        for param, lookup in (("patient_id", "patient_id"), ("user_id", "patient__user_id")):
+            value = request.GET.get(param)
+            if value:
+                if not value.isdigit():
+                    return Response({"error": f"{param} must be an integer"}, status=400)
+                records = records.filter(**{lookup: value})
+
+        # ?fields= leaves out the large notes/tests columns unless it names them
+        records, sparse = sparse_fields(
+            request, MedicalRecordSerializer, records.select_related('doctor__user'), required=('date',)
+        )
+        paginator = MedicalRecordPagination()
+        page = paginator.paginate_queryset(records, request, view=self)
+        serializer = MedicalRecordSerializer(page, many=True, **sparse)
+        return paginator.get_paginated_response(serializer.data)
+
     def post(self, request):
         serializer = MedicalRecordSerializer(data=request.data)
         if serializer.is_valid():
@@ -328,21 +451,68 @@ class MedicalRecordView(APIView):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class MedicalRecordSearchView(APIView):
+    def get(self, request):
+        serializer = RecordSearchSerializer(data=request.GET)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+        params = serializer.validated_data
+        page_size = min(params.get('page_size') or settings.API_PAGE_SIZE, settings.API_MAX_PAGE_SIZE)
+        hits = search.search_records(
+            params['q'], params.get('patient_id'), params.get('doctor_id'),
+            offset=(params['page'] - 1) * page_size, limit=page_size
+        )
+        results = [{**MedicalRecordSerializer(record).data, "rank": rank} for record, rank in hits[:page_size]]
+        next_url = None
+        if len(hits) > page_size:
+            next_url = replace_query_param(request.build_absolute_uri(), 'page', params['page'] + 1)
+        return Response({"next": next_url, "results": results})
+
 class AdminStatsView(APIView):
     def get(self, request):
+        serializer = AdminStatsSerializer(data=request.GET)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+        params = serializer.validated_data
+        period, doctor_id = params['period'], params.get('doctor_id')
+        revenue = ledger.totals(doctor_id)
         return Response({
             "total_users": User.objects.count(),
             "total_doctors": Doctor.objects.count(),
             "total_patients": Patient.objects.count(),
-            "total_appointments": Appointment.objects.count(),
-            "total_revenue": sum(float(b.amount) for b in Bill.objects.filter(status='paid'))
+            "total_appointments": Appointment.objects.count() + ArchivedAppointment.objects.count(),
+            "total_revenue": revenue["paid_amount"],
+            "revenue": {
+                **revenue,
+                "outstanding_amount": revenue["billed_amount"] - revenue["paid_amount"],
+                "series": ledger.series(period, params.get("start"), params.get("end"), doctor_id),
+                "by_doctor": ledger.by_doctor() if doctor_id is None else [],
+            },
+            "response_cache": response_cache.stats()
         })
 
 class UserManagementView(APIView):
     def get(self, request):
-        users = User.objects.all().order_by('-id')
-        serializer = UserSerializer(users, many=True)
-        return Response(serializer.data)
+        # ?category= keeps one role; ?q= matches the start of the username or phone (case-sensitive)
+        users = User.objects.all()
+        category = request.GET.get("category")
+        if category:
+            if category not in dict(User.CATEGORY_CHOICES):
+                return Response({"error": "category must be 'patient', 'doctor' or 'admin'"}, status=400)
+            users = users.filter(category=category)
+        query = request.GET.get("q", "").strip()
+        if query:
+            users = users.filter(prefix_filter('username', query) | prefix_filter('phone', query))
+            total = users.count()
+        else:
+            counts = user_counts()
+            total = counts[category] if category else sum(counts.values())
+
+        users, sparse = sparse_fields(request, UserSerializer, users)
+        paginator = UserPagination()
+        page = paginator.paginate_queryset(users, request, view=self)
+        serializer = UserSerializer(page, many=True, **sparse)
+        return Response({"count": total, **paginator.get_paginated_data(serializer.data)})
     
     def post(self, request):
         serializer = SignupSerializer(data=request.data)
@@ -371,3 +541,40 @@ class UserDetailView(APIView):
         except User.DoesNotExist:
              return Response(status=404)
 
+@method_decorator(csrf_exempt, name='dispatch')
+class UserImportView(APIView):
+    def post(self, request):
+        upload = request.FILES.get("file")
+        if upload is None:
+            return Response({"error": "Upload the rows as 'file'"}, status=400)
+        if upload.size > settings.IMPORT_MAX_UPLOAD_SIZE:
+            return Response({"error": f"Uploads are limited to {settings.IMPORT_MAX_UPLOAD_SIZE} bytes"}, status=413)
+        fmt = request.data.get("format") or user_import.guess_format(upload.name)
+        if fmt not in dict(ImportJob.FORMAT_CHOICES):
+            return Response({"error": "format must be 'csv' or 'ndjson'"}, status=400)
+        # Hashing thousands of passwords does not fit in a request; a worker runs the import
+        with transaction.atomic():
+            job = user_import.save_upload(upload.chunks(), fmt)
+            tasks.enqueue('users.import', {'job_id': job.id}, key=f'import:{job.id}')
+        return Response({"job_id": job.id, "status": job.status}, status=202)
+
+class UserImportStatusView(APIView):
+    def get(self, request, job_id):
+        job = ImportJob.objects.filter(id=job_id).first()
+        if job is None:
+            return Response({"error": "Import job not found"}, status=404)
+        paginator = ImportErrorPagination()
+        page = paginator.paginate_queryset(job.row_errors.all(), request, view=self)
+        return Response({
+            "job_id": job.id,
+            "status": job.status,
+            "rows_done": job.rows_done,
+            "created": job.created_count,
+            "rejected": job.failed_count,
+            "last_error": job.last_error,
+            "finished_at": job.finished_at,
+            "errors": paginator.get_paginated_data(
+                [{"row": e.row, "username": e.username, "errors": e.errors} for e in page]
+            ),
+        })
+